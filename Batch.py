@@ -0,0 +1,218 @@
+import csv
+import json
+import os
+import random
+import sys
+from concurrent.futures import ProcessPoolExecutor
+from functools import partial
+from cryptography.fernet import Fernet
+from Encoding import Encoding
+from Decoding import Decoding
+import Metrics
+from ImageCache import is_lossless, load_image
+from PngStream import read_png_shape
+
+INTEGER_FIELDS = ('start_row', 'start_col', 'density')  # manifest fields holding a non-negative integer
+
+
+def load_manifest(manifest_path):
+    """
+    Reads a batch manifest. Each entry describes one image and may hold the keys 'image', 'message',
+    'message_file', 'payload_file', 'output_file', 'key', 'start_row', 'start_col', 'density', 'scatter' and
+    'compression'. Entries with a bad start position or density are kept, with the reason under 'error', so they
+    fail on their own instead of stopping the batch.
+
+    Parameters:
+        manifest_path (str): Path of a CSV file with a header row, or of a JSONL file with one object per line.
+
+    Returns:
+        list: The manifest entries as dictionaries.
+    """
+    with open(manifest_path, newline='', encoding='utf-8') as manifest:
+        if manifest_path.lower().endswith(('.jsonl', '.json')):
+            items = [json.loads(line) for line in manifest if line.strip()]
+        else:
+            items = [dict(row) for row in csv.DictReader(manifest)]
+    for item in items:
+        for name in INTEGER_FIELDS:
+            value = item.get(name)
+            if value not in (None, '') and not str(value).isdigit():  # negative numbers, fractions and text
+                item['error'] = f"Error: '{name}' must be a non-negative integer, not {value!r}."
+                break
+    return items
+
+
+def directory_items(directory, **defaults):
+    """
+    Builds batch entries for every image in a directory, in the formats carriers are written in.
+
+    Parameters:
+        directory (str): The directory to list.
+        **defaults: Values shared by every entry, such as 'message', 'message_file' or 'key'.
+
+    Returns:
+        list: One entry per image, in name order.
+    """
+    names = sorted(name for name in os.listdir(directory) if is_lossless(name))
+    return [dict(defaults, image=os.path.join(directory, name)) for name in names]
+
+
+def encode_item(item, stream=False, profile=False, threads=1):
+    """
+    Encodes one manifest entry. Runs in a worker process, so it never raises and always returns a result record.
+
+    Parameters:
+        item (dict): The manifest entry.
+        stream (bool): Whether to read and write the image a band of rows at a time (see Encoding.stream_encoder).
+        profile (bool): Whether to add the per-stage metrics of the encoder to the record.
+        threads (int): Number of threads each image is read, encoded and written on (see Encoding.embed_bands).
+
+    Returns:
+        dict: The result record written to the JSONL output.
+    """
+    path = item.get('image', '')
+    record = {'image': path}
+    if 'error' in item:
+        return dict(record, status='error', message=item['error'])
+    if profile:
+        Metrics.trace_memory()
+    try:
+        if item.get('message_file') and not item.get('payload_file'):
+            with open(item['message_file'], encoding='utf-8') as message_file:
+                text = message_file.read()
+        else:
+            text = item.get('message') or ''
+        key = item.get('key') or Fernet.generate_key().decode()  # Generate Fernet key if none provided
+        Fernet(key)  # Validate key format
+        img = None if stream else load_image(path, threads)
+        if img is None and not stream:
+            return dict(record, status='error', message="Error: File not found or not a readable image.")
+        height, width = read_png_shape(path)[:2] if stream else img.shape[:2]
+        start_row = int(item['start_row']) if item.get('start_row') not in (None, '') else random.randint(5, height - 1)
+        start_col = int(item['start_col']) if item.get('start_col') not in (None, '') else random.randint(0, width - 1)
+        density = int(item.get('density') or 1)
+        scatter = str(item.get('scatter') or '').lower() in ('1', 'true', 'yes')
+        encoder = Encoding(path, text, key, start_row, start_col, image=img, density=density, scatter=scatter,
+                           compression=item.get('compression') or None, threads=threads)
+        if item.get('payload_file'):
+            result, encoded_image_path = encoder.file_encoder(item['payload_file'])
+        else:
+            result, encoded_image_path = encoder.stream_encoder() if stream else encoder.encoder()
+    except Exception as error:  # a bad entry must not stop the rest of the batch
+        return dict(record, status='error', message=f"Error: {error}")
+    if profile and encoder.metrics:
+        record['metrics'] = encoder.metrics.as_dict()
+    if "Error" in result:
+        return dict(record, status='error', message=result)
+    return dict(record, status='ok', message=result, output=encoded_image_path, key=key)
+
+
+def decode_item(item, profile=False, threads=1):
+    """
+    Decodes one manifest entry. Runs in a worker process, so it never raises and always returns a result record.
+
+    Parameters:
+        item (dict): The manifest entry.
+        profile (bool): Whether to add the per-stage metrics of the decoder to the record.
+        threads (int): Number of threads each image is read and decoded on (see Decoding.extract_bands).
+
+    Returns:
+        dict: The result record written to the JSONL output.
+    """
+    path = item.get('image', '')
+    record = {'image': path}
+    if 'error' in item:
+        return dict(record, status='error', message=item['error'])
+    if profile:
+        Metrics.trace_memory()
+    try:
+        Fernet(item.get('key') or '')  # Validate key format
+        decoder = Decoding(path, item['key'], threads=threads)
+        if item.get('output_file'):
+            result, output_path = decoder.file_decoder(item['output_file'])
+            if output_path is None:
+                return dict(record, status='error', message=result)
+            return dict(record, status='ok', message=result, output=output_path)
+        result, decoded_text = decoder.decoder()
+    except Exception as error:  # a bad entry must not stop the rest of the batch
+        return dict(record, status='error', message=f"Error: {error}")
+    if profile and decoder.metrics:
+        record['metrics'] = decoder.metrics.as_dict()
+    if decoded_text is None:
+        return dict(record, status='error', message=result)
+    return dict(record, status='ok', message=result, text=decoded_text)
+
+
+def run_batch(items, worker, workers=None, output_path=None):
+    """
+    Runs a worker function over the batch entries on a process pool and writes one JSONL record per entry, in
+    manifest order.
+
+    Parameters:
+        items (list): The manifest entries.
+        worker (callable): encode_item or decode_item.
+        workers (int): Number of worker processes, or None for one per CPU.
+        output_path (str): Path of the JSONL output file, or None to write to standard output.
+
+    Returns:
+        int: The number of entries that failed.
+    """
+    failures = 0
+    output = open(output_path, 'w', encoding='utf-8') if output_path else sys.stdout
+    try:
+        with ProcessPoolExecutor(max_workers=workers) as executor:
+            chunksize = max(1, len(items) // (4 * (workers or os.cpu_count() or 1)))
+            for record in executor.map(worker, items, chunksize=chunksize):
+                failures += record['status'] != 'ok'
+                if 'metrics' in record and Metrics.recording:
+                    Metrics.recorded.append(record['metrics'])
+                output.write(json.dumps(record) + '\n')
+                output.flush()
+    finally:
+        if output is not sys.stdout:
+            output.close()
+    return failures
+
+
+def batch_encode(args):
+    """
+    Entry point for the 'batch-encode' subcommand.
+
+    Parameters:
+        args (argparse.Namespace): The parsed command line arguments.
+
+    Returns:
+        int: The process exit code.
+    """
+    if os.path.isdir(args.source):
+        items = directory_items(args.source, message=args.message, message_file=args.message_file,
+                                payload_file=args.payload_file, key=args.key, density=args.density,
+                                scatter=args.scatter, compression=args.compress)
+        items = [item for item in items
+                 if not os.path.splitext(item['image'])[0].endswith('_encoded')]  # skip earlier outputs
+    else:
+        items = load_manifest(args.source)
+    worker = partial(encode_item, stream=args.stream, profile=Metrics.recording, threads=args.threads)
+    return 1 if run_batch(items, worker, args.workers, args.output) else 0
+
+
+def batch_decode(args):
+    """
+    Entry point for the 'batch-decode' subcommand.
+
+    Parameters:
+        args (argparse.Namespace): The parsed command line arguments.
+
+    Returns:
+        int: The process exit code.
+    """
+    if os.path.isdir(args.source):
+        items = directory_items(args.source, key=args.key)
+        if args.output_dir:  # decode file payloads into the output directory, one file per image
+            for item in items:
+                name = os.path.splitext(os.path.basename(item['image']))[0]
+                item['output_file'] = os.path.join(args.output_dir, f"{name}.payload")
+    else:
+        items = load_manifest(args.source)
+    worker = partial(decode_item, profile=Metrics.recording, threads=args.threads)
+    return 1 if run_batch(items, worker, args.workers, args.output) else 0
@@ -1,10 +1,12 @@
 import random
 import sys
-import cv2
 from cryptography.fernet import Fernet
 import os
-from Encoding import Encoding, calculate_capacity
-from Decoding import Decoding
+from Capacity import capacity_by_density
+from Encoding import Encoding, encode_bytes
+from ImageCache import FORMAT_ERROR, image_info, is_lossless
+from Decoding import Decoding, decode_bytes
+from CommandIO import command_key, read_input, read_payload, write_output
 
 
 def encode_cli():
@@ -13,21 +15,27 @@ def encode_cli():
     Prompts the user for image path, text, and Fernet key, then encodes the text into the image.
     """
     while True:
-        path = input("Enter the path of the PNG image: ")
+        path = input("Enter the path of the image (PNG, BMP, TIFF or WebP): ")
         if os.path.exists(path):
-            if not path.lower().endswith('.png'):
-                print("Error: Program only supports PNG image.")
+            if not is_lossless(path):
+                print(FORMAT_ERROR)
                 return
             else:
                 break
         else:
             print("Error: File not found. Please enter a valid path.")
             return
-    img = cv2.imread(path)
-    start_row = random.randint(5, img.shape[0] - 1)  # Randomly select start row
-    start_col = random.randint(0, img.shape[1] - 1)  # Randomly select start column
-    capacity = calculate_capacity(path, start_row, start_col)  # Calculate image capacity
-    print(f"The image can hold up to {capacity} characters.")
+    info = image_info(path)  # only the header is read here; the pixels are decoded when encoding
+    if info is None:
+        print("Error: Could not read the image.")
+        return
+    start_row = random.randint(5, info.height - 1)  # Randomly select start row
+    start_col = random.randint(0, info.width - 1)  # Randomly select start column
+    capacities = capacity_by_density(path, start_row, start_col)  # Calculate image capacity
+    for density, capacity in capacities.items():
+        print(f"Using {density} bit(s) per color channel, the image can hold up to {capacity} characters.")
+    density = input("Enter bits per color channel (1-4) or Press (Enter) to use 1: ")
+    density = int(density) if density.strip().isdigit() else 1
     text = input("Enter text to encode within the character limit given above: ")
     while True:
         key = input("Enter Fernet Key or Press (Enter) to generate a key: ")
@@ -39,7 +47,7 @@ def encode_cli():
         except ValueError:
             print("Error! Invalid key. Please Enter a valid Fernet key.")
             break
-        encoder = Encoding(path, text, key, start_row, start_col)
+        encoder = Encoding(path, text, key, start_row, start_col, density=density)
         result, encoded_image_path = encoder.encoder()
         if "Error" in result:
             print(result)
@@ -58,10 +66,10 @@ def decode_cli():
     """
 
     while True:
-        path = input("Enter the path of the PNG image: ")
+        path = input("Enter the path of the image (PNG, BMP, TIFF or WebP): ")
         if os.path.exists(path):
-            if not path.lower().endswith('.png'):
-                print("Error: Program only supports PNG image.")
+            if not is_lossless(path):
+                print(FORMAT_ERROR)
                 return
             else:
                 break
@@ -80,6 +88,83 @@ def decode_cli():
     print(result)
 
 
+def pipe_encode(args):
+    """
+    Encodes without prompting, reading the image from a file or standard input and writing the encoded image to a
+    file or standard output, so the work stays in memory and can be part of a shell pipeline. Messages go to
+    standard error.
+
+    Parameters:
+        args (argparse.Namespace): The parsed 'pipe-encode' arguments.
+
+    Returns:
+        int: The exit code, 0 on success.
+    """
+    key = command_key(args.key)
+    try:
+        Fernet(key)  # Validate key format
+        payload = read_payload(args)
+        png_bytes = read_input(args.image)
+    except (OSError, ValueError) as error:
+        print(f"Error: {error}", file=sys.stderr)
+        return 1
+    result, encoded = encode_bytes(png_bytes, payload, key, density=args.density, scatter=args.scatter,
+                                   compression=args.compress)
+    print(result, file=sys.stderr)
+    if encoded is None:
+        return 1
+    write_output(args.output, encoded)
+    return 0
+
+
+def pipe_decode(args):
+    """
+    Decodes without prompting, reading the encoded image from a file or standard input and writing the payload to
+    a file or standard output. Messages go to standard error.
+
+    Parameters:
+        args (argparse.Namespace): The parsed 'pipe-decode' arguments.
+
+    Returns:
+        int: The exit code, 0 on success.
+    """
+    try:
+        Fernet(args.key)  # Validate key format
+        png_bytes = read_input(args.image)
+    except (OSError, ValueError) as error:
+        print(f"Error: {error}", file=sys.stderr)
+        return 1
+    result, payload = decode_bytes(png_bytes, args.key)
+    print(result, file=sys.stderr)
+    if payload is None:
+        return 1
+    write_output(args.output, payload.encode('utf-8') if isinstance(payload, str) else payload)
+    return 0
+
+
+def update_command(args):
+    """
+    Replaces the message of an encoded image without prompting, keeping its offset and settings (see
+    Encoding.updater). Messages go to standard error.
+
+    Parameters:
+        args (argparse.Namespace): The parsed 'update' arguments.
+
+    Returns:
+        int: The exit code, 0 on success.
+    """
+    try:
+        Fernet(args.key)  # Validate key format
+        text = read_input(args.message_file).decode('utf-8') if args.message_file else args.message or ''
+    except (OSError, ValueError) as error:
+        print(f"Error: {error}", file=sys.stderr)
+        return 1
+    encoder = Encoding(args.image, text, args.key, None, None, compression=args.compress)
+    result, _ = encoder.updater(args.output)
+    print(result, file=sys.stderr)
+    return 1 if "Error" in result else 0
+
+
 class SteganographyAppCLI:
     """
     Command-line interface for the steganography application.
@@ -0,0 +1,176 @@
+import json
+import os
+import sys
+
+from Codec import compression_ratio
+from Header import MAX_DENSITY
+from ImageCache import format_channels, image_info, is_lossless
+
+
+def calculate_capacity(img_path, start_row, start_col, density=1, compression=None, sample=''):
+    """
+    Calculates the capacity of the image to hold encoded text based on its dimensions, its channels and the start
+    position. Given a path, only the header of the file is read.
+
+    Parameters:
+        img_path (str or numpy.ndarray): Path of the image file, or the already loaded image.
+        start_row (int): Starting row for encoding.
+        start_col (int): Starting column for encoding.
+        density (int): Number of least significant bits used per colour channel.
+        compression (str): If given, estimate the capacity for text compressed with this codec (or 'auto') instead.
+        sample (str): Text like the messages to be encoded, used to estimate the compression ratio.
+
+    Returns:
+        int: The maximum number of encrypted bytes that can be encoded into the image or, with compression, the
+        estimated number of bytes of text like the sample that fit once compressed and encrypted. 0 if the image
+        could not be read.
+    """
+    shape = image_shape(img_path)
+    if shape is None:
+        return 0
+    capacity = capacity_for_shape(shape[0], shape[1], start_row, start_col, density, shape[2])
+    if compression is None:
+        return capacity
+    return int(fernet_plaintext_capacity(capacity) / compression_ratio(sample, compression))
+
+
+def fernet_plaintext_capacity(capacity):
+    """
+    Calculates the longest plain text whose Fernet token fits in the given number of bytes. A token is the
+    base64 encoding of a 57-byte envelope around the text padded to a whole number of 16-byte blocks.
+
+    Parameters:
+        capacity (int): Space available for the token, in bytes.
+
+    Returns:
+        int: The maximum plain text length in bytes.
+    """
+    padded = (capacity // 4 * 3 - 57) // 16 * 16  # room for the padded text
+    return max(padded - 1, 0)  # padding always adds at least one byte
+
+
+def fernet_token_size(length):
+    """
+    Calculates the size of the Fernet token of a plain text, the inverse of fernet_plaintext_capacity.
+
+    Parameters:
+        length (int): The plain text length in bytes.
+
+    Returns:
+        int: The token length in bytes.
+    """
+    return -(-(57 + (length // 16 + 1) * 16) // 3) * 4
+
+
+def capacity_by_density(img_path, start_row, start_col):
+    """
+    Calculates the capacity of the image for every supported density.
+
+    Parameters:
+        img_path (str or numpy.ndarray): Path of the image file, or the already loaded image.
+        start_row (int): Starting row for encoding.
+        start_col (int): Starting column for encoding.
+
+    Returns:
+        dict: The maximum number of bytes that can be encoded, keyed by bits per channel (all 0 if the image could
+        not be read).
+    """
+    shape = image_shape(img_path) or (0, 0, 0)
+    return {density: capacity_for_shape(shape[0], shape[1], start_row, start_col, density, shape[2])
+            for density in range(1, MAX_DENSITY + 1)}
+
+
+def capacity_of_files(image_paths, start_row=5, start_col=0, density=1):
+    """
+    Calculates the capacity of many images at once, for planning which carriers to use. Only the header of each
+    PNG file is read, and the dimensions are cached until the file changes.
+
+    Parameters:
+        image_paths (iterable): Paths of the image files.
+        start_row (int): Starting row for encoding.
+        start_col (int): Starting column for encoding.
+        density (int): Number of least significant bits used per colour channel.
+
+    Returns:
+        dict: The maximum number of bytes that can be encoded into each image, keyed by path, or None for the images
+        that could not be read.
+    """
+    capacities = {}
+    for path in image_paths:
+        info = image_info(path)
+        capacities[path] = (None if info is None else
+                            capacity_for_shape(info.height, info.width, start_row, start_col, density,
+                                               format_channels(path, info.channels)))
+    return capacities
+
+
+def image_shape(img_path):
+    """
+    Returns:
+        tuple: The height, width and number of channels holding payload of an image given as a path or as a loaded
+        array, or None if it can't be read.
+    """
+    if hasattr(img_path, 'shape'):  # a loaded image; checked without importing NumPy
+        return img_path.shape[0], img_path.shape[1], 1 if len(img_path.shape) == 2 else img_path.shape[2]
+    info = image_info(img_path)
+    return None if info is None else (info.height, info.width, format_channels(img_path, info.channels))
+
+
+def capacity_for_shape(height, width, start_row, start_col, density=1, channels=3):
+    """
+    Calculates the capacity of an image of the given dimensions to hold encoded text.
+
+    Parameters:
+        height (int): Height of the image in pixels.
+        width (int): Width of the image in pixels.
+        start_row (int): Starting row for encoding.
+        start_col (int): Starting column for encoding.
+        density (int): Number of least significant bits used per channel.
+        channels (int): Number of channels holding payload: all of them, alpha included (see Header.payload_view).
+
+    Returns:
+        int: The maximum number of bytes that can be encoded into the image.
+    """
+    capacity = (height - start_row) * (width - start_col) * channels * density // 8  # start_col applies on every row
+    return max(capacity, 0)
+
+
+def capacity_command(args):
+    """
+    Entry point for the 'capacity' subcommand: writes one JSONL record per image with its dimensions and its
+    capacity in bytes at each density. Only the header of each PNG file is read, and neither NumPy nor OpenCV is
+    loaded for them, so the command starts quickly enough to be run once per file from scripts.
+
+    Parameters:
+        args (argparse.Namespace): The parsed command line arguments.
+
+    Returns:
+        int: The process exit code: 1 if any image could not be read.
+    """
+    paths = []
+    for source in args.images:
+        if os.path.isdir(source):
+            paths += sorted(os.path.join(source, name) for name in os.listdir(source) if is_lossless(name))
+        else:
+            paths.append(source)
+    densities = [args.density] if args.density else range(1, MAX_DENSITY + 1)
+    failures = 0
+    output = open(args.output, 'w', encoding='utf-8') if args.output else sys.stdout
+    try:
+        for path in paths:
+            info = image_info(path)
+            if info is None:
+                failures += 1
+                record = {'path': path, 'error': "Error: Not a readable image."}
+            else:
+                record = {'path': path, 'width': info.width, 'height': info.height,
+                          'channels': info.channels, 'depth': info.depth,
+                          'capacity': {density: capacity_for_shape(info.height, info.width, args.start_row,
+                                                                   args.start_col, density,
+                                                                   format_channels(path, info.channels))
+                                       for density in densities}}
+            output.write(json.dumps(record) + '\n')
+    finally:
+        if output is not sys.stdout:
+            output.close()
+    return 1 if failures else 0
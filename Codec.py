@@ -0,0 +1,98 @@
+import lzma
+import zlib
+
+try:
+    import zstandard  # optional: 'pip install zstandard' enables the zstd codec
+except ImportError:
+    zstandard = None
+
+CODEC_NONE = 0
+CODECS = {'zlib': 1, 'lzma': 2, 'zstd': 3}  # codec names and the ids stored in the header flags
+AUTO = 'auto'  # try every available codec and keep the smallest output, or none if nothing gets smaller
+
+
+def available_codecs():
+    """
+    Returns:
+        list: The names of the codecs usable here; zstd needs the optional zstandard package.
+    """
+    return [name for name in CODECS if name != 'zstd' or zstandard is not None]
+
+
+def compress(data, codec):
+    """
+    Compresses a payload before it is encrypted.
+
+    Parameters:
+        data (bytes): The payload.
+        codec (str): A name from CODECS, or AUTO to pick the codec giving the smallest output.
+
+    Returns:
+        tuple: The id of the codec used (int, CODEC_NONE if the output was kept uncompressed) and the output (bytes).
+
+    Raises:
+        ValueError: If the codec is unknown or not available.
+    """
+    if codec == AUTO:
+        best = (CODEC_NONE, data)
+        for name in available_codecs():
+            candidate = compress(data, name)
+            if len(candidate[1]) < len(best[1]):
+                best = candidate
+        return best
+    if codec not in available_codecs():
+        raise ValueError(f"Unknown or unavailable compression '{codec}'. Choose from: "
+                         f"{', '.join(available_codecs() + [AUTO])}.")
+    if codec == 'zlib':
+        return CODECS[codec], zlib.compress(data, 9)
+    if codec == 'lzma':
+        return CODECS[codec], lzma.compress(data)
+    return CODECS[codec], zstandard.ZstdCompressor(level=10).compress(data)
+
+
+def decompress(data, codec_id):
+    """
+    Reverses compress().
+
+    Parameters:
+        data (bytes): The decrypted payload.
+        codec_id (int): The codec id stored in the header.
+
+    Returns:
+        bytes: The original payload.
+
+    Raises:
+        ValueError: If the data is corrupt or was compressed with a codec that is not available here.
+    """
+    try:
+        if codec_id == CODEC_NONE:
+            return data
+        if codec_id == CODECS['zlib']:
+            return zlib.decompress(data)
+        if codec_id == CODECS['lzma']:
+            return lzma.decompress(data)
+    except (zlib.error, lzma.LZMAError) as error:
+        raise ValueError(f"Corrupt compressed payload: {error}") from error
+    if zstandard is None:
+        raise ValueError("The payload is compressed with zstd; install the zstandard package to decode it.")
+    try:
+        return zstandard.ZstdDecompressor().decompress(data)
+    except zstandard.ZstdError as error:
+        raise ValueError(f"Corrupt compressed payload: {error}") from error
+
+
+def compression_ratio(sample, codec):
+    """
+    Estimates how much a codec shrinks text like the sample.
+
+    Parameters:
+        sample (str): Text like the messages to be encoded.
+        codec (str): A name from CODECS, or AUTO.
+
+    Returns:
+        float: Compressed size divided by original size, at most 1 since incompressible text is stored as is.
+    """
+    data = sample.encode()
+    if not data:
+        return 1.0
+    return min(len(compress(data, codec)[1]) / len(data), 1.0)
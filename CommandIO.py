@@ -0,0 +1,117 @@
+import io
+import os
+import sys
+
+from cryptography.fernet import Fernet
+
+
+def read_input(path):
+    """
+    Reads a whole file, or standard input if the path is '-'.
+
+    Parameters:
+        path (str): Path of the file, or '-'.
+
+    Returns:
+        bytes: The content read.
+    """
+    if path == '-':
+        return sys.stdin.buffer.read()
+    with open(path, 'rb') as source:
+        return source.read()
+
+
+def write_output(path, data):
+    """
+    Writes data to a file, or to standard output if the path is '-'.
+
+    Parameters:
+        path (str): Path of the file, or '-'.
+        data (bytes): The data to write.
+    """
+    if path == '-':
+        sys.stdout.buffer.write(data)
+        sys.stdout.buffer.flush()
+    else:
+        with open(path, 'wb') as target:
+            target.write(data)
+
+
+def command_key(key):
+    """
+    Returns the key given on the command line, or a new one, which is printed to standard error.
+
+    Parameters:
+        key (str): The Fernet key given, or None.
+
+    Returns:
+        str: The Fernet key to use.
+    """
+    if not key:
+        key = Fernet.generate_key().decode()  # Generate Fernet key if none provided
+        print(f"Generated Key: {key}\nReminder: Copy this key for decoding. ", file=sys.stderr)
+    return key
+
+
+def read_payload(args):
+    """
+    Reads the payload of an encoding command: the payload file, the message file or the message.
+
+    Parameters:
+        args (argparse.Namespace): The parsed command line arguments.
+
+    Returns:
+        bytes or str: The payload file as bytes, or the message as text.
+
+    Raises:
+        OSError: If the file can't be read.
+        UnicodeDecodeError: If the message file is not UTF-8 text.
+    """
+    if args.payload_file:
+        return read_input(args.payload_file)
+    if args.message_file:
+        return read_input(args.message_file).decode('utf-8')
+    return args.message or ''
+
+
+def open_payload(args):
+    """
+    Opens the payload of a streaming command: the payload file, the message file or the message.
+
+    Parameters:
+        args (argparse.Namespace): The parsed command line arguments.
+
+    Returns:
+        tuple: The payload as a binary file object, to be closed by the caller, and its size in bytes (int).
+
+    Raises:
+        OSError: If the file can't be read.
+    """
+    if args.payload_file:
+        return open(args.payload_file, 'rb'), os.path.getsize(args.payload_file)
+    text = read_input(args.message_file) if args.message_file else (args.message or '').encode('utf-8')
+    return io.BytesIO(text), len(text)
+
+
+def open_output(path):
+    """
+    Returns:
+        file: Standard output if the path is '-', else the file opened for binary writing.
+    """
+    return sys.stdout.buffer if path == '-' else open(path, 'wb')
+
+
+def close_output(output, path, failed=False):
+    """
+    Closes an output opened by open_output, removing the file if the command failed.
+
+    Parameters:
+        output (file): The output.
+        path (str): Path of the file, or '-'.
+        failed (bool): Whether the command failed.
+    """
+    if output is sys.stdout.buffer:
+        return
+    output.close()
+    if failed:
+        os.remove(path)  # don't leave a partial or unauthenticated payload behind
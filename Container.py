@@ -0,0 +1,494 @@
+import base64
+import os
+import struct
+import sys
+import zlib
+from collections import namedtuple
+
+import cryptography.fernet
+from cryptography.fernet import Fernet
+from cryptography.hazmat.primitives import hashes
+from cryptography.hazmat.primitives.kdf.hkdf import HKDF
+
+from Capacity import capacity_for_shape
+from Codec import CODEC_NONE, compress, decompress
+from CommandIO import read_payload, write_output
+from Decoding import BitReader, read_header
+from Encoding import BitWriter, encode_header, group_bits, layout_error, to_bits
+from Header import (FLAG_SLOTS, HEADER_ROWS, MAX_DENSITY, channel_flags, codec_flags, density_flags, flags_codec,
+                    flags_density, payload_view)
+from ImageCache import is_lossless, load_image, save_image, writable_copy
+from PngStream import patch_png, read_png_rows, read_png_shape
+
+TABLE_MAGIC = b'SLT'  # marks the slot table at the start of a container
+TABLE_VERSION = 1
+TABLE_FORMAT = '>3sBH'  # magic, version, number of slots
+ENTRY_FORMAT = '>QQ8sB'  # offset and length of the slot in bytes from the start of the container, key id, flags
+TABLE_HEAD_SIZE = struct.calcsize(TABLE_FORMAT)
+ENTRY_SIZE = struct.calcsize(ENTRY_FORMAT)
+CHECKSUM_SIZE = 4  # CRC-32 of the table
+SLOT_ALIGN = 12  # slots start on multiples of 12 bytes, which is a whole number of channels at every density
+DEFAULT_SLOTS = 16
+SLOT_BINARY = 0x01  # the slot holds bytes rather than text; the codec id is stored as in the header (FLAG_CODEC)
+
+Slot = namedtuple('Slot', ['offset', 'length', 'key_id', 'flags'])
+EMPTY_SLOT = Slot(0, 0, bytes(8), 0)
+
+
+def key_id(key):
+    """
+    Derives a short public id from a Fernet key, so the slots of a key can be found without trying to decrypt every
+    slot. The id reveals nothing about the key itself.
+
+    Parameters:
+        key (str or bytes): The Fernet key.
+
+    Returns:
+        bytes: An 8-byte id.
+    """
+    key_bytes = base64.urlsafe_b64decode(key)
+    if len(key_bytes) != 32:
+        raise ValueError("Fernet key must be 32 url-safe base64-encoded bytes.")
+    return HKDF(algorithm=hashes.SHA256(), length=8, salt=None, info=b'steganography slot key id').derive(key_bytes)
+
+
+def aligned(size):
+    """
+    Rounds a size in bytes up to a multiple of SLOT_ALIGN.
+    """
+    return -(-size // SLOT_ALIGN) * SLOT_ALIGN
+
+
+class SlotContainer:
+    """
+    Holds several independent messages in one image. The binary header (with FLAG_SLOTS set) points at a container
+    that starts with a table of slots, each giving the offset, length, key id and flags of one encrypted message.
+    Messages can be added, read and deleted one at a time: only the bits of that message and of the table are
+    touched, so the other messages are never re-embedded or even extracted.
+
+    Attributes:
+        img (numpy.ndarray): The image array holding the container, modified in place. It may hold only the first
+            rows of the image (see open_png).
+        region (numpy.ndarray): The channels of the image holding the container (see Header.payload_view).
+        start_row (int): Row where the container starts.
+        start_col (int): Column where the container starts (applied on every row).
+        density (int): Number of least significant bits used per colour channel.
+        size (int): Size of the container in bytes, table included.
+        slots (list): One Slot per table entry; empty slots have length 0.
+        flags (int): The header flags of the container.
+        writes (list): The (offset, data) pieces embedded since the container was created or opened, so they can
+            be written to the image file without decoding the rest of it (see patch).
+    """
+
+    def __init__(self, img, start_row, start_col, density, size, slots, flags=0):
+        """
+        Initializes the container over an image. Use create() or open() rather than calling this directly.
+
+        Parameters:
+            img (numpy.ndarray): The image array holding the container.
+            start_row (int): Row where the container starts.
+            start_col (int): Column where the container starts.
+            density (int): Number of least significant bits used per colour channel.
+            size (int): Size of the container in bytes, table included.
+            slots (list): One Slot per table entry.
+            flags (int): The header flags of the container.
+        """
+        self.img = img
+        self.region = payload_view(img, flags)
+        self.start_row = start_row
+        self.start_col = start_col
+        self.density = density
+        self.size = size
+        self.slots = slots
+        self.flags = flags
+        self.writes = []
+
+    @classmethod
+    def create(cls, img, start_row=HEADER_ROWS, start_col=0, density=1, slot_count=DEFAULT_SLOTS):
+        """
+        Writes an empty container into an image, replacing any payload it held.
+
+        Parameters:
+            img (numpy.ndarray): The writable image array.
+            start_row (int): Row where the container starts.
+            start_col (int): Column where the container starts.
+            density (int): Number of least significant bits used per colour channel (1 to 4).
+            slot_count (int): Number of slots in the table; this can't be changed later.
+
+        Returns:
+            SlotContainer: The new container.
+
+        Raises:
+            ValueError: If the settings are invalid or the image is too small for the table.
+        """
+        if density not in range(1, MAX_DENSITY + 1):
+            raise ValueError(f"Density must be between 1 and {MAX_DENSITY} bits per channel.")
+        if not 0 < slot_count < 1 << 16:
+            raise ValueError("The container must hold 1 to 65535 slots.")
+        flags = density_flags(density) | FLAG_SLOTS | channel_flags(img)
+        region = payload_view(img, flags)
+        error = layout_error(img.shape[0], img.shape[1], region.shape[2], start_row, start_col)
+        if error:
+            raise ValueError(error)
+        capacity = capacity_for_shape(img.shape[0], img.shape[1], start_row, start_col, density, region.shape[2])
+        size = capacity // SLOT_ALIGN * SLOT_ALIGN
+        container = cls(img, start_row, start_col, density, size, [EMPTY_SLOT] * slot_count, flags)
+        if container.data_start() > size:
+            raise ValueError("The image is too small for a slot table of this size.")
+        encode_header(start_row, start_col, size, img, flags)
+        container.write_table()
+        return container
+
+    @classmethod
+    def open(cls, img, height=None):
+        """
+        Reads the container of an image. Only the header and the slot table are extracted.
+
+        Parameters:
+            img (numpy.ndarray): The image array, or its first rows down to the end of the slot table at least; it
+                must be writable to add or delete messages.
+            height (int): Height of the whole image in pixels, if img holds only its first rows.
+
+        Returns:
+            SlotContainer: The container.
+
+        Raises:
+            ValueError: If the image holds no container or its table is corrupt.
+        """
+        header = read_header(img, height or img.shape[0], img.shape[1])
+        if header is None or not header.flags & FLAG_SLOTS:
+            raise ValueError("The image holds no slot container.")
+        density = flags_density(header.flags)
+        reader = BitReader(payload_view(img, header.flags), header.start_row, header.start_col, density)
+        head = reader.read(TABLE_HEAD_SIZE)
+        magic, version, count = struct.unpack(TABLE_FORMAT, head)
+        if magic != TABLE_MAGIC or version != TABLE_VERSION:
+            raise ValueError("The slot table is corrupt.")
+        entries = reader.read(count * ENTRY_SIZE)
+        checksum = reader.read(CHECKSUM_SIZE)
+        if len(checksum) != CHECKSUM_SIZE or struct.unpack('>I', checksum)[0] != zlib.crc32(head + entries):
+            raise ValueError("The slot table is corrupt.")
+        slots = [Slot(*struct.unpack_from(ENTRY_FORMAT, entries, index * ENTRY_SIZE)) for index in range(count)]
+        return cls(img, header.start_row, header.start_col, density, header.length, slots, header.flags)
+
+    @classmethod
+    def open_png(cls, image_path, end=None):
+        """
+        Reads the container of a PNG image, decoding only its rows down to the end of the slot table, or down to a
+        byte offset of the container (see PngStream.read_png_rows).
+
+        Parameters:
+            image_path (str): Path of the PNG image.
+            end (int): Offset in bytes from the start of the container of the last byte needed, or None for the end
+                of the slot table.
+
+        Returns:
+            SlotContainer: The container, over the rows decoded.
+
+        Raises:
+            ValueError: If the image can't be streamed, holds no container or its table is corrupt.
+        """
+        height, width, rows = read_png_rows(image_path, HEADER_ROWS)
+        header = read_header(rows, height, width)
+        if header is None or not header.flags & FLAG_SLOTS:
+            raise ValueError("The image holds no slot container.")
+        density = flags_density(header.flags)
+        row_bits = (width - header.start_col) * payload_view(rows, header.flags).shape[2] * density
+
+        def rows_to(length):  # the rows of the image down to a byte offset of the container
+            return read_png_rows(image_path, header.start_row + -(-length * 8 // row_bits))[2]
+
+        if end is None:
+            head = BitReader(payload_view(rows_to(TABLE_HEAD_SIZE), header.flags), header.start_row,
+                             header.start_col, density).read(TABLE_HEAD_SIZE)
+            end = TABLE_HEAD_SIZE + struct.unpack(TABLE_FORMAT, head)[2] * ENTRY_SIZE + CHECKSUM_SIZE
+        return cls.open(rows_to(end), height)
+
+    def data_start(self):
+        """
+        Returns:
+            int: Offset of the first byte after the slot table, where messages may be placed.
+        """
+        return aligned(TABLE_HEAD_SIZE + len(self.slots) * ENTRY_SIZE + CHECKSUM_SIZE)
+
+    def table(self):
+        """
+        Returns:
+            bytes: The packed slot table, checksum included.
+        """
+        data = struct.pack(TABLE_FORMAT, TABLE_MAGIC, TABLE_VERSION, len(self.slots)) + \
+            b''.join(struct.pack(ENTRY_FORMAT, *slot) for slot in self.slots)
+        return data + struct.pack('>I', zlib.crc32(data))
+
+    def write_table(self):
+        """
+        Embeds the slot table at the start of the container.
+        """
+        self.write_at(0, self.table())
+
+    def write_at(self, offset, data):
+        """
+        Embeds bytes at an offset of the container, leaving the rest of it untouched.
+
+        Parameters:
+            offset (int): Offset in bytes from the start of the container, a multiple of SLOT_ALIGN.
+            data (bytes): The bytes to embed.
+        """
+        writer = BitWriter(self.region, self.start_row, self.start_col, self.density)
+        writer.position = offset * 8 // self.density
+        writer.write(data)
+        writer.close()
+        self.writes.append((offset, data))
+
+    def written_rows(self):
+        """
+        Returns:
+            list: The (first, last) ranges of rows of the image holding the pieces in writes.
+        """
+        row_bits = (self.region.shape[1] - self.start_col) * self.region.shape[2] * self.density
+        return [(self.start_row + offset * 8 // row_bits, self.start_row + ((offset + len(data)) * 8 - 1) // row_bits)
+                for offset, data in self.writes]
+
+    def patch(self, top, band):
+        """
+        Embeds the part of the pieces in writes that falls into a band of rows of the image, as write_at embedded
+        them into the image the container was opened on. Suits PngStream.patch_png, so only the rows touched are
+        written again.
+
+        Parameters:
+            top (int): Index of the first row of the band in the whole image.
+            band (numpy.ndarray): The rows of the image to modify in place, in BGR or BGRA order.
+        """
+        view = payload_view(band, self.flags)
+        skip = max(self.start_row - top, 0)  # rows of the band above the container
+        row_size = (view.shape[1] - self.start_col) * view.shape[2]
+        first = (top + skip - self.start_row) * row_size  # index of the first channel of the band in the container
+        for offset, data in self.writes:
+            position = offset * 8 // self.density - first
+            writer = BitWriter(view, skip, self.start_col, self.density)
+            writer.position = max(position, 0)
+            writer.store(group_bits(to_bits(data), self.density)[max(-position, 0):])
+
+    def read_at(self, offset, length):
+        """
+        Extracts bytes from an offset of the container.
+
+        Parameters:
+            offset (int): Offset in bytes from the start of the container.
+            length (int): Number of bytes to extract.
+
+        Returns:
+            bytes: The bytes extracted.
+        """
+        reader = BitReader(self.region, self.start_row, self.start_col, self.density)
+        reader.position = offset * 8
+        return reader.read(length)
+
+    def allocate(self, length):
+        """
+        Finds room for a message, in the first gap between the messages already stored that is large enough.
+
+        Parameters:
+            length (int): Length of the message in bytes.
+
+        Returns:
+            int: The offset of the room found, or None if no gap is large enough.
+        """
+        offset = self.data_start()
+        for slot in sorted((slot for slot in self.slots if slot.length), key=lambda slot: slot.offset):
+            if slot.offset - offset >= length:
+                return offset
+            offset = max(offset, slot.offset + aligned(slot.length))
+        return offset if self.size - offset >= length else None
+
+    def slot(self, index):
+        """
+        Returns:
+            Slot: The slot at an index of the table.
+
+        Raises:
+            ValueError: If there is no such slot or it is empty.
+        """
+        if not 0 <= index < len(self.slots) or not self.slots[index].length:
+            raise ValueError(f"Slot {index} is empty or does not exist.")
+        return self.slots[index]
+
+    def add(self, payload, key, compression=None):
+        """
+        Encrypts a message and stores it in the first empty slot.
+
+        Parameters:
+            payload (str or bytes): The text or binary message.
+            key (str): The Fernet key to encrypt it with.
+            compression (str): Codec to compress the message with before encryption, 'auto', or None (see Codec).
+
+        Returns:
+            int: The index of the slot used.
+
+        Raises:
+            ValueError: If the key or codec is invalid, every slot is in use or the container has no room left.
+        """
+        index = next((index for index, slot in enumerate(self.slots) if not slot.length), None)
+        if index is None:
+            raise ValueError("Every slot is in use. Delete a message first.")
+        data = payload.encode() if isinstance(payload, str) else payload
+        codec = CODEC_NONE
+        if compression:
+            codec, data = compress(data, compression)
+        sealed = base64.urlsafe_b64decode(Fernet(key).encrypt(data))  # stored without base64, 25% smaller
+        offset = self.allocate(len(sealed))
+        if offset is None:
+            raise ValueError("Not enough room left in the container for this message.")
+        self.write_at(offset, sealed)
+        flags = codec_flags(codec) | (0 if isinstance(payload, str) else SLOT_BINARY)
+        self.slots[index] = Slot(offset, len(sealed), key_id(key), flags)
+        self.write_table()
+        return index
+
+    def read(self, index, key):
+        """
+        Extracts and decrypts the message of one slot, without extracting any other.
+
+        Parameters:
+            index (int): The index of the slot.
+            key (str): The Fernet key the message was encrypted with.
+
+        Returns:
+            str or bytes: The message, as it was added.
+
+        Raises:
+            ValueError: If the slot is empty, was encrypted with another key or is corrupt.
+        """
+        slot = self.slot(index)
+        if slot.key_id != key_id(key):
+            raise ValueError(f"Slot {index} was encrypted with a different key.")
+        if slot.offset < self.data_start() or slot.offset + slot.length > self.size:
+            raise ValueError(f"Slot {index} is corrupt.")
+        try:
+            data = Fernet(key).decrypt(base64.urlsafe_b64encode(self.read_at(slot.offset, slot.length)))
+        except cryptography.fernet.InvalidToken:
+            raise ValueError(f"Slot {index} is corrupt.") from None
+        data = decompress(data, flags_codec(slot.flags))
+        return data if slot.flags & SLOT_BINARY else data.decode()
+
+    def delete(self, index, key):
+        """
+        Empties a slot. The bits of its message are overwritten with random ones, so the freed room looks like the
+        rest of the image; the other messages are not touched. Only the holder of the key of the message may delete
+        it.
+
+        Parameters:
+            index (int): The index of the slot.
+            key (str): The Fernet key the message was encrypted with.
+
+        Raises:
+            ValueError: If the slot is already empty, does not exist or was encrypted with another key.
+        """
+        slot = self.slot(index)
+        if slot.key_id != key_id(key):
+            raise ValueError(f"Slot {index} was encrypted with a different key.")
+        self.write_at(slot.offset, os.urandom(slot.length))
+        self.slots[index] = EMPTY_SLOT
+        self.write_table()
+
+    def find(self, key):
+        """
+        Returns:
+            list: The indexes of the slots encrypted with a key.
+        """
+        identifier = key_id(key)
+        return [index for index, slot in enumerate(self.slots) if slot.length and slot.key_id == identifier]
+
+    def free_space(self):
+        """
+        Returns:
+            int: Number of bytes not used by the table or the messages. Gaps left by deleted messages count, even if
+            a message larger than any single gap won't fit.
+        """
+        return self.size - self.data_start() - sum(aligned(slot.length) for slot in self.slots if slot.length)
+
+
+def slots_command(args):
+    """
+    Entry point for the 'slots' subcommand: creates a container, or lists, adds, reads or deletes its messages.
+    'init' writes the container to a new image; 'add' and 'delete' update the image in place unless an output is
+    given. PNG images are only decoded down to the rows the command needs, and 'add' and 'delete' write them with
+    patch_png, so only the segments holding the slot table and the message are compressed again.
+
+    Parameters:
+        args (argparse.Namespace): The parsed command line arguments.
+
+    Returns:
+        int: The process exit code.
+    """
+    try:
+        if not is_lossless(args.image):
+            raise ValueError("This program only supports PNG, BMP, TIFF and WebP files.")
+        if args.action == 'init':
+            img = load_image(args.image)
+            if img is None:
+                raise ValueError("Could not read the image.")
+            base, extension = os.path.splitext(args.image)
+            output = args.output or f"{base}_slots{extension}"
+            container = SlotContainer.create(writable_copy(img, output), args.start_row, args.start_col,
+                                             args.density, args.slots)
+            save_image(output, container.img)
+            print(f"Created a container with {len(container.slots)} slots and {container.free_space()} bytes of room "
+                  f"in {output}.", file=sys.stderr)
+            return 0
+        target = args.output or args.image
+        streamed = all(path.lower().endswith('.png') for path in (args.image, target))
+        if streamed:
+            try:
+                read_png_shape(args.image)
+            except ValueError:  # greyscale, palette or 16-bit PNG images are decoded in full
+                streamed = False
+        if streamed:
+            container = SlotContainer.open_png(args.image)
+        else:
+            img = load_image(args.image)
+            if img is None:
+                raise ValueError("Could not read the image.")
+            container = SlotContainer.open(img.copy())  # the loaded image may be shared with other callers
+        if args.action == 'list':
+            for index, slot in enumerate(container.slots):
+                if slot.length and (not args.key or slot.key_id == key_id(args.key)):
+                    print(f"{index}\t{slot.length} bytes\tkey id {slot.key_id.hex()}")
+            print(f"{container.free_space()} bytes free.", file=sys.stderr)
+            return 0
+        if not args.key:
+            raise ValueError("A Fernet key is required.")
+        if args.action == 'read':
+            indexes = [args.index] if args.index is not None else container.find(args.key)
+            if not indexes:
+                raise ValueError("No slot was encrypted with this key.")
+            if streamed:  # decode the rows down to the end of the last message read
+                end = max(container.slot(index).offset + container.slot(index).length for index in indexes)
+                container = SlotContainer.open_png(args.image, min(end, container.size))
+            payloads = [container.read(index, args.key) for index in indexes]
+            write_output(args.output or '-', b'\n'.join(payload.encode('utf-8') if isinstance(payload, str) else payload
+                                                        for payload in payloads))  # one message per line
+            return 0
+        if args.action == 'add':
+            payload = read_payload(args)
+            print(f"Message stored in slot {container.add(payload, args.key, args.compress)}.", file=sys.stderr)
+        else:
+            if args.index is None:
+                raise ValueError("Give the index of the slot to delete.")
+            container.delete(args.index, args.key)
+            print(f"Slot {args.index} deleted.", file=sys.stderr)
+        if streamed:
+            temporary_path = f"{os.path.splitext(target)[0]}.updating.png"
+            try:
+                patch_png(args.image, temporary_path, container.written_rows(), container.patch)
+            except (OSError, ValueError):
+                if os.path.exists(temporary_path):
+                    os.remove(temporary_path)
+                raise
+            os.replace(temporary_path, target)
+        else:
+            save_image(target, container.img)
+    except (OSError, ValueError) as error:
+        print(f"Error: {error}", file=sys.stderr)
+        return 1
+    return 0
@@ -1,6 +1,202 @@
-import cv2
+import io
+import os
 import cryptography
+import cryptography.exceptions
+import numpy as np
+from concurrent.futures import ThreadPoolExecutor
 from cryptography.fernet import Fernet
+from numpy.lib.stride_tricks import sliding_window_view
+from Codec import CODEC_NONE, decompress
+from Header import (FLAG_SCATTER, FLAG_SLOTS, FLAG_STREAM, HEADER_BITS, HEADER_ROWS, SHARD_SIZE, flags_codec,
+                    flags_density, payload_view, unpack_header, unpack_shard_header)
+from ImageCache import FORMAT_ERROR, is_lossless, load_image
+from Metrics import StageMetrics
+from PngStream import PNG_SIGNATURE
+from Scatter import RUN_PIXELS, pixel_runs, run_order
+from StreamCipher import decrypt_chunks
+
+CHUNK_BITS = 8 * 1024 * 1024  # number of LSBs extracted per step while searching for the end delimiter
+END_DELIMITER = b'\xff\xfe'  # '1111111111111110'
+EXTRACT_STEP = 1024 * 1024  # payload bytes extracted between progress reports and cancellation checks
+SLOTS_ERROR = "Error: The image holds a container of several messages. Read them with the 'slots' command instead."
+SHARD_ERROR = "Error: The image holds one shard of a payload spread over several images. Reassemble it with the " \
+              "'shard-decode' command."
+
+
+def extract_bits(img, start_row=0, start_col=0, count=None, density=1, offset=0):
+    """
+    Reads the least significant bits of the channels of an image, in the same order as they are written by the
+    encoder: row by row from start_row, column by column from start_col, and channel by channel within each pixel.
+
+    Parameters:
+        img (numpy.ndarray): The channels to read from, 8 or 16 bits deep, as viewed by Header.payload_view.
+        start_row (int): Starting row for extraction.
+        start_col (int): Starting column for extraction (applied on every row).
+        count (int): Number of bits to read, or None to read until the end of the image.
+        density (int): Number of least significant bits used per channel.
+        offset (int): Number of bits to skip from the start of the region.
+
+    Returns:
+        numpy.ndarray: A uint8 array holding one bit (0 or 1) per element.
+    """
+    region = img[start_row:, start_col:]
+    total = region.size * density
+    if count is None or offset + count > total:
+        count = max(total - offset, 0)
+    if count == 0:
+        return np.zeros(0, dtype=np.uint8)
+    first, skip = divmod(offset, density)
+    channels = -(-(skip + count) // density)
+    row_size = region.shape[1] * region.shape[2]
+    first_row = first // row_size
+    last_row = -(-(first + channels) // row_size)  # only read the rows that hold the requested bits
+    values = np.bitwise_and(region[first_row:last_row], (1 << density) - 1).astype(np.uint8, copy=False).reshape(-1)
+    values = values[first - first_row * row_size:][:channels]
+    return value_bits(values, density)[skip:skip + count]
+
+
+def band_length(length, threads, step, alignment=1):
+    """
+    Picks the length of the contiguous bands a payload is split into to be embedded or extracted on several threads:
+    at least one band per thread, at most step bytes so progress reports and cancellation checks come as often as
+    with one thread, and a multiple of alignment.
+
+    Parameters:
+        length (int): Payload length in bytes.
+        threads (int): Number of threads.
+        step (int): Largest band length in bytes.
+        alignment (int): The bands must start at a multiple of this many bytes.
+
+    Returns:
+        int: The band length in bytes.
+    """
+    size = min(step, -(-length // threads))
+    return max(size + -size % alignment, alignment)
+
+
+def value_bits(values, density):
+    """
+    Splits the values read from colour channels into their bits, most significant bit first.
+
+    Parameters:
+        values (numpy.ndarray): The least significant bits of each channel, as uint8 values.
+        density (int): Number of least significant bits used per channel.
+
+    Returns:
+        numpy.ndarray: A uint8 array holding one bit (0 or 1) per element.
+    """
+    if density == 1:
+        return values
+    return np.unpackbits(values[:, np.newaxis], axis=1)[:, 8 - density:].reshape(-1)
+
+
+class BitReader:
+    """
+    Reads a bit stream from an image one piece at a time, each piece continuing where the previous one stopped.
+
+    Attributes:
+        position (int): Number of bits read so far.
+    """
+
+    def __init__(self, img, start_row=0, start_col=0, density=1):
+        """
+        Initializes the reader at the start of the region.
+
+        Parameters:
+            img (numpy.ndarray): The channels to read from, as viewed by Header.payload_view.
+            start_row (int): Starting row for extraction.
+            start_col (int): Starting column for extraction (applied on every row).
+            density (int): Number of least significant bits used per channel.
+        """
+        self.img = img
+        self.start_row = start_row
+        self.start_col = start_col
+        self.density = density
+        self.position = 0
+
+    def seek(self, offset):
+        """
+        Moves the reader to a byte offset of the stream.
+        """
+        self.position = offset * 8
+
+    def read(self, count):
+        """
+        Reads the next bytes of the stream.
+
+        Parameters:
+            count (int): Number of bytes to read.
+
+        Returns:
+            bytes: The bytes read.
+        """
+        bits = extract_bits(self.img, self.start_row, self.start_col, count * 8, self.density, self.position)
+        self.position += count * 8
+        return np.packbits(bits).tobytes()
+
+
+class ScatterReader(BitReader):
+    """
+    Reads a bit stream written by Encoding.ScatterWriter, visiting the runs of pixels below the header rows in the
+    order seeded by the key.
+
+    Attributes:
+        position (int): Number of bits read so far.
+    """
+
+    def __init__(self, img, key, density=1):
+        """
+        Initializes the reader at the first run of the order.
+
+        Parameters:
+            img (numpy.ndarray): The channels to read from, as viewed by Header.payload_view.
+            key (str): The Fernet key seeding the run order.
+            density (int): Number of least significant bits used per channel.
+        """
+        super().__init__(img, HEADER_ROWS, 0, density)
+        self.runs = pixel_runs(img)
+        self.order = run_order(img.shape[0], img.shape[1], key)
+
+    def read(self, count):
+        """
+        Reads the next bytes of the stream.
+
+        Parameters:
+            count (int): Number of bytes to read.
+
+        Returns:
+            bytes: The bytes read.
+        """
+        unit = RUN_PIXELS * self.runs.shape[2] * self.density  # bits held by one run
+        first, skip = divmod(self.position, unit)
+        runs = self.order[first:first - (-(skip + count * 8) // unit)]
+        values = np.bitwise_and(np.take(self.runs, runs, axis=0), (1 << self.density) - 1).astype(np.uint8, copy=False)
+        values = values.reshape(-1)
+        bits = value_bits(values, self.density)[skip:skip + count * 8]
+        self.position += count * 8
+        return np.packbits(bits).tobytes()
+
+
+def iter_packed_bits(img, start_row=0, start_col=0):
+    """
+    Yields the LSB stream of an image packed into bytes, a band of rows at a time, so that callers searching the
+    stream can stop as soon as they find what they need.
+
+    Parameters:
+        img (numpy.ndarray): The channels to read from, as viewed by Header.payload_view.
+        start_row (int): Starting row for extraction.
+        start_col (int): Starting column for extraction (applied on every row).
+
+    Yields:
+        bytes: The next chunk of the packed LSB stream.
+    """
+    region = img[start_row:, start_col:]
+    if region.size == 0:
+        return
+    row_size = region.shape[1] * region.shape[2]
+    rows = max(8, (CHUNK_BITS // row_size) & ~7)  # a multiple of 8 rows keeps every chunk byte aligned
+    for top in range(0, region.shape[0], rows):
+        yield np.packbits(np.bitwise_and(region[top:top + rows], 1).astype(np.uint8, copy=False)).tobytes()
 
 
 def decode_start(img):
@@ -11,25 +207,58 @@ def decode_start(img):
         img (numpy.ndarray): The image array from which the position is to be decoded.
 
     Returns:
-        tuple: A tuple containing the starting row (int) and column (int) decoded from the image.
-    """
-    binary = ''
-    found = False
-    for i in range(0, 4):  # iterate through the first 5 rows of image pixel to retrieve the starting offset
-        if found:
-            break
-        for j in range(img.shape[1]):  # iterate through the columns of image pixels
-            if found:
-                break
-            for color in range(3):  # iterate through the color channels
-                binary += str(img[i, j, color] & 1)
-                if binary.endswith("0010001100100011"):  # Checks for the end delimiter in binary
-                    found = True
-                    break
-    binary_chunks = [binary[i: i + 8] for i in range(0, len(binary), 8)]
-    result_string = ''.join(chr(int(chunk, 2)) for chunk in binary_chunks)
-    split_result = result_string.split("$")
-    return int(split_result[0]), int(split_result[1][:-2])
+        tuple: A tuple containing the starting row (int) and column (int) decoded from the image, or None if the
+        first rows hold no 'row$col##' offset.
+    """
+    bits = extract_bits(payload_view(img[:4]))  # the starting offset is stored in the first 4 rows of image pixels
+    end = np.unpackbits(np.frombuffer(b'##', dtype=np.uint8))
+    if bits.size < end.size:
+        return None
+    matches = np.flatnonzero((sliding_window_view(bits, end.size) == end).all(axis=1))
+    if not matches.size:
+        return None
+    bits = bits[:matches[0]]  # Cut at the end delimiter in binary
+    split_result = np.packbits(bits).tobytes().decode('latin-1').split("$")
+    if len(split_result) != 2 or not all(field.isascii() and field.isdigit() for field in split_result):
+        return None
+    return int(split_result[0]), int(split_result[1])
+
+
+def decode_header(img):
+    """
+    Decodes the binary payload header from the first few rows of an image.
+
+    Parameters:
+        img (numpy.ndarray): The image array from which the header is to be decoded.
+
+    Returns:
+        PayloadHeader: The header, or None if the image has no valid header (for example a legacy image that stores
+        its offset as text and ends its payload with a delimiter).
+    """
+    return read_header(img[:HEADER_ROWS], img.shape[0], img.shape[1])
+
+
+def read_header(rows, height, width):
+    """
+    Decodes the binary payload header from the first rows of an image, without needing the rest of its pixels.
+
+    Parameters:
+        rows (numpy.ndarray): At least the first HEADER_ROWS rows of the image.
+        height (int): Height of the whole image in pixels.
+        width (int): Width of the whole image in pixels.
+
+    Returns:
+        PayloadHeader: The header, or None if the rows hold no valid header.
+    """
+    header = unpack_header(np.packbits(extract_bits(payload_view(rows[:HEADER_ROWS]), count=HEADER_BITS)).tobytes())
+    if header is None:
+        return None
+    channels = payload_view(rows, header.flags).shape[2]
+    region_size = max(height - header.start_row, 0) * max(width - header.start_col, 0) * channels
+    if header.start_row < HEADER_ROWS or header.length * 8 > region_size * flags_density(header.flags):  # offsets
+        # that point outside the image
+        return None
+    return header
 
 
 class Decoding:
@@ -39,18 +268,35 @@ class Decoding:
     Attributes:
         image_path (str): Path of the image file.
         key (str): Fernet key for decryption.
+        image (numpy.ndarray): The already loaded image, or None to load it from image_path.
+        metrics (StageMetrics): Wall time, bytes processed and peak memory of each stage of the last decoder() run.
+        progress (callable): Called as progress(done_bits, total_bits) while the payload is extracted, or None.
+        cancel_event (threading.Event): Set from another thread to stop decoding, or None.
+        codec (int): Id of the codec the text was compressed with, read from the header.
+        threads (int): Number of threads the payload is extracted on, in contiguous bands (see extract_bands).
     """
 
-    def __init__(self, image_path, key):
+    def __init__(self, image_path, key, image=None, progress=None, cancel_event=None, threads=1):
         """
         Initializes the Decoding object with the specified image path and encryption key.
 
         Parameters:
             image_path (str): The file path of the image that contains the encoded text.
             key (str): The Fernet key used for decrypting the encoded text extracted from the image.
+            image (numpy.ndarray): The already loaded image, or None to load it from image_path.
+            progress (callable): Called as progress(done_bits, total_bits) while the payload is extracted, or None.
+            cancel_event (threading.Event): Set from another thread to stop decoding, or None.
+            threads (int): Number of threads to extract the payload on. With more than one, a PNG image written in
+                segments (see PngStream.write_png_segments) is also decoded in parallel.
         """
         self.image_path = image_path
         self.key = key
+        self.image = image
+        self.metrics = None
+        self.progress = progress
+        self.cancel_event = cancel_event
+        self.codec = CODEC_NONE
+        self.threads = threads
 
     def decryption(self, cipher_text):
         """
@@ -63,10 +309,12 @@ class Decoding:
         """
         try:
             cipher_key = Fernet(self.key)
-            text = cipher_key.decrypt(cipher_text).decode()
+            text = decompress(cipher_key.decrypt(cipher_text), self.codec).decode()
             return text, None
         except cryptography.fernet.InvalidToken:
             return None, "Error! Invalid Key"
+        except ValueError as error:
+            return None, f"Error! {error}"
 
     def decoder(self):
         """
@@ -74,30 +322,226 @@ class Decoding:
         Returns:
             tuple: A tuple containing the result message (str) and the decoded text (str) or None.
         """
-        if not self.image_path.lower().endswith('.png'):
-            return "Error: This function only supports PNG files.", None
-        img = cv2.imread(self.image_path)
-        start_row, start_col = decode_start(img)
-        binary = ''
-        delimiter_found = False
-        for i in range(start_row, img.shape[0]):  # iterate through the rows of image pixels
-            if delimiter_found:
+        if not is_lossless(self.image_path):
+            return FORMAT_ERROR, None
+        self.metrics = StageMetrics('decode', self.image_path)
+        with self.metrics.stage('read') as stage:
+            img = self.image if self.image is not None else load_image(self.image_path, self.threads)
+            if img is None:
+                return "Error: Could not read the image.", None
+            stage['bytes'] = img.nbytes
+        with self.metrics.stage('header'):
+            header = decode_header(img)
+        if header is not None and header.flags & FLAG_STREAM:
+            return "Error: The image holds an encoded file. Decode it to a file instead.", None
+        if header is not None and header.flags & FLAG_SLOTS:
+            return SLOTS_ERROR, None
+        return self.extract_text(img, header)
+
+    def extract_text(self, img, header):
+        """
+        Extracts and decrypts the text payload of an image already in memory.
+
+        Parameters:
+            img (numpy.ndarray): The image array to read from.
+            header (PayloadHeader): The header of the image, or None for a legacy image.
+
+        Returns:
+            tuple: A tuple containing the result message (str) and the decoded text (str) or None.
+        """
+        if self.metrics is None:  # called on its own rather than from decoder()
+            self.metrics = StageMetrics('decode', self.image_path)
+        self.codec = flags_codec(header.flags) if header is not None else CODEC_NONE
+        with self.metrics.stage('extract') as stage:
+            if header is not None and self.threads > 1:
+                cipher_text = self.extract_bands(img, header)
+                if cipher_text is None:
+                    return "Error: Decoding cancelled.", None
+            elif header is not None:
+                reader = self.payload_reader(img, header)
+                pieces = []
+                for offset in range(0, header.length, EXTRACT_STEP):  # extract in steps so progress can be reported
+                    if self.cancel_event is not None and self.cancel_event.is_set():
+                        return "Error: Decoding cancelled.", None
+                    pieces.append(reader.read(min(EXTRACT_STEP, header.length - offset)))
+                    if self.progress:
+                        self.progress(min(offset + EXTRACT_STEP, header.length) * 8, header.length * 8)
+                cipher_text = b''.join(pieces)
+            else:
+                cipher_text = self.legacy_payload(img)
+            stage['bytes'] = len(cipher_text or b'')
+        return self.finish(cipher_text)
+
+    def extract_bands(self, img, header):
+        """
+        Extracts the payload described by a header as contiguous bands read by separate readers on a pool of
+        self.threads threads. NumPy releases the GIL while it masks and unpacks the channels, so the bands are read
+        in parallel.
+
+        Parameters:
+            img (numpy.ndarray): The image array to read from.
+            header (PayloadHeader): The header of the image.
+
+        Returns:
+            bytes: The encrypted payload, or None if decoding was cancelled.
+        """
+        size = band_length(header.length, self.threads, EXTRACT_STEP)
+
+        def read_band(offset):
+            if self.cancel_event is not None and self.cancel_event.is_set():
+                return None
+            reader = self.payload_reader(img, header)
+            reader.seek(offset)
+            return reader.read(min(size, header.length - offset))
+
+        pieces = []
+        with ThreadPoolExecutor(max_workers=self.threads) as executor:
+            for offset, piece in zip(range(0, header.length, size),
+                                     executor.map(read_band, range(0, header.length, size))):
+                if piece is None:
+                    return None
+                pieces.append(piece)
+                if self.progress:
+                    self.progress(min(offset + size, header.length) * 8, header.length * 8)
+        return b''.join(pieces)
+
+    def file_decoder(self, output_path):
+        """
+        Decodes a binary file encoded with Encoding.file_encoder. The payload is read, decrypted and written one
+        chunk at a time, so memory use does not grow with the file size.
+
+        Parameters:
+            output_path (str): Path of the file to write the decoded payload to.
+
+        Returns:
+            tuple: A tuple containing the result message (str) and the path of the decoded file (str) or None.
+        """
+        if not is_lossless(self.image_path):
+            return FORMAT_ERROR, None
+        img = self.image if self.image is not None else load_image(self.image_path, self.threads)
+        if img is None:
+            return "Error: Could not read the image.", None
+        header = decode_header(img)
+        if header is None or not header.flags & FLAG_STREAM:
+            return "Error: No encoded file found in the image.", None
+        with open(output_path, 'wb') as output:
+            result = self.extract_file(img, header, output)
+        if "Error" in result:
+            os.remove(output_path)  # don't leave a partial file behind
+            return result, None
+        return result, output_path
+
+    def extract_file(self, img, header, output):
+        """
+        Extracts and decrypts the binary payload of an image already in memory, one chunk at a time.
+
+        Parameters:
+            img (numpy.ndarray): The image array to read from.
+            header (PayloadHeader): The header of the image, which must have FLAG_STREAM set.
+            output (file object): Where to write the decoded payload, opened in binary mode.
+
+        Returns:
+            str: The result message.
+        """
+        reader = self.payload_reader(img, header)
+        if unpack_shard_header(reader.read(min(SHARD_SIZE, header.length))) is not None:
+            return SHARD_ERROR
+        reader.seek(0)
+        try:
+            for chunk in decrypt_chunks(self.key, reader.read, header.length):
+                output.write(chunk)
+        except (cryptography.exceptions.InvalidTag, ValueError):
+            return "Decryption failed with error: Error! Invalid Key"
+        return f"File decoded successfully. \nKey used to decode: {self.key}"
+
+    def payload_reader(self, img, header):
+        """
+        Returns:
+            BitReader: The reader of the payload described by the header, row by row or scattered.
+        """
+        view = payload_view(img, header.flags)
+        if header.flags & FLAG_SCATTER:
+            return ScatterReader(view, self.key, flags_density(header.flags))
+        return BitReader(view, header.start_row, header.start_col, flags_density(header.flags))
+
+    def legacy_payload(self, img):
+        """
+        Reads the payload of a legacy image, which stores its offset as text and ends its payload with a delimiter.
+
+        Parameters:
+            img (numpy.ndarray): The image array to read from.
+
+        Returns:
+            bytes: The encrypted payload, or None if no offset or no end delimiter was found.
+        """
+        start = decode_start(img)
+        if start is None:
+            return None
+        start_row, start_col = start
+        stream = bytearray()
+        delimiter_index = -1
+        for chunk in iter_packed_bits(payload_view(img), start_row, start_col):
+            search_from = max(len(stream) - len(END_DELIMITER) + 1, 0)  # the delimiter may straddle two chunks
+            stream += chunk
+            delimiter_index = stream.find(END_DELIMITER, search_from)
+            if delimiter_index != -1:
                 break
-            for j in range(start_col, img.shape[1]):  # iterate through the columns of image pixels
-                for color in range(3):  # iterate through the color channels
-                    binary += str(img[i, j, color] & 1)
-                    if binary.endswith('1111111111111110'):  # Checks for the end delimiter in binary
-                        delimiter_found = True
-                        break
-        if not binary:
+        if delimiter_index == -1:
+            return None
+        return bytes(stream[:delimiter_index])
+
+    def finish(self, cipher_text):
+        """
+        Decrypts an extracted payload and builds the result returned by the decoder.
+
+        Parameters:
+            cipher_text (bytes): The encrypted payload, or None if none was found.
+
+        Returns:
+            tuple: A tuple containing the result message (str) and the decoded text (str) or None.
+        """
+        if cipher_text is None:
             return "Error: No encoded message found in the image.", None
-        delimiter_index = binary.find('1111111111111110')
-        binary = binary[:delimiter_index]
-        cipher_text = int(binary, 2).to_bytes((len(binary) + 7) // 8, 'big')
-        decrypted_text, error = self.decryption(cipher_text)
+        with self.metrics.stage('decrypt', len(cipher_text)):
+            decrypted_text, error = self.decryption(cipher_text)
         if error:
             return f"Decryption failed with error: {error}", None
         if decrypted_text == "":
             return f"Text decoded successfully.\nThere was no text encoded in the Image.\nKey used to decode: {self.key}", decrypted_text
         else:
             return f"Text decoded successfully. \nKey used to decode: {self.key}", decrypted_text
+
+
+def decode_bytes(png_bytes, key):
+    """
+    Decodes the payload of a PNG image held in memory, without touching the disk.
+
+    Parameters:
+        png_bytes (bytes): The encoded PNG image.
+        key (str): The Fernet key the payload was encrypted with.
+
+    Returns:
+        tuple: A tuple containing the result message (str) and the decoded payload or None. The payload is text (str)
+        for images written by Encoding.encoder, and bytes for images written by Encoding.file_encoder.
+    """
+    if not png_bytes.startswith(PNG_SIGNATURE):
+        return "Error: This function only supports PNG files.", None
+    import cv2  # imported on first use, so scanning images for headers never loads OpenCV
+    decoder = Decoding('', key)
+    decoder.metrics = StageMetrics('decode', '<bytes>')
+    with decoder.metrics.stage('read', len(png_bytes)):
+        img = cv2.imdecode(np.frombuffer(png_bytes, dtype=np.uint8), cv2.IMREAD_UNCHANGED)
+    if img is None:
+        return "Error: Could not read the image.", None
+    with decoder.metrics.stage('header'):
+        header = decode_header(img)
+    if header is not None and header.flags & FLAG_SLOTS:
+        return SLOTS_ERROR, None
+    if header is None or not header.flags & FLAG_STREAM:
+        return decoder.extract_text(img, header)
+    output = io.BytesIO()
+    with decoder.metrics.stage('extract', header.length):
+        result = decoder.extract_file(img, header, output)
+    if "Error" in result:
+        return result, None
+    return result, output.getvalue()
@@ -1,9 +1,16 @@
 import tkinter as tk
-from tkinter import messagebox, filedialog
+from tkinter import messagebox, filedialog, ttk
 import cv2
+import os
+import queue
 import sys
-from Encoding import Encoding, calculate_capacity
+import threading
+from functools import lru_cache
+import numpy as np
+from Capacity import calculate_capacity
+from Encoding import Encoding
 from Decoding import Decoding
+from ImageCache import LOSSLESS_FORMATS, is_lossless, load_image
 import random
 from cryptography.fernet import Fernet
 
@@ -12,6 +19,10 @@ FONT_BUTTONS = ('Helvetica', 16, 'bold')
 FONT_LABEL = ('Helvetica', 14, 'bold')
 FONT_HEADING = ('Helvetica', 24, 'bold')
 FONT_ENTRY = ('Helvetica', 14)
+THUMBNAIL_SIZE = (300, 300)
+THUMBNAIL_CACHE_SIZE = 16  # thumbnails kept, so reopening an image doesn't decode it again
+POLL_INTERVAL = 50  # milliseconds between checks for updates posted by worker threads
+IMAGE_PATTERNS = ' '.join(f'*{extension}' for extension in LOSSLESS_FORMATS)  # file dialog filter
 
 
 def exit_program():
@@ -21,6 +32,48 @@ def exit_program():
     sys.exit()
 
 
+@lru_cache(maxsize=THUMBNAIL_CACHE_SIZE)
+def _file_thumbnail(image_path, mtime_ns, size):
+    """
+    Builds the thumbnail of an image file. The modification time and size are part of the cache key, so a file
+    changed on disk gets a new thumbnail.
+    """
+    img = load_image(image_path)
+    if img is None:
+        return None
+    return thumbnail_png(img)
+
+
+def thumbnail_png(img):
+    """
+    Shrinks a loaded image to a thumbnail in PNG format, with 8-bit channels so Tk can display 16-bit images too.
+    """
+    small = cv2.resize(img, THUMBNAIL_SIZE)
+    if small.dtype != np.uint8:
+        small = (small >> 8).astype(np.uint8)
+    return cv2.imencode('.png', small)[1].tobytes()
+
+
+def thumbnail(image):
+    """
+    Builds a thumbnail as PNG bytes, which tk.PhotoImage can display. This is slow for large images, so it is meant
+    to run on a worker thread; creating the PhotoImage itself must stay on the Tk thread.
+
+    Parameters:
+        image (str or numpy.ndarray): The path to the image file, or the already loaded image.
+
+    Returns:
+        bytes: The thumbnail in PNG format, or None if the image could not be read.
+    """
+    if isinstance(image, np.ndarray):
+        return thumbnail_png(image)
+    try:
+        stat = os.stat(image)
+    except OSError:
+        return None
+    return _file_thumbnail(os.path.abspath(image), stat.st_mtime_ns, stat.st_size)
+
+
 class SteganographyAppGUI:
     """
     Graphical User Interface for the steganography application.
@@ -47,15 +100,135 @@ class SteganographyAppGUI:
         self.start_col = None
         self.decoded_text_label = None
         self.capacity = None
+        self.progress_bar = None
+        self.action_button = None
+        self.cancel_button = None
+        self.cancel_event = None
+        self.ui_queue = queue.Queue()  # callables posted by worker threads, run on the Tk thread by process_queue
+        self.master.after(POLL_INTERVAL, self.process_queue)
 
-    def home_page(self):
+    def process_queue(self):
         """
-        Displays the home page of the GUI application.
-        Provides options to navigate to encoding, decoding, or exit the application.
+        Runs the updates posted by worker threads. Tk widgets may only be used from the thread running the main
+        loop, so workers never touch them directly.
+        """
+        while True:
+            try:
+                callback = self.ui_queue.get_nowait()
+            except queue.Empty:
+                break
+            callback()
+        self.master.after(POLL_INTERVAL, self.process_queue)
+
+    def post_to_page(self, callback):
+        """
+        Wraps a callback so worker threads can run it on the Tk thread. The callback is dropped if the user has left
+        the page it was meant for.
+
+        Parameters:
+            callback (callable): The update to run on the Tk thread.
+
+        Returns:
+            callable: A thread-safe function taking the same arguments as the callback.
+        """
+        page = self.current_page
+
+        def post(*args):
+            self.ui_queue.put(lambda: self.current_page is page and callback(*args))
+        return post
+
+    def run_in_background(self, work, done, failed=None):
         """
+        Runs work on a worker thread and passes its result to done on the Tk thread.
+
+        Parameters:
+            work (callable): The slow part, which must not touch any widget.
+            done (callable): Called with the result of work.
+            failed (callable): Called, after the error is shown, if work raised an exception.
+        """
+        def report(error):
+            messagebox.showerror("Error", f"Error: {error}")
+            if failed:
+                failed()
+        finish = self.post_to_page(done)
+        fail = self.post_to_page(report)
+
+        def worker():
+            try:
+                result = work()
+            except Exception as e:
+                fail(e)
+                return
+            finish(result)
+        threading.Thread(target=worker, daemon=True).start()
+
+    def start_task(self):
+        """
+        Shows the progress bar of a new encode or decode and enables its cancel button.
+
+        Returns:
+            threading.Event: Set when the user cancels the task.
+        """
+        self.cancel_event = threading.Event()
+        self.progress_bar.config(value=0, maximum=1)
+        self.action_button.config(state='disabled')
+        self.cancel_button.config(state='normal')
+        return self.cancel_event
+
+    def finish_task(self):
+        """
+        Resets the buttons once an encode or decode has finished or was cancelled.
+        """
+        self.cancel_event = None
+        self.action_button.config(state='normal')
+        self.cancel_button.config(state='disabled')
+
+    def cancel_task(self):
+        """
+        Asks the running encode or decode, if any, to stop at its next step.
+        """
+        if self.cancel_event:
+            self.cancel_event.set()
+
+    def update_progress(self, done, total):
+        """
+        Moves the progress bar.
+
+        Parameters:
+            done (int): Bits embedded or extracted so far.
+            total (int): Bits to embed or extract in all.
+        """
+        self.progress_bar.config(maximum=max(total, 1), value=done)
+
+    def add_progress_bar(self, frame, row):
+        """
+        Adds the progress bar and cancel button of an encode or decode page.
+
+        Parameters:
+            frame (tk.Frame): The frame holding the page controls.
+            row (int): The grid row to put them on.
+        """
+        self.progress_bar = ttk.Progressbar(frame, mode='determinate', length=400)
+        self.progress_bar.grid(row=row, column=1, sticky='we', pady=5)
+        self.cancel_button = tk.Button(frame, text="Cancel", command=self.cancel_task, state='disabled',
+                                       font=FONT_BUTTONS, bd=5)
+        self.cancel_button.grid(row=row, column=2, padx=10, pady=5)
+
+    def show_page(self):
+        """
+        Replaces the current page with a new, empty one, cancelling any task still running on the old page.
+        """
+        self.cancel_task()
         if self.current_page:
             self.current_page.destroy()
         self.current_page = tk.Frame(self.master)
+
+    def home_page(self):
+        """
+        Displays the home page of the GUI application.
+        Provides options to navigate to encoding, decoding, or exit the application.
+        """
+        self.show_page()
         self.current_page.pack(fill='both', expand=True)
         self.background_image = tk.PhotoImage(file='Images/background.png')
         background_label = tk.Label(self.current_page, text="Steganography App", image=self.background_image)
@@ -75,16 +248,29 @@ class SteganographyAppGUI:
 
     def show_image(self, image_path, label_text='', side=tk.LEFT):
         """
-        Displays an image on the current page of the GUI.
+        Displays an image on the current page of the GUI. The thumbnail is built on a worker thread, so large images
+        don't freeze the window.
+
+        Parameters:
+            image_path (str or numpy.ndarray): The path to the image file to display, or the already loaded image.
+            label_text (str): Text to label the image with.
+            side (tk.SIDE): The side of the page to pack the image widget on.
+        """
+        self.run_in_background(lambda: thumbnail(image_path),
+                               lambda data: self.place_image(data, label_text, side))
+
+    def place_image(self, data, label_text, side):
+        """
+        Puts a thumbnail built by show_image on the current page.
 
         Parameters:
-            image_path (str): The path to the image file to display.
+            data (bytes): The thumbnail in PNG format, or None if the image could not be read.
             label_text (str): Text to label the image with.
             side (tk.SIDE): The side of the page to pack the image widget on.
         """
-        img = cv2.imread(image_path)
-        img_resized = cv2.resize(img, (300, 300))
-        img = tk.PhotoImage(data=cv2.imencode('.png', img_resized)[1].tobytes())
+        if data is None:
+            return
+        img = tk.PhotoImage(data=data)
         if label_text == 'Original Image:':
             if self.original_image_label:
                 self.original_image_label.destroy()
@@ -110,9 +296,7 @@ class SteganographyAppGUI:
         """
         Displays the encoding page where users can choose an image and enter text to encode.
         """
-        if self.current_page:
-            self.current_page.destroy()
-        self.current_page = tk.Frame(self.master)
+        self.show_page()
         self.current_page.pack()
         heading_label = tk.Label(self.current_page, text="Encode Page", font=FONT_HEADING)
         heading_label.pack()
@@ -139,12 +323,14 @@ class SteganographyAppGUI:
         generate_key_button.grid(row=2, column=2, padx=5)
         encode_button = tk.Button(top_frame, text="Encode", command=self.encode_text, **button_config)
         encode_button.grid(row=3, column=1, padx=10, pady=5)
+        self.action_button = encode_button
         back_button = tk.Button(top_frame, text="Back", command=self.home_page, **button_config)
         back_button.grid(row=4, column=1, padx=10, pady=5)
+        self.add_progress_bar(top_frame, 5)
         self.encoded_image_label = tk.Label(top_frame, text="", font=FONT_LABEL)
-        self.encoded_image_label.grid(row=5, column=1, sticky='w', pady=5)
+        self.encoded_image_label.grid(row=6, column=1, sticky='w', pady=5)
         self.key_used_label = tk.Label(top_frame, text="", font=FONT_LABEL)
-        self.key_used_label.grid(row=6, column=1, sticky='w', pady=5)
+        self.key_used_label.grid(row=7, column=1, sticky='w', pady=5)
         # Set the window to zoomed state
 
     def open_file_encode(self):
@@ -153,46 +339,56 @@ class SteganographyAppGUI:
         """
         self.image_entry.config(state='normal')
         self.image_entry.delete(0, tk.END)
-        file_path = filedialog.askopenfilename(filetypes=[("PNG files", "*.png")])
+        file_path = filedialog.askopenfilename(filetypes=[("Images", IMAGE_PATTERNS)])
         if file_path:
-            if not file_path.lower().endswith('.png'):
-                messagebox.showerror("Error", "Please select a valid PNG image.")
+            if not is_lossless(file_path):
+                messagebox.showerror("Error", "Please select a PNG, BMP, TIFF or WebP image.")
                 return
             self.image_entry.insert(0, file_path)
             self.image_entry.config(state='disabled')
-            img = cv2.imread(file_path)
-            self.start_row = random.randint(5, img.shape[0] - 1)
-            self.start_col = random.randint(0, img.shape[1] - 1)
-            self.capacity = calculate_capacity(file_path, self.start_row, self.start_col)
-            if self.capacity_label:
-                self.capacity_label.destroy()
-            self.capacity_label = tk.Label(self.current_page, text=f"Maximum Capacity: {self.capacity} characters",
-                                           font=FONT_LABEL)
-            self.capacity_label.pack(pady=5)
-            self.show_image(file_path, "Original Image:")
+            self.run_in_background(lambda: load_image(file_path), lambda img: self.image_opened(file_path, img))
 
-    def encode_text(self):
+    def image_opened(self, file_path, img):
         """
-        Encodes the provided text into the selected image using the provided Fernet key.
+        Shows the capacity and thumbnail of the image chosen for encoding, once a worker thread has loaded it.
+
+        Parameters:
+            file_path (str): The path to the image file.
+            img (numpy.ndarray): The loaded image, or None if it could not be read.
         """
-        image_path = self.image_entry.get()
-        if not image_path.lower().endswith('.png'):
-            messagebox.showerror("Error", "Please select a valid PNG image.")
-            return
-        img = cv2.imread(image_path)
         if img is None:
             messagebox.showerror("Error", "Could not read the image. Please check the image path.")
             return
-        if self.start_row is None or self.start_col is None:
-            self.start_row = random.randint(5, img.shape[0] - 1)
-            self.start_col = random.randint(0, img.shape[1] - 1)
-        if self.capacity is None:
-            self.capacity = calculate_capacity(image_path, self.start_row, self.start_col)
-            if self.capacity_label:
-                self.capacity_label.destroy()
-            self.capacity_label = tk.Label(self.current_page, text=f"Maximum Capacity: {self.capacity} characters",
-                                           font=FONT_LABEL)
-            self.capacity_label.pack(pady=5)
+        start_row = random.randint(5, img.shape[0] - 1)
+        start_col = random.randint(0, img.shape[1] - 1)
+        self.show_capacity(start_row, start_col, calculate_capacity(img, start_row, start_col))
+        self.show_image(file_path, "Original Image:")
+
+    def show_capacity(self, start_row, start_col, capacity):
+        """
+        Records the start position chosen for the image being encoded and shows its capacity.
+
+        Parameters:
+            start_row (int): The row the payload starts at.
+            start_col (int): The column the payload starts at.
+            capacity (int): The number of characters the image can hold from that position.
+        """
+        self.start_row, self.start_col, self.capacity = start_row, start_col, capacity
+        if self.capacity_label:
+            self.capacity_label.destroy()
+        self.capacity_label = tk.Label(self.current_page, text=f"Maximum Capacity: {self.capacity} characters",
+                                       font=FONT_LABEL)
+        self.capacity_label.pack(pady=5)
+
+    def encode_text(self):
+        """
+        Encodes the provided text into the selected image using the provided Fernet key. The image is loaded on the
+        worker thread too, so a large carrier never freezes the window.
+        """
+        image_path = self.image_entry.get()
+        if not is_lossless(image_path):
+            messagebox.showerror("Error", "Please select a PNG, BMP, TIFF or WebP image.")
+            return
         text = self.text_entry.get()
         key = self.key_entry.get()
         try:
@@ -200,8 +396,37 @@ class SteganographyAppGUI:
         except Exception as e:
             messagebox.showerror("Error", "Invalid Fernet Key. Please enter a valid key.")
             return
-        encoder = Encoding(image_path, text, key, self.start_row, self.start_col)
-        result, encoded_image_path = encoder.encoder()
+        progress = self.post_to_page(self.update_progress)
+        cancel_event = self.start_task()
+        start_row, start_col, capacity = self.start_row, self.start_col, self.capacity
+
+        def encode():  # runs on the worker thread, so it must not touch any widget
+            img = load_image(image_path)
+            if img is None:
+                raise ValueError("Could not read the image. Please check the image path.")
+            row, col = start_row, start_col
+            if row is None or col is None:
+                row, col = random.randint(5, img.shape[0] - 1), random.randint(0, img.shape[1] - 1)
+            encoder = Encoding(image_path, text, key, row, col, image=img, progress=progress,
+                               cancel_event=cancel_event)
+            known = capacity if capacity is not None else calculate_capacity(img, row, col)
+            return (encoder, known) + encoder.encoder()
+        self.run_in_background(encode, lambda outcome: self.text_encoded(key, *outcome), self.finish_task)
+
+    def text_encoded(self, key, encoder, capacity, result, encoded_image_path):
+        """
+        Shows the outcome of an encode run by encode_text on a worker thread.
+
+        Parameters:
+            key (str): The Fernet key used.
+            encoder (Encoding): The encoder that ran.
+            capacity (int): The capacity of the image from the start position the encoder used.
+            result (str): The result message of the encoder.
+            encoded_image_path (str): The path of the encoded image.
+        """
+        self.finish_task()
+        if self.capacity is None:  # the image was not opened through the file dialog
+            self.show_capacity(encoder.start_row, encoder.start_col, capacity)
         if "Error:" in result:
             messagebox.showerror("Error", result)
             return
@@ -212,7 +437,7 @@ class SteganographyAppGUI:
                                                 font=FONT_LABEL)
             self.encoded_image_label.pack(pady=5)
         self.show_result_message("Encoding successful", result, key)
-        self.show_image(encoded_image_path, "Encoded Image:")
+        self.show_image(encoder.encoded_image, "Encoded Image:")
 
     def generate_key(self):
         """
@@ -241,7 +466,7 @@ class SteganographyAppGUI:
         """
         self.image_entry.config(state='normal')
         self.image_entry.delete(0, tk.END)
-        file_path = filedialog.askopenfilename(filetypes=[("PNG files", "*.png")])
+        file_path = filedialog.askopenfilename(filetypes=[("Images", IMAGE_PATTERNS)])
         if file_path:
             self.image_entry.insert(0, file_path)
             self.image_entry.config(state='disabled')
@@ -252,8 +477,8 @@ class SteganographyAppGUI:
         Decodes text from the selected encoded image using the provided Fernet key.
         """
         image_path = self.image_entry.get()
-        if not image_path.lower().endswith('.png'):
-            messagebox.showerror("Error", "Please select a valid PNG image.")
+        if not is_lossless(image_path):
+            messagebox.showerror("Error", "Please select a PNG, BMP, TIFF or WebP image.")
             return
         key = self.key_entry.get()
         try:
@@ -261,8 +486,21 @@ class SteganographyAppGUI:
         except Exception as e:
             messagebox.showerror("Error", "Invalid Fernet Key. Please enter a valid key.")
             return
-        decoder = Decoding(image_path, key)
-        result, decoded_text = decoder.decoder()
+        progress = self.post_to_page(self.update_progress)
+        decoder = Decoding(image_path, key, progress=progress, cancel_event=self.start_task())
+        self.run_in_background(decoder.decoder, lambda outcome: self.text_decoded(key, *outcome),
+                               self.finish_task)
+
+    def text_decoded(self, key, result, decoded_text):
+        """
+        Shows the outcome of a decode run by decode_text on a worker thread.
+
+        Parameters:
+            key (str): The Fernet key used.
+            result (str): The result message of the decoder.
+            decoded_text (str): The decoded text, or None if decoding failed.
+        """
+        self.finish_task()
         if self.decoded_text_label:
             self.decoded_text_label.config(text=f"Decoded Text: {decoded_text}")
         else:
@@ -274,9 +512,7 @@ class SteganographyAppGUI:
         """
         Displays the decoding page where users can choose an encoded image and enter a Fernet key to decode text.
         """
-        if self.current_page:
-            self.current_page.destroy()
-        self.current_page = tk.Frame(self.master)
+        self.show_page()
         self.current_page.pack()
         heading_label = tk.Label(self.current_page, text="Decode Page", font=FONT_HEADING)
         heading_label.pack()
@@ -297,9 +533,11 @@ class SteganographyAppGUI:
         self.key_entry.grid(row=1, column=1, sticky='we')
         decode_button = tk.Button(top_frame, text="Decode", command=self.decode_text, **button_config)
         decode_button.grid(row=2, column=1, padx=10, pady=5)
+        self.action_button = decode_button
         back_button = tk.Button(top_frame, text="Back", command=self.home_page, **button_config)
         back_button.grid(row=3, column=1, padx=10, pady=5)
+        self.add_progress_bar(top_frame, 4)
         self.decoded_text_label = tk.Label(top_frame, text="", font=FONT_LABEL)
-        self.decoded_text_label.grid(row=4, column=1, sticky='w', pady=5)
+        self.decoded_text_label.grid(row=5, column=1, sticky='w', pady=5)
         self.key_used_label = tk.Label(top_frame, text="", font=FONT_LABEL)
-        self.key_used_label.grid(row=5, column=1, sticky='w', pady=5)
+        self.key_used_label.grid(row=6, column=1, sticky='w', pady=5)
@@ -0,0 +1,229 @@
+import struct
+import zlib
+from collections import namedtuple
+
+MAGIC = b'STG'  # marks images written with a binary header (legacy images start with an ASCII 'row$col##' offset)
+VERSION = 1
+HEADER_FORMAT = '>3sBBIIQ'  # magic, version, flags, start row, start column, payload length in bytes
+CHECKSUM_FORMAT = '>I'  # CRC-32 of the fields above
+HEADER_SIZE = struct.calcsize(HEADER_FORMAT) + struct.calcsize(CHECKSUM_FORMAT)
+HEADER_BITS = HEADER_SIZE * 8
+HEADER_ROWS = 4  # the header lives in the first 4 rows of the image, like the legacy offset did
+MAX_DENSITY = 4  # highest number of least significant bits used per colour channel
+FLAG_DENSITY = 0x03  # flag bits holding the number of bits per channel, minus one
+FLAG_STREAM = 0x04  # the payload is a binary file encrypted in authenticated chunks (see StreamCipher)
+FLAG_SCATTER = 0x08  # the payload is spread over the pixels in an order seeded by the key (see Scatter)
+FLAG_CODEC = 0x30  # flag bits holding the id of the codec the payload was compressed with before encryption (see Codec)
+FLAG_SLOTS = 0x40  # the payload is a container of independent messages with a slot table (see Container)
+FLAG_ALL_CHANNELS = 0x80  # the payload uses every channel of the image, alpha included, not only the first three
+SHARD_MAGIC = b'SHD'  # starts a payload that is one shard of a larger payload spread over several images (see Shard)
+SHARD_VERSION = 1
+SHARD_FORMAT = '>3sB16sIIQ'  # magic, version, payload id, shard index, shard count, encrypted payload length
+SHARD_SIZE = struct.calcsize(SHARD_FORMAT) + struct.calcsize(CHECKSUM_FORMAT)  # followed by a CRC-32 like the header
+VIDEO_MAGIC = b'STV'  # marks the header in the first frame of a video or frame sequence (see Video)
+VIDEO_VERSION = 1
+VIDEO_FORMAT = '>3sBBIIQ'  # magic, version, flags, first frame holding payload, number of such frames, payload length
+VIDEO_SIZE = struct.calcsize(VIDEO_FORMAT) + struct.calcsize(CHECKSUM_FORMAT)  # as long as the image header, so it
+# fits the same HEADER_ROWS rows
+
+PayloadHeader = namedtuple('PayloadHeader', ['version', 'flags', 'start_row', 'start_col', 'length'])
+ShardHeader = namedtuple('ShardHeader', ['payload_id', 'index', 'count', 'length'])
+VideoHeader = namedtuple('VideoHeader', ['flags', 'start_frame', 'frames', 'length'])
+
+
+def pack_header(start_row, start_col, length, flags=0):
+    """
+    Builds the binary header stored in front of an encoded image.
+
+    Parameters:
+        start_row (int): Row where the payload starts.
+        start_col (int): Column where the payload starts.
+        length (int): Length of the payload in bytes.
+        flags (int): Bit field describing how the payload is stored.
+
+    Returns:
+        bytes: The packed header, HEADER_SIZE bytes long.
+    """
+    fields = struct.pack(HEADER_FORMAT, MAGIC, VERSION, flags, start_row, start_col, length)
+    return fields + struct.pack(CHECKSUM_FORMAT, zlib.crc32(fields))
+
+
+def unpack_header(data):
+    """
+    Parses and validates a binary header.
+
+    Parameters:
+        data (bytes): At least HEADER_SIZE bytes read from the start of an image.
+
+    Returns:
+        PayloadHeader: The parsed header, or None if the data does not hold a valid header.
+    """
+    if len(data) < HEADER_SIZE:
+        return None
+    fields, checksum = data[:HEADER_SIZE - 4], data[HEADER_SIZE - 4:HEADER_SIZE]
+    magic, version, flags, start_row, start_col, length = struct.unpack(HEADER_FORMAT, fields)
+    if magic != MAGIC or version != VERSION:
+        return None
+    if struct.unpack(CHECKSUM_FORMAT, checksum)[0] != zlib.crc32(fields):
+        return None
+    return PayloadHeader(version, flags, start_row, start_col, length)
+
+
+def pack_shard_header(payload_id, index, count, length):
+    """
+    Builds the record stored in front of each shard of a payload spread over several images.
+
+    Parameters:
+        payload_id (bytes): 16 bytes shared by every shard of the payload.
+        index (int): Position of the shard in the payload, from 0.
+        count (int): Number of shards of the payload.
+        length (int): Length of the whole encrypted payload in bytes.
+
+    Returns:
+        bytes: The packed record, SHARD_SIZE bytes long.
+    """
+    fields = struct.pack(SHARD_FORMAT, SHARD_MAGIC, SHARD_VERSION, payload_id, index, count, length)
+    return fields + struct.pack(CHECKSUM_FORMAT, zlib.crc32(fields))
+
+
+def unpack_shard_header(data):
+    """
+    Parses and validates the record in front of a shard.
+
+    Parameters:
+        data (bytes): At least SHARD_SIZE bytes read from the start of a payload.
+
+    Returns:
+        ShardHeader: The parsed record, or None if the payload is not a shard.
+    """
+    if len(data) < SHARD_SIZE:
+        return None
+    fields, checksum = data[:SHARD_SIZE - 4], data[SHARD_SIZE - 4:SHARD_SIZE]
+    magic, version, payload_id, index, count, length = struct.unpack(SHARD_FORMAT, fields)
+    if magic != SHARD_MAGIC or version != SHARD_VERSION or index >= count:
+        return None
+    if struct.unpack(CHECKSUM_FORMAT, checksum)[0] != zlib.crc32(fields):
+        return None
+    return ShardHeader(payload_id, index, count, length)
+
+
+def pack_video_header(start_frame, frames, length, flags=0):
+    """
+    Builds the header stored in the first frame of a video or frame sequence.
+
+    Parameters:
+        start_frame (int): First frame holding payload.
+        frames (int): Number of frames holding payload, from start_frame on.
+        length (int): Length of the encrypted payload in bytes.
+        flags (int): Bit field describing how the payload is stored.
+
+    Returns:
+        bytes: The packed header, VIDEO_SIZE bytes long.
+    """
+    fields = struct.pack(VIDEO_FORMAT, VIDEO_MAGIC, VIDEO_VERSION, flags, start_frame, frames, length)
+    return fields + struct.pack(CHECKSUM_FORMAT, zlib.crc32(fields))
+
+
+def unpack_video_header(data):
+    """
+    Parses and validates the header of a video or frame sequence.
+
+    Parameters:
+        data (bytes): At least VIDEO_SIZE bytes read from the start of the first frame.
+
+    Returns:
+        VideoHeader: The parsed header, or None if the data does not hold a valid header.
+    """
+    if len(data) < VIDEO_SIZE:
+        return None
+    fields, checksum = data[:VIDEO_SIZE - 4], data[VIDEO_SIZE - 4:VIDEO_SIZE]
+    magic, version, flags, start_frame, frames, length = struct.unpack(VIDEO_FORMAT, fields)
+    if magic != VIDEO_MAGIC or version != VIDEO_VERSION:
+        return None
+    if struct.unpack(CHECKSUM_FORMAT, checksum)[0] != zlib.crc32(fields):
+        return None
+    return VideoHeader(flags, start_frame, frames, length)
+
+
+def density_flags(density):
+    """
+    Builds the header flags recording how many bits per colour channel the payload uses.
+
+    Parameters:
+        density (int): Bits per channel, from 1 to MAX_DENSITY.
+
+    Returns:
+        int: The flag bits.
+    """
+    return (density - 1) & FLAG_DENSITY
+
+
+def flags_density(flags):
+    """
+    Reads the number of bits per colour channel from the header flags.
+
+    Parameters:
+        flags (int): The header flags.
+
+    Returns:
+        int: Bits per channel, from 1 to MAX_DENSITY.
+    """
+    return (flags & FLAG_DENSITY) + 1
+
+
+def codec_flags(codec_id):
+    """
+    Builds the header flags recording the codec the payload was compressed with.
+
+    Parameters:
+        codec_id (int): The codec id, from Codec.CODECS, or Codec.CODEC_NONE.
+
+    Returns:
+        int: The flag bits.
+    """
+    return (codec_id << 4) & FLAG_CODEC
+
+
+def flags_codec(flags):
+    """
+    Reads the id of the codec the payload was compressed with from the header flags.
+
+    Parameters:
+        flags (int): The header flags.
+
+    Returns:
+        int: The codec id, or Codec.CODEC_NONE if the payload is not compressed.
+    """
+    return (flags & FLAG_CODEC) >> 4
+
+
+def channel_flags(img):
+    """
+    Builds the header flags recording which channels of an image the payload uses: all of them when the image has
+    an alpha channel, which images encoded before alpha was used left alone.
+
+    Parameters:
+        img (numpy.ndarray): The image array.
+
+    Returns:
+        int: The flag bits.
+    """
+    return FLAG_ALL_CHANNELS if img.ndim == 3 and img.shape[2] > 3 else 0
+
+
+def payload_view(img, flags=0):
+    """
+    Views the channels of an image that hold the payload described by the header flags: every channel with
+    FLAG_ALL_CHANNELS set, otherwise only the first three. The header itself always uses the first three, so it
+    can be read before the flags are known. Grey images get a channel axis of their own.
+
+    Parameters:
+        img (numpy.ndarray): The image array, or some of its rows.
+        flags (int): The header flags.
+
+    Returns:
+        numpy.ndarray: A view of the image, shaped (rows, columns, channels).
+    """
+    if img.ndim == 2:
+        return img[:, :, None]
+    return img if flags & FLAG_ALL_CHANNELS or img.shape[2] <= 3 else img[:, :, :3]
@@ -0,0 +1,199 @@
+import os
+import struct
+import zlib
+from collections import namedtuple
+from functools import lru_cache
+
+CACHE_SIZE = 4  # decoded images kept in memory; a large carrier can take hundreds of MB, so keep this small
+INFO_CACHE_SIZE = 4096  # image dimensions kept in memory; each entry is a few dozen bytes
+PNG_SIGNATURE = b'\x89PNG\r\n\x1a\n'
+PNG_HEADER_SIZE = 29  # signature, then the length, type and data of the IHDR chunk, which must come first
+PNG_CHANNELS = {0: 1, 2: 3, 3: 3, 4: 4, 6: 4}  # channels each PNG colour type decodes to: palette images to 3 (4
+# with a tRNS chunk), and grey images with alpha to BGRA
+PNG_PALETTE = 3  # colour type of palette images
+LOSSLESS_FORMATS = {'.png': 4, '.bmp': 3, '.tif': 4, '.tiff': 4, '.webp': 4}  # extensions of the formats carriers
+# are read and written in, with the most channels OpenCV stores losslessly in each (BMP files are written without
+# alpha); WebP files are written in lossless mode
+FORMAT_ERROR = "Error: This program only supports PNG, BMP, TIFF and WebP files."
+
+ImageInfo = namedtuple('ImageInfo', ['height', 'width', 'channels', 'depth'])  # depth is in bits per channel
+
+
+@lru_cache(maxsize=CACHE_SIZE)
+def _read_image(path, mtime_ns, size):
+    """
+    Decodes an image from disk. Cached on (path, mtime, size) so a file that changes on disk is decoded again.
+    """
+    import cv2  # imported on first use, so reading image dimensions never loads OpenCV
+    img = cv2.imread(path, cv2.IMREAD_UNCHANGED)  # keep alpha channels and 16-bit samples, which hold payload too
+    if img is not None:
+        img.setflags(write=False)  # the array is shared between callers, so it must not be modified in place
+    return img
+
+
+def load_image(image_path, threads=1):
+    """
+    Loads an image, reusing the decoded pixels if the same unchanged file was loaded recently.
+
+    Parameters:
+        image_path (str): Path of the image file.
+        threads (int): With more than one, a PNG file tagged as written in segments (see
+            PngStream.write_png_segments) is decoded on that many threads instead, and not cached. Other images
+            are decoded by OpenCV as usual.
+
+    Returns:
+        numpy.ndarray: The read-only image array, with every channel and bit depth of the file (BGR, BGRA or grey,
+        8 or 16 bits), or None if the file could not be read. Callers that need to modify the pixels must work on a
+        copy.
+    """
+    try:
+        stat = os.stat(image_path)
+    except OSError:
+        return None
+    if threads > 1 and image_path.lower().endswith('.png'):
+        from PngStream import is_segmented, read_png_segments
+        try:  # only the chunk headers are read to find the tag; untagged files are left to OpenCV, which is faster
+            img = read_png_segments(image_path, threads) if is_segmented(image_path) else None
+        except (OSError, ValueError, struct.error, zlib.error):  # modified since it was tagged; decode it as usual
+            img = None
+        if img is not None:
+            img.setflags(write=False)
+            return img
+    return _read_image(os.path.abspath(image_path), stat.st_mtime_ns, stat.st_size)
+
+
+def png_info(data):
+    """
+    Reads the dimensions of a PNG image from its IHDR chunk.
+
+    Parameters:
+        data (bytes): At least the first PNG_HEADER_SIZE bytes of the file.
+
+    Returns:
+        ImageInfo: The dimensions of the image, or None if the data does not start like a PNG file.
+    """
+    if len(data) < PNG_HEADER_SIZE or not data.startswith(PNG_SIGNATURE) or data[12:16] != b'IHDR':
+        return None
+    width, height, depth, colour_type = struct.unpack('>IIBB', data[16:26])
+    if colour_type not in PNG_CHANNELS:
+        return None
+    return ImageInfo(height, width, PNG_CHANNELS[colour_type], depth)
+
+
+@lru_cache(maxsize=INFO_CACHE_SIZE)
+def _read_info(path, mtime_ns, size):
+    """
+    Reads the dimensions of an image file. Cached on (path, mtime, size) like _read_image.
+    """
+    with open(path, 'rb') as file:
+        data = file.read(PNG_HEADER_SIZE)
+        info = png_info(data)
+        if info is not None and data[25] == PNG_PALETTE and has_chunk(file, b'tRNS'):  # decodes with alpha
+            info = info._replace(channels=4)
+    if info is None:  # not a PNG file; other formats are decoded, which is slow but rare
+        import cv2
+        img = cv2.imread(path, cv2.IMREAD_UNCHANGED)
+        if img is None:
+            return None
+        info = ImageInfo(img.shape[0], img.shape[1], 1 if img.ndim == 2 else img.shape[2], img.dtype.itemsize * 8)
+    return info
+
+
+def has_chunk(file, chunk_type):
+    """
+    Checks whether a PNG file has a chunk of the given type before its image data, reading only the chunk headers.
+
+    Parameters:
+        file (file object): The PNG file, opened in binary mode.
+        chunk_type (bytes): The four-letter chunk type.
+
+    Returns:
+        bool: Whether the chunk was found.
+    """
+    file.seek(PNG_HEADER_SIZE + 4)  # past the CRC of the IHDR chunk
+    while True:
+        head = file.read(8)
+        if len(head) < 8 or head[4:] == b'IDAT':
+            return False
+        if head[4:] == chunk_type:
+            return True
+        file.seek(struct.unpack('>I', head[:4])[0] + 4, os.SEEK_CUR)  # skip the data and the CRC
+
+
+def image_info(image_path):
+    """
+    Reads the dimensions of an image without decoding its pixels: a PNG file is read only up to its IHDR chunk.
+
+    Parameters:
+        image_path (str): Path of the image file.
+
+    Returns:
+        ImageInfo: The height, width, number of channels and bits per channel of the image, or None if the file
+        could not be read.
+    """
+    try:
+        stat = os.stat(image_path)
+        return _read_info(os.path.abspath(image_path), stat.st_mtime_ns, stat.st_size)
+    except OSError:
+        return None
+
+
+def is_lossless(image_path):
+    """
+    Checks whether an image file is in one of LOSSLESS_FORMATS, judging by its extension.
+    """
+    return os.path.splitext(image_path)[1].lower() in LOSSLESS_FORMATS
+
+
+def format_channels(image_path, channels):
+    """
+    Returns:
+        int: How many of the given channels the format of an image file stores, so they can hold payload.
+    """
+    return min(channels, LOSSLESS_FORMATS.get(os.path.splitext(image_path)[1].lower(), 4))
+
+
+def writable_copy(img, image_path):
+    """
+    Copies a loaded image so its pixels can be modified, dropping the channels the format of the file it will be
+    written to does not store, so every channel left can hold payload.
+
+    Parameters:
+        img (numpy.ndarray): The image array.
+        image_path (str): Path of the file the image will be written to.
+
+    Returns:
+        numpy.ndarray: The writable copy.
+    """
+    if img.ndim == 3:
+        img = img[:, :, :format_channels(image_path, img.shape[2])]
+    return img.copy()
+
+
+def save_image(image_path, img):
+    """
+    Writes an image losslessly in the format given by the extension of its path.
+
+    Parameters:
+        image_path (str): Path of the file to write.
+        img (numpy.ndarray): The image array.
+
+    Raises:
+        ValueError: If the format can't store the image losslessly, or the file could not be written.
+    """
+    import cv2
+    params = []
+    if os.path.splitext(image_path)[1].lower() == '.webp':
+        if img.ndim == 3 and img.shape[2] == 4 and not img[:, :, 3].all():
+            raise ValueError("WebP does not keep the colour of fully transparent pixels. Use a PNG or TIFF image.")
+        params = [cv2.IMWRITE_WEBP_QUALITY, 101]  # above 100 selects lossless compression
+    if not cv2.imwrite(image_path, img, params):
+        raise ValueError(f"Could not write {image_path}.")
+
+
+def clear_cache():
+    """
+    Drops every cached image and image size.
+    """
+    _read_image.cache_clear()
+    _read_info.cache_clear()
@@ -0,0 +1,111 @@
+import time
+import tracemalloc
+from contextlib import contextmanager
+
+recorded = []  # metrics of every operation run since enable(), reported by --profile and --metrics-file
+recording = False
+
+
+def enable():
+    """
+    Starts keeping the metrics of every operation for report(), and starts tracing memory so stages report their
+    peak memory use.
+    """
+    global recording
+    recording = True
+    trace_memory()
+
+
+def trace_memory():
+    """
+    Starts tracing memory allocations (NumPy arrays included) so stages report their peak memory use.
+    """
+    if not tracemalloc.is_tracing():
+        tracemalloc.start()
+
+
+class StageMetrics:
+    """
+    Records the wall time, bytes processed and peak memory of each stage of an operation.
+
+    Attributes:
+        operation (str): Name of the operation, such as 'encode' or 'decode'.
+        image_path (str): Path of the image the operation works on.
+        stages (list): One dictionary per completed stage.
+    """
+
+    def __init__(self, operation, image_path=''):
+        """
+        Initializes an empty record for one operation.
+
+        Parameters:
+            operation (str): Name of the operation.
+            image_path (str): Path of the image the operation works on.
+        """
+        self.operation = operation
+        self.image_path = image_path
+        self.stages = []
+        if recording:
+            recorded.append(self)
+
+    @contextmanager
+    def stage(self, name, size=0):
+        """
+        Measures the stage run inside the with block. The block may update the 'bytes' entry of the yielded
+        dictionary once it knows how much data it processed.
+
+        Parameters:
+            name (str): Name of the stage.
+            size (int): Bytes processed by the stage, if known in advance.
+
+        Yields:
+            dict: The record of the stage.
+        """
+        record = {'stage': name, 'bytes': size}
+        tracing = tracemalloc.is_tracing()
+        if tracing:
+            tracemalloc.reset_peak()
+            baseline = tracemalloc.get_traced_memory()[0]
+        start = time.perf_counter()
+        try:
+            yield record
+        finally:
+            record['seconds'] = time.perf_counter() - start
+            if tracing:
+                record['peak_memory'] = tracemalloc.get_traced_memory()[1] - baseline
+            self.stages.append(record)
+
+    def as_dict(self):
+        """
+        Returns:
+            dict: The operation, image, total time and per-stage records, ready to be written as JSON.
+        """
+        return {'operation': self.operation, 'image': self.image_path,
+                'seconds': sum(stage['seconds'] for stage in self.stages), 'stages': self.stages}
+
+
+def report():
+    """
+    Returns:
+        list: The metrics of every operation recorded since enable(), as dictionaries.
+    """
+    return [metrics if isinstance(metrics, dict) else metrics.as_dict() for metrics in recorded]
+
+
+def format_report(operations):
+    """
+    Formats metrics as a table for the terminal.
+
+    Parameters:
+        operations (list): Metrics dictionaries, as returned by report().
+
+    Returns:
+        str: One line per stage, grouped by operation.
+    """
+    lines = []
+    for operation in operations:
+        lines.append(f"{operation['operation']} {operation['image']}: {operation['seconds']:.4f}s")
+        for stage in operation['stages']:
+            peak = f"  peak {stage['peak_memory'] / 2 ** 20:8.1f} MiB" if 'peak_memory' in stage else ''
+            lines.append(f"  {stage['stage']:<10} {stage['seconds']:9.4f}s  {stage['bytes']:>12} bytes{peak}")
+    return '\n'.join(lines)
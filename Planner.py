@@ -0,0 +1,202 @@
+import json
+import os
+import sys
+from bisect import bisect_left
+
+from Batch import load_manifest
+from Capacity import capacity_for_shape, fernet_token_size
+from Codec import compress
+from Header import MAX_DENSITY
+from ImageCache import format_channels, image_info
+from Scan import list_images, load_index, save_index, scan_image, scan_paths
+from Scatter import scatter_capacity
+from StreamCipher import encrypted_size
+
+INDEX_NAME = '.carriers.json'  # default index of a carrier pool, kept in the pool directory
+PLAN_START_ROW = 5  # first row of every planned payload, like the default of the 'capacity' command
+
+
+def carrier_record(path):
+    """
+    Builds the index record of a carrier: its scan record (see Scan.scan_image), which tells whether it already
+    holds a payload, with its dimensions and its capacity in bytes at each density. Runs in a worker process, so it
+    never raises and always returns a record.
+
+    Parameters:
+        path (str): Path of the image.
+
+    Returns:
+        dict: The record of the image.
+    """
+    record = scan_image(path)
+    if 'error' in record:
+        return record
+    info = image_info(path)
+    if info is None:
+        return dict(record, error="Error: Not a readable image.")
+    channels = format_channels(path, info.channels)
+    return dict(record, width=info.width, height=info.height, channels=channels, depth=info.depth,
+                capacity={str(density): capacity_for_shape(info.height, info.width, PLAN_START_ROW, 0, density,
+                                                           channels)
+                          for density in range(1, MAX_DENSITY + 1)})  # string keys, as they read back from JSON
+
+
+def index_carriers(paths, index, workers=None):
+    """
+    Indexes a carrier pool, reading only the images added or changed since the index was written.
+
+    Parameters:
+        paths (list): The paths of the images of the pool.
+        index (dict): The records of the index keyed by image path; records without a capacity, such as those of a
+            'scan' index, are rebuilt.
+        workers (int): Number of worker processes, or None for one per CPU.
+
+    Returns:
+        tuple: The records of the images, in the order of paths (list), and how many were read (int).
+    """
+    index = {path: record for path, record in index.items() if 'capacity' in record}
+    return scan_paths(paths, index, workers, carrier_record)
+
+
+def payload_size(item):
+    """
+    Calculates the room the payload of a manifest entry (see Batch.load_manifest) takes in a carrier. Text is
+    compressed with the codec of the entry, as Encoding.encryption does, so its size is exact.
+
+    Parameters:
+        item (dict): The manifest entry.
+
+    Returns:
+        int: The encrypted size of the payload in bytes.
+
+    Raises:
+        OSError: If the payload file or message file can't be read.
+        ValueError: If the compression of the entry is unknown or not available.
+    """
+    if item.get('payload_file'):
+        return encrypted_size(os.path.getsize(item['payload_file']))
+    if item.get('message_file'):
+        with open(item['message_file'], encoding='utf-8') as message_file:
+            text = message_file.read()
+    else:
+        text = item.get('message') or ''
+    data = text.encode()
+    if item.get('compression'):
+        data = compress(data, item['compression'])[1]
+    return fernet_token_size(len(data))
+
+
+def carrier_room(record, density, scatter=False):
+    """
+    Returns:
+        int: The bytes a payload of the given density and layout has in an indexed carrier.
+    """
+    if scatter:
+        return scatter_capacity(record['height'], record['width'], density, record['channels'])
+    return record['capacity'][str(density)]
+
+
+def is_free(record):
+    """
+    Checks whether an indexed carrier can take a payload: it was read, holds none (encoded images do) and was not
+    given one by an earlier plan.
+    """
+    return 'capacity' in record and not record['has_payload'] and not record.get('planned')
+
+
+def plan_batch(items, records, density=1):
+    """
+    Assigns each payload of a batch to its own carrier with a best fit decreasing heuristic: the largest payloads
+    are placed first, each in the smallest free carrier that holds it, so the large carriers stay available for the
+    payloads that need them and no time is spent reading and writing more pixels than needed.
+
+    Parameters:
+        items (list): The manifest entries; those that already name an image are kept as they are.
+        records (list): The index records of the carrier pool.
+        density (int): Bits per channel of the entries that don't set their own.
+
+    Returns:
+        tuple: The planned entries (list), largest first so a process pool running them (see Batch.run_batch)
+        finishes together, and the entries that could not be placed with the reason (list of (dict, str) tuples).
+    """
+    taken = {os.path.abspath(item['image']) for item in items if item.get('image')}
+    free = [record for record in records if is_free(record) and record['path'] not in taken]
+    rooms = {}  # (density, scatter) -> free carriers as sorted (room, path) tuples, built when first needed
+    planned = [(None, item) for item in items if item.get('image')]
+    unplaced = []
+    sized = []
+    for item in items:
+        if item.get('image'):
+            continue
+        if 'error' in item:  # a bad start position or density (see Batch.load_manifest)
+            unplaced.append((item, item['error']))
+            continue
+        try:
+            sized.append((payload_size(item), item))
+        except (OSError, ValueError) as error:
+            unplaced.append((item, f"Error: {error}"))
+    for size, item in sorted(sized, key=lambda entry: -entry[0]):
+        item_density = int(item.get('density') or density)
+        scatter = str(item.get('scatter') or '').lower() in ('1', 'true', 'yes')
+        if (item_density, scatter) not in rooms:
+            rooms[item_density, scatter] = sorted((carrier_room(record, item_density, scatter), record['path'])
+                                                  for record in free if record['path'] not in taken)
+        candidates = rooms[item_density, scatter]
+        position = bisect_left(candidates, (size, ''))
+        while position < len(candidates) and candidates[position][1] in taken:  # given out at another density
+            del candidates[position]
+        if position == len(candidates):
+            unplaced.append((item, f"Error: No free carrier holds the {size} bytes of the payload."))
+            continue
+        path = candidates.pop(position)[1]
+        taken.add(path)
+        planned.append((size, dict(item, image=path, start_row=PLAN_START_ROW, start_col=0, density=item_density)))
+    planned.sort(key=lambda entry: -1 if entry[0] is None else -entry[0])
+    return [item for _, item in planned], unplaced
+
+
+def plan_command(args):
+    """
+    Entry point for the 'plan' subcommand: writes a batch manifest assigning each payload of a manifest to a
+    carrier of a pool, for 'batch-encode'. The index of the pool is updated, and the carriers planned are marked as
+    used so later plans leave them out, unless it is a dry run.
+
+    Parameters:
+        args (argparse.Namespace): The parsed command line arguments.
+
+    Returns:
+        int: The process exit code: 1 if any payload could not be placed.
+    """
+    try:
+        items = load_manifest(args.manifest)
+    except (OSError, ValueError) as error:
+        print(f"Error: {error}", file=sys.stderr)
+        return 1
+    paths = list_images(args.pool, args.recursive)
+    index_path = args.index or os.path.join(args.pool, INDEX_NAME)
+    index = load_index(index_path)
+    records, scanned = index_carriers(paths, index, args.workers)
+    planned, unplaced = plan_batch(items, records, args.density)
+    if not args.dry_run:
+        used = {item['image'] for item in planned}
+        for record in records:
+            if record['path'] in used:
+                record['planned'] = True
+    index = {path: record for path, record in index.items() if os.path.exists(path)}  # forget deleted images
+    index.update((record['path'], record) for record in records)
+    save_index(index_path, index)
+
+    output = open(args.output, 'w', encoding='utf-8') if args.output else sys.stdout
+    try:
+        for item in planned:
+            output.write(json.dumps(item) + '\n')
+    finally:
+        if output is not sys.stdout:
+            output.close()
+    for item, message in unplaced:
+        print(f"{message} ({item.get('payload_file') or item.get('message_file') or 'message'})", file=sys.stderr)
+    free = sum(is_free(record) for record in records)
+    print(f"{len(planned)} of {len(items)} payload(s) planned on a pool of {len(records)} image(s), {scanned} read "
+          f"and {len(records) - scanned} unchanged since the last plan: {free} free carrier(s) left.",
+          file=sys.stderr)
+    return 1 if unplaced else 0
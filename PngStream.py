@@ -0,0 +1,667 @@
+import struct
+import zlib
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+
+from ImageCache import PNG_SIGNATURE, has_chunk
+CHANNELS = {2: 3, 6: 4}  # colour types that can be streamed: truecolour and truecolour with alpha
+COLOUR_TYPES = {3: 2, 4: 6}  # colour type written for each number of channels
+BAND_BYTES = 4 * 1024 * 1024  # size of the pixel bands held in memory while streaming
+READ_SIZE = 1024 * 1024  # bytes read from disk at a time
+PEEK_READ_SIZE = 64 * 1024  # bytes read at a time when only the first rows are wanted (see read_png_rows)
+IDAT_SIZE = 1024 * 1024  # size of the IDAT chunks written
+SEGMENT_BYTES = 256 * 1024  # uncompressed size of the independently compressed segments written by patch_png
+SEGMENT_CHUNK = b'sgMT'  # private ancillary chunk tagging files written in segments (see write_png_segments); unsafe
+# to copy, so editors that rewrite the pixel data drop it
+FLUSH_MARKER = b'\x00\x00\xff\xff'  # the empty stored block a zlib full flush ends every segment but the last with
+ADLER_BASE = 65521  # modulus of the Adler-32 checksum ending a zlib stream
+
+
+def make_chunk(chunk_type, data):
+    """
+    Builds a PNG chunk (length, type, data and CRC).
+
+    Parameters:
+        chunk_type (bytes): The 4-byte chunk type.
+        data (bytes): The chunk data.
+
+    Returns:
+        bytes: The encoded chunk.
+    """
+    return struct.pack('>I', len(data)) + chunk_type + data + struct.pack('>I', zlib.crc32(chunk_type + data))
+
+
+class PngReader:
+    """
+    Reads a PNG file a band of rows at a time, so that only a few rows are ever held in memory.
+
+    Attributes:
+        width (int): Width of the image in pixels.
+        height (int): Height of the image in pixels.
+        channels (int): Number of channels (3 for BGR, 4 for BGRA).
+        head (bytes): The signature and every chunk before the first IDAT chunk, as found in the file, but
+            SEGMENT_CHUNK: it describes the pixel data, so only writers that write segments add it back.
+        tail (bytes): Every chunk after the last IDAT chunk, available once all rows have been read.
+        segmented (bool): Whether the file is tagged as written in segments (see SEGMENT_CHUNK).
+    """
+
+    def __init__(self, file, read_size=READ_SIZE):
+        """
+        Reads the chunks in front of the pixel data and checks that the image can be streamed.
+
+        Parameters:
+            file (file object): The PNG file, opened in binary mode.
+            read_size (int): Number of compressed bytes read from the file at a time.
+
+        Raises:
+            ValueError: If the file is not a PNG image, or is interlaced, palette based, greyscale or not 8-bit.
+        """
+        self.file = file
+        self.read_size = read_size
+        self.tail = b''
+        self.segmented = False
+        head = [file.read(len(PNG_SIGNATURE))]
+        if head[0] != PNG_SIGNATURE:
+            raise ValueError("Not a PNG file.")
+        while True:
+            length, chunk_type = struct.unpack('>I4s', file.read(8))
+            if chunk_type == b'IDAT':
+                self.idat_left = length
+                break
+            data = file.read(length + 4)  # chunk data and CRC
+            if chunk_type == b'IEND':
+                raise ValueError("PNG file has no pixel data.")
+            if chunk_type == SEGMENT_CHUNK:
+                self.segmented = True
+                continue
+            if chunk_type == b'IHDR':
+                self.width, self.height, depth, colour_type, _, _, interlace = struct.unpack('>IIBBBBB', data[:13])
+                if depth != 8 or colour_type not in CHANNELS or interlace:
+                    raise ValueError("Streaming only supports non-interlaced 8-bit RGB or RGBA PNG files.")
+                self.channels = CHANNELS[colour_type]
+                self.ihdr = data[:13]
+            head.append(struct.pack('>I4s', length, chunk_type) + data)
+        self.head = b''.join(head)
+        self.stride = self.width * self.channels + 1  # one filter type byte in front of every row
+
+    def compressed(self):
+        """
+        Yields the compressed pixel data, spread over one or more consecutive IDAT chunks, then reads the chunks
+        that follow into tail.
+        """
+        while True:
+            while self.idat_left:
+                data = self.file.read(min(self.idat_left, self.read_size))
+                if not data:
+                    raise ValueError("Truncated PNG file.")
+                self.idat_left -= len(data)
+                yield data
+            self.file.read(4)  # CRC
+            length, chunk_type = struct.unpack('>I4s', self.file.read(8))
+            if chunk_type != b'IDAT':
+                self.tail = struct.pack('>I4s', length, chunk_type) + self.file.read()
+                return
+            self.idat_left = length
+
+    def filtered_bands(self, band_rows):
+        """
+        Yields the filtered scanlines of the image, band_rows rows at a time.
+
+        Parameters:
+            band_rows (int): Number of rows per band (the last band may be shorter).
+
+        Yields:
+            tuple: The index of the first row of the band (int) and its filtered scanlines (bytes).
+        """
+        band_size = band_rows * self.stride
+        decompressor = zlib.decompressobj()
+        buffer = bytearray()
+        top = 0
+        for data in self.compressed():
+            while data:
+                buffer += decompressor.decompress(data, band_size)  # bounded, so a tiny chunk can't expand to GBs
+                data = decompressor.unconsumed_tail
+                while len(buffer) >= band_size and top < self.height:
+                    yield top, bytes(buffer[:band_size])
+                    del buffer[:band_size]
+                    top += band_rows
+        buffer += decompressor.flush()
+        rows = min(len(buffer) // self.stride, self.height - top)
+        if rows > 0:
+            yield top, bytes(buffer[:rows * self.stride])
+
+    def unfilter(self, prior, filtered):
+        """
+        Reverses the PNG filters of a band of scanlines. The band is decoded by OpenCV as a small PNG image whose
+        first row is the unfiltered row above the band, so every filter type is handled natively.
+
+        Parameters:
+            prior (numpy.ndarray): The unfiltered row above the band, in file channel order, or zeros for row 0.
+            filtered (bytes): The filtered scanlines of the band.
+
+        Returns:
+            numpy.ndarray: The band as a BGR or BGRA image array.
+        """
+        import cv2  # imported on first use, so reading headers and the first pixels never loads OpenCV
+        rows = len(filtered) // self.stride
+        ihdr = struct.pack('>II', self.width, rows + 1) + self.ihdr[8:]
+        data = b'\x00' + prior.tobytes() + filtered
+        png = PNG_SIGNATURE + make_chunk(b'IHDR', ihdr) + make_chunk(b'IDAT', zlib.compress(data, 0)) + \
+            make_chunk(b'IEND', b'')
+        band = cv2.imdecode(np.frombuffer(png, dtype=np.uint8), cv2.IMREAD_UNCHANGED)
+        return band[1:]
+
+
+def to_file_order(band):
+    """
+    Converts a BGR or BGRA band into the RGB or RGBA rows stored in a PNG file.
+
+    Parameters:
+        band (numpy.ndarray): The band as an image array.
+
+    Returns:
+        numpy.ndarray: A uint8 array with one flattened row per image row.
+    """
+    order = [2, 1, 0, 3][:band.shape[2]]
+    return band[:, :, order].reshape(band.shape[0], -1)
+
+
+def filter_rows(prior, rows, channels, independent=False):
+    """
+    Applies PNG filters to a band of rows, picking for each row the filter with the smallest sum of absolute
+    differences, which is the heuristic libpng uses.
+
+    Parameters:
+        prior (numpy.ndarray): The row above the band, in file channel order, or zeros for row 0.
+        rows (numpy.ndarray): The band in file channel order, one flattened row per image row.
+        channels (int): Number of channels per pixel.
+        independent (bool): Whether to keep the first row to the filters that don't look at the row above (None
+            and Sub), so the band can be decoded without it.
+
+    Returns:
+        bytes: The filtered scanlines, each preceded by its filter type byte.
+    """
+    current = rows.astype(np.int16)
+    up = np.vstack((prior[np.newaxis], rows[:-1])).astype(np.int16)
+    left = np.zeros_like(current)
+    left[:, channels:] = current[:, :-channels]
+    up_left = np.zeros_like(current)
+    up_left[:, channels:] = up[:, :-channels]
+    distance_left = np.abs(up - up_left)  # distances of the Paeth estimate left + up - up_left to each neighbour
+    distance_up = np.abs(left - up_left)
+    distance_up_left = np.abs(left + up - 2 * up_left)
+    paeth = np.where(distance_up <= distance_up_left, up, up_left)
+    np.copyto(paeth, left, where=(distance_left <= distance_up) & (distance_left <= distance_up_left))
+    del distance_left, distance_up, distance_up_left
+    filtered = rows.copy()
+    chosen = np.zeros(rows.shape[0], dtype=np.uint8)
+    best_cost = np.minimum(rows, -rows).sum(axis=1, dtype=np.int32)  # sum of the bytes read as signed magnitudes
+    for filter_type, predictor in enumerate((left, up, (left + up) >> 1, paeth), start=1):
+        candidate = (current - predictor).astype(np.uint8)  # wraps modulo 256, as PNG filters do
+        cost = np.minimum(candidate, -candidate).sum(axis=1, dtype=np.int32)
+        better = cost < best_cost
+        if independent and filter_type > 1:
+            better[0] = False
+        filtered[better] = candidate[better]
+        chosen[better] = filter_type
+        best_cost = np.minimum(cost, best_cost)
+    return np.hstack((chosen[:, np.newaxis], filtered)).tobytes()
+
+
+class PngWriter:
+    """
+    Writes a PNG file a band of filtered scanlines at a time.
+    """
+
+    def __init__(self, file, head, level=1):
+        """
+        Writes the signature and the chunks in front of the pixel data.
+
+        Parameters:
+            file (file object): The output file, opened in binary mode.
+            head (bytes): The signature and header chunks, as read by PngReader.
+            level (int): zlib compression level (OpenCV writes PNG files at level 1 by default).
+        """
+        self.file = file
+        self.compressor = zlib.compressobj(level)
+        self.pending = bytearray()
+        file.write(head)
+
+    def write(self, filtered):
+        """
+        Compresses and writes filtered scanlines.
+
+        Parameters:
+            filtered (bytes): Filtered scanlines, each preceded by its filter type byte.
+        """
+        self.pending += self.compressor.compress(filtered)
+        while len(self.pending) >= IDAT_SIZE:
+            self.file.write(make_chunk(b'IDAT', bytes(self.pending[:IDAT_SIZE])))
+            del self.pending[:IDAT_SIZE]
+
+    def close(self, tail):
+        """
+        Flushes the compressed data and writes the chunks that follow it.
+
+        Parameters:
+            tail (bytes): The chunks after the pixel data, ending with IEND, as read by PngReader.
+        """
+        self.pending += self.compressor.flush()
+        if self.pending:
+            self.file.write(make_chunk(b'IDAT', bytes(self.pending)))
+        self.file.write(tail)
+
+
+def segment_rows_for(width, channels):
+    """
+    Picks how many rows go into each independently compressed segment of a file written by patch_png. It depends
+    only on the image, so the segments of a file can be found again without storing anything in it.
+    """
+    return max(1, SEGMENT_BYTES // (width * channels + 1))
+
+
+def adler32_combine(first, second, second_length):
+    """
+    Computes the Adler-32 checksum of two pieces of data from the checksums of each piece, as zlib's
+    adler32_combine() does.
+
+    Parameters:
+        first (int): Checksum of the first piece.
+        second (int): Checksum of the second piece.
+        second_length (int): Length of the second piece in bytes.
+
+    Returns:
+        int: Checksum of the first piece followed by the second.
+    """
+    remainder = second_length % ADLER_BASE
+    low = ((first & 0xFFFF) + (second & 0xFFFF) - 1) % ADLER_BASE
+    high = (remainder * (first & 0xFFFF) + (first >> 16) + (second >> 16) - remainder) % ADLER_BASE
+    return low | high << 16
+
+
+def adler32_suffix(total, prefix, suffix_length):
+    """
+    Reverses adler32_combine: recovers the checksum of the end of some data from the checksum of all of it and of
+    its beginning, so the end does not have to be decompressed to be checksummed again.
+
+    Parameters:
+        total (int): Checksum of the whole data.
+        prefix (int): Checksum of its beginning.
+        suffix_length (int): Length of the rest in bytes.
+
+    Returns:
+        int: Checksum of the rest.
+    """
+    remainder = suffix_length % ADLER_BASE
+    low = ((total & 0xFFFF) - (prefix & 0xFFFF) + 1) % ADLER_BASE
+    high = ((total >> 16) - (prefix >> 16) - remainder * (prefix & 0xFFFF) + remainder) % ADLER_BASE
+    return low | high << 16
+
+
+def flushed_segments(stream, start, stop, segment_size, total_size):
+    """
+    Splits the deflate data of a file written by patch_png into its independently compressed segments,
+    decompressing each one only when it is asked for.
+
+    Parameters:
+        stream (bytes): The zlib stream holding the pixel data.
+        start (int): Offset of the deflate data in the stream, after the zlib header.
+        stop (int): Offset of the end of the deflate data, before the checksum.
+        segment_size (int): Uncompressed size of every segment but the last.
+        total_size (int): Uncompressed size of the whole data.
+
+    Yields:
+        tuple: The start and end offsets of the compressed segment in the stream (int) and its uncompressed data
+        (bytes).
+
+    Raises:
+        ValueError: If the data was not written in segments of this size.
+    """
+    view = memoryview(stream)
+    done = 0
+    while done < total_size:
+        size = min(segment_size, total_size - done)
+        decompressor = zlib.decompressobj(-15)  # every segment starts on a fresh dictionary after a full flush
+        data = b''
+        end = start
+        try:
+            if done + size == total_size:  # the last segment runs to the end of the data
+                end = stop
+                data = decompressor.decompress(view[start:stop])
+            while len(data) < size:  # other segments end at a flush marker; the first markers found may be chance
+                # bytes inside the compressed data, which leave the segment short
+                marker = stream.find(FLUSH_MARKER, end, stop)
+                if marker == -1:
+                    break
+                data += decompressor.decompress(view[end:marker + len(FLUSH_MARKER)])
+                end = marker + len(FLUSH_MARKER)
+        except zlib.error:
+            raise ValueError("The pixel data is not written in segments.") from None
+        if len(data) != size or data[0] > 1:  # the first row of a segment must not use the row above
+            raise ValueError("The pixel data is not written in segments.")
+        yield start, end, data
+        start = end
+        done += size
+
+
+def compress_segment(filtered, last, level=1):
+    """
+    Compresses one segment of filtered scanlines on a fresh dictionary, ending it with a full flush (or, for the
+    last segment, the end of the stream) so it can later be replaced without touching its neighbours. Run-length
+    matching only looks one byte back, so it loses nothing to the fresh dictionary, and on filtered photographs it
+    is both faster and smaller than the default strategy.
+    """
+    compressor = zlib.compressobj(level, zlib.DEFLATED, -15, 8, zlib.Z_RLE)
+    return compressor.compress(filtered) + compressor.flush(zlib.Z_FINISH if last else zlib.Z_FULL_FLUSH)
+
+
+def patch_png(source_path, target_path, rows, edit, level=1):
+    """
+    Writes a copy of a PNG image with some rows changed. The pixel data is written as segments of rows compressed
+    independently: each segment ends with a zlib full flush, and its first row is filtered without the row above.
+    So when the source was itself written by patch_png (and tagged with SEGMENT_CHUNK), only the segments whose
+    pixels change are decompressed, unfiltered and compressed again, and the compressed bytes of all the others are
+    copied as they are. Other sources are rewritten in full, once.
+
+    Parameters:
+        source_path (str): Path of the PNG image to read.
+        target_path (str): Path of the PNG image to write; it must differ from source_path.
+        rows (list): The (first, last) ranges of rows that edit may change.
+        edit (callable): Called as edit(top, band) for each segment holding some of those rows, in order from the
+            top, with the rows of the segment as a BGR or BGRA array to modify in place.
+        level (int): zlib compression level of the segments compressed again.
+
+    Returns:
+        bool: True if only the changed segments were compressed again, False if the whole pixel data was.
+
+    Raises:
+        ValueError: If the image can't be streamed (see PngReader).
+    """
+    with open(source_path, 'rb') as source:
+        reader = PngReader(source)
+        stream = b''.join(reader.compressed())
+    segment_rows = segment_rows_for(reader.width, reader.channels)
+    total = reader.height * reader.stride
+    zeros = np.zeros(reader.stride - 1, dtype=np.uint8)
+
+    def touched(top):
+        return any(first < top + segment_rows and last >= top for first, last in rows)
+
+    def edited(top, band):
+        original = band.copy()
+        edit(top, band)
+        if np.array_equal(band, original):
+            return None
+        return filter_rows(zeros, to_file_order(band), reader.channels, independent=True)
+
+    segments = None
+    if reader.segmented:  # in other files, the bytes of FLUSH_MARKER may turn up by chance anywhere in the stream
+        try:  # find every segment down to the last row that may change before editing any
+            segments = []
+            found = flushed_segments(stream, 2, len(stream) - 4, segment_rows * reader.stride, total)
+            for top in range(0, min(reader.height, max(last for _, last in rows) + 1), segment_rows):
+                start, end, data = next(found)
+                segments.append((top, start, end, data if touched(top) else None, zlib.adler32(data), len(data)))
+        except (ValueError, StopIteration):
+            segments = None
+
+    pieces = []
+    checksum = 1  # Adler-32 of no data
+    if segments is not None:
+        old_prefix = 1
+        done = 0
+        for top, start, end, data, old_checksum, length in segments:
+            old_prefix = adler32_combine(old_prefix, old_checksum, length)
+            done += length
+            filtered = edited(top, reader.unfilter(zeros, data)) if data is not None else None
+            if filtered is None:  # unchanged: copy the compressed bytes
+                pieces.append(stream[start:end])
+                checksum = adler32_combine(checksum, old_checksum, length)
+            else:
+                pieces.append(compress_segment(filtered, done == total, level))
+                checksum = zlib.adler32(filtered, checksum)
+        if done < total:  # the rest of the image is copied without even being decompressed
+            pieces.append(stream[segments[-1][2]:len(stream) - 4])
+            rest = adler32_suffix(int.from_bytes(stream[-4:], 'big'), old_prefix, total - done)
+            checksum = adler32_combine(checksum, rest, total - done)
+        zlib_header = stream[:2]
+    else:
+        with open(source_path, 'rb') as source:
+            reader = PngReader(source)
+            prior = zeros
+            for top, filtered in reader.filtered_bands(segment_rows):
+                band = reader.unfilter(prior, filtered)
+                prior = to_file_order(band[-1:])[0]
+                changed = edited(top, band) if touched(top) else None
+                if changed is None:  # only the first row needs filtering again, without the row above
+                    changed = filter_rows(zeros, to_file_order(band[:1]), reader.channels, True) + \
+                        filtered[reader.stride:]
+                pieces.append(compress_segment(changed, top + segment_rows >= reader.height, level))
+                checksum = zlib.adler32(changed, checksum)
+        zlib_header = b'\x78\x01'  # deflate with a 32 KB window, fastest compression
+    data = zlib_header + b''.join(pieces) + struct.pack('>I', checksum)
+    with open(target_path, 'wb') as target:
+        target.write(reader.head + make_chunk(SEGMENT_CHUNK, b''))
+        write_idat(target, data)
+        target.write(reader.tail)
+    return segments is not None
+
+
+def write_idat(file, data):
+    """
+    Writes a zlib stream as IDAT chunks of IDAT_SIZE bytes.
+    """
+    for offset in range(0, len(data), IDAT_SIZE):
+        file.write(make_chunk(b'IDAT', data[offset:offset + IDAT_SIZE]))
+
+
+def write_png_segments(image_path, img, threads, level=1):
+    """
+    Writes an image as a PNG file laid out like the ones patch_png writes, in independently compressed segments of
+    rows. Each segment is filtered and compressed on its own, so the segments are spread over a pool of threads
+    (NumPy and zlib release the GIL while they work), and the file can later be patched without a full rewrite.
+
+    Parameters:
+        image_path (str): Path of the PNG file to write.
+        img (numpy.ndarray): The BGR or BGRA image array.
+        threads (int): Number of threads.
+        level (int): zlib compression level.
+    """
+    height, width, channels = img.shape
+    segment_rows = segment_rows_for(width, channels)
+    zeros = np.zeros(width * channels, dtype=np.uint8)
+
+    def segment(top):
+        filtered = filter_rows(zeros, to_file_order(img[top:top + segment_rows]), channels, independent=True)
+        return compress_segment(filtered, top + segment_rows >= height, level), zlib.adler32(filtered), len(filtered)
+
+    with ThreadPoolExecutor(max_workers=threads) as executor:
+        segments = list(executor.map(segment, range(0, height, segment_rows)))
+    checksum = 1  # Adler-32 of no data
+    for _, segment_checksum, length in segments:
+        checksum = adler32_combine(checksum, segment_checksum, length)
+    data = b'\x78\x01' + b''.join(compressed for compressed, _, _ in segments) + struct.pack('>I', checksum)
+    ihdr = struct.pack('>IIBBBBB', width, height, 8, COLOUR_TYPES[channels], 0, 0, 0)
+    with open(image_path, 'wb') as target:
+        target.write(PNG_SIGNATURE + make_chunk(b'IHDR', ihdr) + make_chunk(SEGMENT_CHUNK, b''))
+        write_idat(target, data)
+        target.write(make_chunk(b'IEND', b''))
+
+
+def read_png_segments(image_path, threads):
+    """
+    Decodes a PNG file written in segments (see write_png_segments and patch_png) on a pool of threads: every
+    segment is decompressed and unfiltered without looking at the one above it. The segments are found from the
+    flush markers ending them; if chance bytes inside the compressed data look like a marker, they are found by
+    decompressing the stream in order instead, and only unfiltered in parallel.
+
+    Parameters:
+        image_path (str): Path of the PNG file.
+        threads (int): Number of threads.
+
+    Returns:
+        numpy.ndarray: The BGR or BGRA image array.
+
+    Raises:
+        ValueError: If the image can't be streamed (see PngReader), is not written in segments or is corrupt.
+    """
+    with open(image_path, 'rb') as source:
+        reader = PngReader(source)
+        stream = b''.join(reader.compressed())
+    segment_rows = segment_rows_for(reader.width, reader.channels)
+    segment_size = segment_rows * reader.stride
+    total = reader.height * reader.stride
+    zeros = np.zeros(reader.stride - 1, dtype=np.uint8)
+    count = -(-total // segment_size)
+    img = np.empty((reader.height, reader.width, reader.channels), dtype=np.uint8)
+    view = memoryview(stream)
+    bounds = [2]  # after the zlib header
+    while len(bounds) < count:
+        marker = stream.find(FLUSH_MARKER, bounds[-1], len(stream) - 4)
+        if marker == -1:
+            break
+        bounds.append(marker + len(FLUSH_MARKER))
+    bounds.append(len(stream) - 4)  # before the checksum
+
+    def unfilter(index, data):
+        img[index * segment_rows:(index + 1) * segment_rows] = reader.unfilter(zeros, data)
+        return zlib.adler32(data), len(data)
+
+    def segment(index):
+        size = min(segment_size, total - index * segment_size)
+        try:
+            data = zlib.decompressobj(-15).decompress(view[bounds[index]:bounds[index + 1]])
+        except zlib.error:
+            raise ValueError("The pixel data is not written in segments.") from None
+        if len(data) != size or data[0] > 1:
+            raise ValueError("The pixel data is not written in segments.")
+        return unfilter(index, data)
+
+    with ThreadPoolExecutor(max_workers=threads) as executor:
+        try:
+            if len(bounds) != count + 1:
+                raise ValueError("The pixel data is not written in segments.")
+            checksums = list(executor.map(segment, range(count)))
+        except ValueError:
+            found = flushed_segments(stream, 2, len(stream) - 4, segment_size, total)
+            checksums = list(executor.map(unfilter, range(count), (data for _, _, data in found)))
+    checksum = 1
+    for segment_checksum, length in checksums:
+        checksum = adler32_combine(checksum, segment_checksum, length)
+    if checksum != int.from_bytes(stream[-4:], 'big'):
+        raise ValueError("Corrupt PNG pixel data.")
+    return img
+
+
+def is_segmented(image_path):
+    """
+    Checks whether a PNG file is tagged as written in segments, reading only the chunk headers in front of its pixel
+    data, so files that were not are never decompressed just to find out.
+    """
+    try:
+        with open(image_path, 'rb') as file:
+            return file.read(len(PNG_SIGNATURE)) == PNG_SIGNATURE and has_chunk(file, SEGMENT_CHUNK)
+    except (OSError, struct.error):
+        return False
+
+
+def read_png_shape(image_path):
+    """
+    Reads the dimensions of a streamable PNG image without decoding any pixels.
+
+    Parameters:
+        image_path (str): Path of the PNG file.
+
+    Returns:
+        tuple: The height, width and number of channels of the image.
+    """
+    with open(image_path, 'rb') as file:
+        reader = PngReader(file)
+        return reader.height, reader.width, reader.channels
+
+
+def read_png_rows(image_path, rows, columns=None):
+    """
+    Decodes only the first rows of a streamable PNG image. Decompression stops as soon as they are complete, so
+    the rest of the file is never read.
+
+    Parameters:
+        image_path (str): Path of the PNG file.
+        rows (int): Number of rows to decode.
+        columns (int): If given, only the first columns of those rows are unfiltered, in pure Python (see
+            unfilter_prefix), so OpenCV is not loaded.
+
+    Returns:
+        tuple: The height (int) and width (int) of the whole image, and its first rows as a BGR or BGRA array.
+
+    Raises:
+        ValueError: If the image can't be streamed (see PngReader).
+    """
+    with open(image_path, 'rb') as file:
+        reader = PngReader(file, PEEK_READ_SIZE)
+        for _, filtered in reader.filtered_bands(min(rows, reader.height)):
+            if columns is None:
+                return reader.height, reader.width, reader.unfilter(np.zeros(reader.stride - 1, dtype=np.uint8),
+                                                                    filtered)
+            length = min(columns, reader.width) * reader.channels
+            prefixes = [bytes(length)]  # the row above the first one is zeros
+            for top in range(0, len(filtered), reader.stride):
+                prefixes.append(unfilter_prefix(prefixes[-1], filtered[top:top + reader.stride], reader.channels,
+                                                length))
+            band = np.frombuffer(b''.join(prefixes[1:]), dtype=np.uint8).reshape(len(prefixes) - 1, -1,
+                                                                                   reader.channels)
+            return reader.height, reader.width, band[:, :, [2, 1, 0, 3][:reader.channels]]  # to BGR(A) order
+    raise ValueError("PNG file has no pixel data.")
+
+
+def unfilter_prefix(prior, scanline, channels, length):
+    """
+    Reverses the PNG filter of the first bytes of a scanline in pure Python, for when only a few pixels are needed.
+    Every filter looks only left and up, so the start of a row depends only on the start of the rows above it.
+
+    Parameters:
+        prior (bytes): The first length unfiltered bytes of the row above, or zeros for row 0.
+        scanline (bytes): The filtered scanline, starting with its filter type byte.
+        channels (int): Number of channels per pixel.
+        length (int): Number of bytes to unfilter.
+
+    Returns:
+        bytes: The first length unfiltered bytes of the row, in file channel order.
+
+    Raises:
+        ValueError: If the filter type is not one of the five PNG filters.
+    """
+    filter_type = scanline[0]
+    if filter_type > 4:
+        raise ValueError("Corrupt PNG filter type.")
+    row = bytearray(scanline[1:length + 1])
+    for i in range(len(row)):
+        left = row[i - channels] if i >= channels else 0
+        up = prior[i]
+        up_left = prior[i - channels] if i >= channels else 0
+        if filter_type == 1:
+            predictor = left
+        elif filter_type == 2:
+            predictor = up
+        elif filter_type == 3:
+            predictor = (left + up) >> 1
+        elif filter_type == 4:
+            estimate = left + up - up_left
+            distance_left, distance_up, distance_up_left = abs(estimate - left), abs(estimate - up), \
+                abs(estimate - up_left)
+            if distance_left <= distance_up and distance_left <= distance_up_left:
+                predictor = left
+            else:
+                predictor = up if distance_up <= distance_up_left else up_left
+        else:
+            predictor = 0
+        row[i] = (row[i] + predictor) & 0xFF
+    return bytes(row)
+
+
+def band_rows_for(width, channels):
+    """
+    Picks how many rows to hold in memory at a time for a given image width.
+    """
+    return max(1, BAND_BYTES // (width * channels + 1))
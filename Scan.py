@@ -0,0 +1,185 @@
+import json
+import os
+import struct
+import sys
+import zlib
+from concurrent.futures import ProcessPoolExecutor
+
+from Decoding import decode_start, read_header
+from Header import FLAG_SLOTS, HEADER_ROWS
+from ImageCache import is_lossless
+from PngStream import read_png_rows
+
+INDEX_VERSION = 1  # bumped whenever the layout of the scan records changes, so older indexes are rescanned
+SCAN_COLUMNS = 128  # pixels decoded at the start of each header row: the binary header takes 67, and 128 hold a
+# legacy 'row$col##' offset of up to 48 characters
+
+
+def scan_image(path):
+    """
+    Checks whether an image holds a payload, without a key: only the first HEADER_ROWS rows are decoded, and the
+    binary header found there is validated against the size of the image. Only the first SCAN_COLUMNS pixels of
+    those rows are unfiltered, without loading OpenCV. Runs in a worker process, so it never raises and always
+    returns a record.
+
+    Parameters:
+        path (str): Path of the image.
+
+    Returns:
+        dict: The record of the image: its path, modification time and size, whether it holds a payload and, if it
+        does, the format of its header ('header', 'slots' for a container of several messages, or 'legacy'), where
+        the payload starts and its length in bytes (unknown for legacy images, whose payload ends with a delimiter).
+    """
+    record = {'path': path, 'has_payload': False, 'format': None, 'start_row': None, 'start_col': None,
+              'length': None, 'flags': None}
+    try:
+        status = os.stat(path)
+        record.update(mtime_ns=status.st_mtime_ns, size=status.st_size)
+        try:
+            height, width, rows = read_png_rows(path, HEADER_ROWS, SCAN_COLUMNS)
+        except (ValueError, struct.error, zlib.error):  # not a PNG layout PngReader handles, or truncated; decode
+            # the whole image instead
+            import cv2
+            img = cv2.imread(path, cv2.IMREAD_UNCHANGED)
+            if img is None:
+                return dict(record, error="Error: Not a readable image.")
+            height, width, rows = img.shape[0], img.shape[1], img[:HEADER_ROWS]
+    except OSError as error:
+        return dict(record, error=f"Error: {error}")
+    if rows.shape[0] < HEADER_ROWS:
+        return record  # too small to hold even a header
+    header = read_header(rows, height, width)
+    if header is not None:
+        return dict(record, has_payload=True, format='slots' if header.flags & FLAG_SLOTS else 'header',
+                    start_row=header.start_row,
+                    start_col=header.start_col, length=header.length, flags=header.flags)
+    start = decode_start(rows)
+    if start is None:  # no 'row$col##' offset either
+        return record
+    start_row, start_col = start
+    if HEADER_ROWS <= start_row < height and 0 <= start_col < width:
+        return dict(record, has_payload=True, format='legacy', start_row=start_row, start_col=start_col)
+    return record
+
+
+def list_images(source, recursive=False):
+    """
+    Lists the images to scan.
+
+    Parameters:
+        source (str): An image, or a directory of images in the formats carriers are written in.
+        recursive (bool): Whether to include the images of subdirectories.
+
+    Returns:
+        list: The absolute paths of the images, in name order.
+    """
+    if not os.path.isdir(source):
+        return [os.path.abspath(source)]
+    if recursive:
+        paths = [os.path.join(directory, name) for directory, _, names in os.walk(source) for name in names]
+    else:
+        paths = [os.path.join(source, name) for name in os.listdir(source)]
+    return sorted(os.path.abspath(path) for path in paths if is_lossless(path) and os.path.isfile(path))
+
+
+def load_index(index_path):
+    """
+    Reads a scan index.
+
+    Parameters:
+        index_path (str): Path of the JSON index file.
+
+    Returns:
+        dict: The scan records keyed by image path; empty if the file is missing, unreadable or from another version.
+    """
+    try:
+        with open(index_path, encoding='utf-8') as index_file:
+            index = json.load(index_file)
+    except (OSError, ValueError):  # the index is only a cache, so a missing or damaged one is rebuilt
+        return {}
+    if not isinstance(index, dict) or index.get('version') != INDEX_VERSION:
+        return {}
+    return index.get('images', {})
+
+
+def save_index(index_path, records):
+    """
+    Writes a scan index. The file is replaced in one step, so an interrupted scan never leaves a truncated index.
+
+    Parameters:
+        index_path (str): Path of the JSON index file.
+        records (dict): The scan records keyed by image path.
+    """
+    temporary_path = f"{index_path}.tmp"
+    with open(temporary_path, 'w', encoding='utf-8') as index_file:
+        json.dump({'version': INDEX_VERSION, 'images': records}, index_file)
+    os.replace(temporary_path, index_path)
+
+
+def is_current(record, path):
+    """
+    Checks whether an indexed record still describes an image, by comparing its modification time and size.
+    """
+    try:
+        status = os.stat(path)
+    except OSError:
+        return False
+    return record.get('mtime_ns') == status.st_mtime_ns and record.get('size') == status.st_size
+
+
+def scan_paths(paths, index=None, workers=None, worker=scan_image):
+    """
+    Scans images for payloads, reusing the records of an index for the images that have not changed since.
+
+    Parameters:
+        paths (list): The paths of the images.
+        index (dict): Earlier scan records keyed by image path, or None.
+        workers (int): Number of worker processes, or None for one per CPU.
+        worker (callable): Builds the record of one image from its path; scan_image, or a function adding to its
+            record (see Planner.carrier_record).
+
+    Returns:
+        tuple: The records of the images, in the order of paths (list), and how many were scanned rather than taken
+        from the index (int).
+    """
+    index = index or {}
+    records = {path: index[path] for path in paths if path in index and is_current(index[path], path)}
+    stale = [path for path in paths if path not in records]
+    if len(stale) > 1 and workers != 1:
+        with ProcessPoolExecutor(max_workers=workers) as executor:
+            chunksize = max(1, len(stale) // (4 * (workers or os.cpu_count() or 1)))
+            records.update(zip(stale, executor.map(worker, stale, chunksize=chunksize)))
+    else:
+        records.update((path, worker(path)) for path in stale)
+    return [records[path] for path in paths], len(stale)
+
+
+def scan(args):
+    """
+    Entry point for the 'scan' subcommand: writes one JSONL record per image and updates the index, if one is given.
+
+    Parameters:
+        args (argparse.Namespace): The parsed command line arguments.
+
+    Returns:
+        int: The process exit code: 1 if any image could not be read.
+    """
+    paths = list_images(args.source, args.recursive)
+    index = load_index(args.index) if args.index else {}
+    records, scanned = scan_paths(paths, index, args.workers)
+    if args.index:
+        index = {path: record for path, record in index.items() if os.path.exists(path)}  # forget deleted images
+        index.update((record['path'], record) for record in records)
+        save_index(args.index, index)
+
+    output = open(args.output, 'w', encoding='utf-8') if args.output else sys.stdout
+    try:
+        for record in records:
+            output.write(json.dumps(record) + '\n')
+    finally:
+        if output is not sys.stdout:
+            output.close()
+    found = sum(record['has_payload'] for record in records)
+    print(f"{len(records)} image(s), {scanned} scanned and {len(records) - scanned} unchanged since the last scan: "
+          f"{found} with a payload.", file=sys.stderr)
+    return 1 if any('error' in record for record in records) else 0
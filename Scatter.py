@@ -0,0 +1,104 @@
+import base64
+from functools import lru_cache
+
+import numpy as np
+from cryptography.hazmat.primitives import hashes
+from cryptography.hazmat.primitives.kdf.hkdf import HKDF
+
+from Header import HEADER_ROWS
+
+RUN_PIXELS = 8  # pixels per run; runs are shuffled rather than single pixels, so fancy indexing moves whole runs
+# and stays close to the speed of row by row embedding
+ORDER_CACHE_SIZE = 4  # run orders kept in memory; a 12 MP carrier takes 6 MB
+
+
+def scatter_seed(key):
+    """
+    Derives the seed of the run order from a Fernet key, so only holders of the key know where the payload is.
+
+    Parameters:
+        key (str or bytes): The Fernet key.
+
+    Returns:
+        int: A 256-bit seed.
+    """
+    key_bytes = base64.urlsafe_b64decode(key)
+    if len(key_bytes) != 32:
+        raise ValueError("Fernet key must be 32 url-safe base64-encoded bytes.")
+    hkdf = HKDF(algorithm=hashes.SHA256(), length=32, salt=None, info=b'steganography scatter order')
+    return int.from_bytes(hkdf.derive(key_bytes), 'big')
+
+
+@lru_cache(maxsize=ORDER_CACHE_SIZE)
+def _run_order(height, width, key):
+    """
+    Builds the run order of an image size and key. Cached on (height, width, key) so batches of same-size carriers
+    encoded with one key shuffle only once.
+    """
+    order = np.arange(run_count(height, width), dtype=np.uint32)  # uint32 halves the memory of the default int64,
+    # and shuffling in place avoids a second copy
+    np.random.default_rng(scatter_seed(key)).shuffle(order)
+    order.setflags(write=False)  # the array is shared between callers, so it must not be modified in place
+    return order
+
+
+def run_order(height, width, key):
+    """
+    Returns the order in which a scattered payload visits the runs of pixels below the header rows: a pseudo-random
+    permutation seeded by the key.
+
+    Parameters:
+        height (int): Height of the image in pixels.
+        width (int): Width of the image in pixels.
+        key (str or bytes): The Fernet key.
+
+    Returns:
+        numpy.ndarray: The read-only permutation of the run indexes (see pixel_runs), as uint32.
+    """
+    return _run_order(height, width, key.decode() if isinstance(key, bytes) else key)
+
+
+def run_count(height, width):
+    """
+    Number of whole runs of RUN_PIXELS pixels below the header rows. The few pixels after the last whole run are
+    not used.
+    """
+    return max(height - HEADER_ROWS, 0) * width // RUN_PIXELS
+
+
+def pixel_runs(img):
+    """
+    Views the pixels below the header rows as runs of RUN_PIXELS consecutive pixels.
+
+    Parameters:
+        img (numpy.ndarray): The image array. It must be contiguous, like a loaded image or a copy of one, so the
+            runs are a view of it rather than a copy.
+
+    Returns:
+        numpy.ndarray: The runs, shaped (runs, RUN_PIXELS, channels).
+    """
+    count = run_count(img.shape[0], img.shape[1])
+    return img[HEADER_ROWS:].reshape(-1, img.shape[2])[:count * RUN_PIXELS].reshape(count, RUN_PIXELS, img.shape[2])
+
+
+def scatter_capacity(height, width, density=1, channels=3):
+    """
+    Calculates the capacity of an image of the given dimensions to hold a scattered payload.
+
+    Parameters:
+        height (int): Height of the image in pixels.
+        width (int): Width of the image in pixels.
+        density (int): Number of least significant bits used per channel.
+        channels (int): Number of channels holding payload.
+
+    Returns:
+        int: The maximum number of bytes that can be encoded into the image.
+    """
+    return run_count(height, width) * RUN_PIXELS * channels * density // 8
+
+
+def clear_cache():
+    """
+    Drops every cached run order.
+    """
+    _run_order.cache_clear()
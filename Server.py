@@ -0,0 +1,359 @@
+import json
+import os
+import sys
+import threading
+import time
+from concurrent.futures import ProcessPoolExecutor
+from contextlib import contextmanager
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlsplit
+
+import cv2
+import numpy as np
+from cryptography.fernet import Fernet
+
+from Capacity import capacity_for_shape
+from Decoding import decode_bytes
+from Encoding import encode_bytes
+from Header import MAX_DENSITY
+from ImageCache import PNG_HEADER_SIZE, png_info
+from PngStream import PNG_SIGNATURE
+
+MAX_BODY_SIZE = 256 * 1024 * 1024  # larger request bodies are refused with 413
+ENDPOINTS = ('/encode', '/decode', '/capacity', '/metrics')  # requests to any other path are counted as 'other'
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)  # upper bounds of the histogram, seconds
+
+
+def encode_job(png_bytes, message, key, density, start_row, start_col, scatter, compression):
+    """
+    Encodes a message into a PNG image. Runs in a worker process of the pool.
+
+    Returns:
+        tuple: The result message (str) and the encoded PNG image (bytes) or None, as returned by encode_bytes.
+    """
+    return encode_bytes(png_bytes, message, key, start_row, start_col, density, scatter, compression)
+
+
+def decode_job(png_bytes, key):
+    """
+    Decodes the payload of a PNG image. Runs in a worker process of the pool.
+
+    Returns:
+        tuple: The result message (str) and the payload (str or bytes) or None, as returned by decode_bytes.
+    """
+    return decode_bytes(png_bytes, key)
+
+
+def capacity_job(png_bytes, start_row, start_col):
+    """
+    Calculates the capacity of a PNG image for every density. Runs in a worker process of the pool. The dimensions
+    are read from the IHDR chunk when possible, so most images are not decoded at all.
+
+    Returns:
+        dict: The dimensions of the image and its capacity in bytes keyed by bits per channel, or None if the image
+        could not be read.
+    """
+    info = png_info(png_bytes[:PNG_HEADER_SIZE])
+    if info is not None:
+        height, width, channels = info.height, info.width, info.channels
+    else:  # not a layout png_info recognises; decode the pixels instead
+        img = cv2.imdecode(np.frombuffer(png_bytes, dtype=np.uint8), cv2.IMREAD_UNCHANGED)
+        if img is None:
+            return None
+        height, width, channels = img.shape[0], img.shape[1], 1 if img.ndim == 2 else img.shape[2]
+    return {'width': width, 'height': height, 'start_row': start_row, 'start_col': start_col,
+            'capacity': {density: capacity_for_shape(height, width, start_row, start_col, density, channels)
+                         for density in range(1, MAX_DENSITY + 1)}}
+
+
+class ServiceMetrics:
+    """
+    Request counts and latency histograms of the service, shared by the request handler threads.
+
+    Attributes:
+        requests (dict): Number of responses, keyed by endpoint and then by HTTP status.
+        latency (dict): Per endpoint, the number of responses that took at most each of LATENCY_BUCKETS seconds
+            (and one more count for slower ones), the sum of their latencies and their count.
+        in_flight (int): Requests holding a slot: being read, queued or running on the pool.
+        rejected (int): Requests refused with 503 because the queue was full.
+    """
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.requests = {}
+        self.latency = {}
+        self.in_flight = 0
+        self.rejected = 0
+
+    def observe(self, endpoint, status, seconds):
+        """
+        Records one response.
+
+        Parameters:
+            endpoint (str): Path of the endpoint.
+            status (int): HTTP status of the response.
+            seconds (float): Time from receiving the request to sending the response.
+        """
+        with self.lock:
+            counts = self.requests.setdefault(endpoint, {})
+            counts[status] = counts.get(status, 0) + 1
+            histogram = self.latency.setdefault(endpoint, {'buckets': [0] * (len(LATENCY_BUCKETS) + 1), 'sum': 0.0,
+                                                           'count': 0})
+            bucket = next((i for i, bound in enumerate(LATENCY_BUCKETS) if seconds <= bound), len(LATENCY_BUCKETS))
+            histogram['buckets'][bucket] += 1
+            histogram['sum'] += seconds
+            histogram['count'] += 1
+
+    def as_dict(self):
+        """
+        Returns:
+            dict: A snapshot of the metrics, ready to be written as JSON.
+        """
+        with self.lock:
+            return {
+                'requests': {endpoint: {str(status): count for status, count in counts.items()}
+                             for endpoint, counts in self.requests.items()},
+                'latency': {endpoint: {'buckets': dict(zip([str(b) for b in LATENCY_BUCKETS] + ['+Inf'],
+                                                           histogram['buckets'])),
+                                       'sum': histogram['sum'], 'count': histogram['count']}
+                            for endpoint, histogram in self.latency.items()},
+                'in_flight': self.in_flight,
+                'rejected': self.rejected,
+            }
+
+
+class SteganographyServer(ThreadingHTTPServer):
+    """
+    HTTP server that runs encode, decode and capacity jobs on a bounded process pool. Every request is handled on
+    its own thread; at most pool_size + queue_size requests are accepted at once and further requests get 503,
+    before their body is read, until a slot frees up.
+
+    Attributes:
+        pool_size (int): Number of worker processes.
+        pool (ProcessPoolExecutor): The worker processes.
+        slots (threading.BoundedSemaphore): One slot per request that may be read, queued or running.
+        metrics (ServiceMetrics): Request counts and latency histograms.
+    """
+
+    daemon_threads = True
+
+    def __init__(self, address, pool_size=None, queue_size=16):
+        """
+        Starts the worker pool and binds the server.
+
+        Parameters:
+            address (tuple): The host and port to listen on.
+            pool_size (int): Number of worker processes, or None for one per CPU.
+            queue_size (int): Number of jobs that may wait for a free worker.
+        """
+        super().__init__(address, RequestHandler)
+        self.pool_size = pool_size or os.cpu_count() or 1
+        self.pool = ProcessPoolExecutor(max_workers=self.pool_size)
+        self.slots = threading.BoundedSemaphore(self.pool_size + queue_size)
+        self.metrics = ServiceMetrics()
+
+    @contextmanager
+    def job_slot(self):
+        """
+        Holds one of the slots while a request is read and its job runs. The slot is taken before the body is read,
+        so an overloaded server refuses uploads instead of buffering them.
+
+        Raises:
+            QueueFull: If every worker is busy and the queue is full.
+        """
+        if not self.slots.acquire(blocking=False):
+            with self.metrics.lock:
+                self.metrics.rejected += 1
+            raise QueueFull()
+        with self.metrics.lock:
+            self.metrics.in_flight += 1
+        try:
+            yield
+        finally:
+            with self.metrics.lock:
+                self.metrics.in_flight -= 1
+            self.slots.release()
+
+    def run_job(self, function, *args):
+        """
+        Runs a job on the pool and waits for its result. The caller must hold a slot (see job_slot).
+
+        Returns:
+            The result of the job.
+        """
+        return self.pool.submit(function, *args).result()
+
+    def server_close(self):
+        super().server_close()
+        self.pool.shutdown(cancel_futures=True)
+
+
+class QueueFull(Exception):
+    """
+    Raised when a job can't be accepted because every worker is busy and the queue is full.
+    """
+
+
+class RequestHandler(BaseHTTPRequestHandler):
+    """
+    Serves the endpoints of the service:
+
+        POST /encode?key=...&message=...[&density=1&start_row=...&start_col=...&scatter=1&compression=auto]
+                                                                                         PNG body -> encoded PNG
+        POST /decode?key=...                                                             PNG body -> payload
+        POST /capacity[?start_row=5&start_col=0]                                         PNG body -> JSON capacities
+        GET  /metrics                                                                    -> JSON counts, latencies
+
+    Errors are answered with a plain text message: 400 for bad input, 413 for a body over MAX_BODY_SIZE and 503
+    when the queue is full.
+    """
+
+    server_version = 'Steganography/1.0'
+
+    def do_GET(self):
+        start = time.perf_counter()
+        path = urlsplit(self.path).path
+        if path == '/metrics':
+            self.respond(200, json.dumps(self.server.metrics.as_dict(), indent=2).encode(), 'application/json')
+        else:
+            self.respond(404, b'Not found.')
+        self.server.metrics.observe(path if path in ENDPOINTS else 'other', self.status, time.perf_counter() - start)
+
+    def do_POST(self):
+        start = time.perf_counter()
+        url = urlsplit(self.path)
+        handler = {'/encode': self.encode, '/decode': self.decode, '/capacity': self.capacity}.get(url.path)
+        try:
+            if handler is None:
+                self.respond(404, b'Not found.')
+            else:
+                params = {name: values[-1] for name, values in parse_qs(url.query).items()}
+                with self.server.job_slot():
+                    body = self.read_body()
+                    if body is not None:
+                        handler(params, body)
+        except QueueFull:
+            self.respond(503, b'Error: The server is busy. Please retry later.', headers={'Retry-After': '1'})
+            self.close_connection = True  # the body was not read, so the connection can't be reused
+        except ValueError as error:
+            self.respond(400, f"Error: {error}".encode())
+        except Exception as error:  # a worker crashed; answer rather than dropping the connection
+            self.respond(500, f"Error: {error}".encode())
+        self.server.metrics.observe(url.path if url.path in ENDPOINTS else 'other', self.status,
+                                    time.perf_counter() - start)
+
+    def read_body(self):
+        """
+        Reads the request body, answering 400 if its length is not a non-negative integer and 413 if it is too
+        large.
+
+        Returns:
+            bytes: The body, or None if a response was already sent.
+        """
+        length = self.headers.get('Content-Length') or '0'
+        if not (length.isascii() and length.isdigit()):  # rfile.read(-1) would wait for the client to close
+            self.respond(400, b'Error: Invalid Content-Length.')
+            self.close_connection = True
+            return None
+        length = int(length)
+        if length > MAX_BODY_SIZE:
+            self.respond(413, b'Error: The image is too large.')
+            self.close_connection = True  # the body was not read, so the connection can't be reused
+            return None
+        return self.rfile.read(length)
+
+    def encode(self, params, body):
+        """
+        Encodes the 'message' parameter into the PNG body. The key used is returned in the X-Key header.
+        """
+        key = params.get('key') or Fernet.generate_key().decode()  # Generate Fernet key if none provided
+        Fernet(key)  # Validate key format
+        result, encoded = self.server.run_job(encode_job, body, params.get('message', ''), key,
+                                              int(params.get('density', 1)), optional_int(params, 'start_row'),
+                                              optional_int(params, 'start_col'),
+                                              params.get('scatter', '').lower() in ('1', 'true', 'yes'),
+                                              params.get('compression') or None)
+        if encoded is None:
+            self.respond(400, result.encode())
+        else:
+            self.respond(200, encoded, 'image/png', {'X-Key': key})
+
+    def decode(self, params, body):
+        """
+        Decodes the payload of the PNG body: text as text/plain, a file as application/octet-stream.
+        """
+        if not params.get('key'):
+            raise ValueError("A Fernet key is required.")
+        Fernet(params['key'])  # Validate key format
+        result, payload = self.server.run_job(decode_job, body, params['key'])
+        if payload is None:
+            self.respond(400, result.encode())
+        elif isinstance(payload, str):
+            self.respond(200, payload.encode('utf-8'), 'text/plain; charset=utf-8')
+        else:
+            self.respond(200, payload, 'application/octet-stream')
+
+    def capacity(self, params, body):
+        """
+        Answers the dimensions of the PNG body and its capacity at every density, as JSON.
+        """
+        if not body.startswith(PNG_SIGNATURE):
+            raise ValueError("This program only supports PNG files.")
+        capacity = self.server.run_job(capacity_job, body, int(params.get('start_row', 5)),
+                                       int(params.get('start_col', 0)))
+        if capacity is None:
+            raise ValueError("Could not read the image.")
+        self.respond(200, json.dumps(capacity).encode(), 'application/json')
+
+    def respond(self, status, body, content_type='text/plain; charset=utf-8', headers=None):
+        """
+        Sends a complete response.
+
+        Parameters:
+            status (int): The HTTP status.
+            body (bytes): The response body.
+            content_type (str): The media type of the body.
+            headers (dict): Extra response headers.
+        """
+        self.status = status
+        self.send_response(status)
+        self.send_header('Content-Type', content_type)
+        self.send_header('Content-Length', str(len(body)))
+        for name, value in (headers or {}).items():
+            self.send_header(name, value)
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        pass  # per-request logging would flood the terminal under load; see /metrics instead
+
+
+def optional_int(params, name):
+    """
+    Reads an optional integer query parameter.
+
+    Returns:
+        int: The value, or None if the parameter is missing.
+    """
+    return int(params[name]) if params.get(name) else None
+
+
+def serve(host='127.0.0.1', port=8000, pool_size=None, queue_size=16):
+    """
+    Runs the service until interrupted.
+
+    Parameters:
+        host (str): The address to listen on. Keep the default to accept local connections only.
+        port (int): The port to listen on.
+        pool_size (int): Number of worker processes, or None for one per CPU.
+        queue_size (int): Number of jobs that may wait for a free worker before requests are refused with 503.
+    """
+    server = SteganographyServer((host, port), pool_size, queue_size)
+    print(f"Serving on http://{host}:{server.server_port} with {server.pool_size} worker(s) and room for "
+          f"{queue_size} queued job(s). Press Ctrl+C to stop.", file=sys.stderr)
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
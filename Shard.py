@@ -0,0 +1,367 @@
+import io
+import json
+import os
+import shutil
+import sys
+import tempfile
+from collections import defaultdict
+from concurrent.futures import ProcessPoolExecutor
+
+import cryptography.exceptions
+from cryptography.fernet import Fernet
+
+from Capacity import capacity_of_files, image_shape
+from CommandIO import close_output, command_key, open_output, open_payload
+from Decoding import BitReader, decode_header
+from Encoding import BitWriter, encode_header, layout_error
+from Header import (FLAG_SLOTS, FLAG_STREAM, HEADER_ROWS, SHARD_SIZE, channel_flags, density_flags, flags_density,
+                    pack_shard_header, payload_view, unpack_shard_header)
+from ImageCache import load_image, save_image, writable_copy
+from Scan import list_images
+from StreamCipher import decrypt_chunks, encrypt_chunks, encrypted_size
+
+PAYLOAD_ID_SIZE = 16
+PENDING_SHARDS = 2  # shards queued per worker process; bounds the encrypted payload held in memory while encoding
+
+
+def plan_shards(capacities, length):
+    """
+    Picks the carriers of a payload and the number of its bytes each one holds, filling the largest carriers first
+    so the payload is spread over as few images as possible.
+
+    Parameters:
+        capacities (dict): The capacity in bytes of each carrier, keyed by path; None for unreadable images.
+        length (int): Length of the encrypted payload in bytes.
+
+    Returns:
+        list: One (path, number of payload bytes) tuple per shard, in shard order.
+
+    Raises:
+        ValueError: If the carriers can't hold the whole payload.
+    """
+    rooms = sorted(((capacity - SHARD_SIZE, path) for path, capacity in capacities.items()
+                    if capacity and capacity > SHARD_SIZE), key=lambda room: (-room[0], room[1]))
+    plan = []
+    remaining = length
+    for room, path in rooms:
+        if remaining == 0:
+            break
+        plan.append((path, min(room, remaining)))
+        remaining -= plan[-1][1]
+    if remaining:
+        raise ValueError(f"The carriers hold only {length - remaining} of the {length} bytes of the encrypted "
+                         f"payload. Add more or larger images, or use a higher density.")
+    return plan
+
+
+def shard_data(key, payload, size, plan, payload_id):
+    """
+    Encrypts a payload in chunks (see StreamCipher) and cuts the encrypted stream into the shards of a plan, each
+    with its shard record in front.
+
+    Parameters:
+        key (str): The Fernet key.
+        payload (file object): The payload, opened in binary mode.
+        size (int): The payload size in bytes.
+        plan (list): The shards, as returned by plan_shards.
+        payload_id (bytes): The id shared by every shard of the payload.
+
+    Yields:
+        bytes: The data embedded into each carrier of the plan, in order.
+    """
+    length = encrypted_size(size)
+    chunks = encrypt_chunks(key, payload, size)
+    pending = b''
+    for index, (_, room) in enumerate(plan):
+        while len(pending) < room:
+            pending += next(chunks)
+        yield pack_shard_header(payload_id, index, len(plan), length) + pending[:room]
+        pending = pending[room:]
+
+
+def shard_path(carrier, output_dir=None):
+    """
+    Returns:
+        str: Where the shard embedded into a carrier is written: the carrier name with '_encoded' at the end, in the
+        same format, in output_dir or next to the carrier.
+    """
+    base, extension = os.path.splitext(os.path.basename(carrier))
+    return os.path.join(output_dir or os.path.dirname(carrier), f"{base}_encoded{extension}")
+
+
+def encode_shard(carrier, output_path, data, density=1):
+    """
+    Embeds one shard into a carrier, from the first row below the header. Runs in a worker process, so it never
+    raises and always returns a record.
+
+    Parameters:
+        carrier (str): Path of the carrier image.
+        output_path (str): Path of the encoded image to write.
+        data (bytes): The shard, record included.
+        density (int): Number of least significant bits used per channel.
+
+    Returns:
+        dict: The result record written to the JSONL output.
+    """
+    record = {'image': carrier, 'output': output_path, 'bytes': len(data)}
+    try:
+        img = load_image(carrier)
+        if img is None:
+            return dict(record, status='error', message="Error: Could not read the image.")
+        img = writable_copy(img, output_path)  # the loaded image may be shared with other callers
+        flags = density_flags(density) | FLAG_STREAM | channel_flags(img)
+        error = layout_error(img.shape[0], img.shape[1], payload_view(img, flags).shape[2])
+        if error:
+            return dict(record, status='error', message=f"Error: {error}")
+        encode_header(HEADER_ROWS, 0, len(data), img, flags)
+        writer = BitWriter(payload_view(img, flags), HEADER_ROWS, 0, density)
+        writer.write(data)
+        writer.close()
+        save_image(output_path, img)
+    except (OSError, ValueError) as error:
+        return dict(record, status='error', message=f"Error: {error}")
+    return dict(record, status='ok', message="Shard encoded successfully!")
+
+
+def encode_shards(key, payload, size, carriers, density=1, output_dir=None, workers=None):
+    """
+    Spreads a payload over several carriers: it is encrypted once, cut into shards that fill the largest carriers
+    first (see plan_shards), and the shards are embedded on a process pool while the rest of the payload is still
+    being encrypted.
+
+    Parameters:
+        key (str): The Fernet key.
+        payload (file object): The payload, opened in binary mode.
+        size (int): The payload size in bytes.
+        carriers (list): Paths of the carrier images to choose from.
+        density (int): Number of least significant bits used per channel.
+        output_dir (str): Directory of the encoded images, or None to write each one next to its carrier.
+        workers (int): Number of worker processes, or None for one per CPU.
+
+    Returns:
+        tuple: The payload id (bytes) and the result record of each shard (list), in shard order.
+
+    Raises:
+        ValueError: If the carriers can't hold the whole payload.
+    """
+    capacities = capacity_of_files(carriers, HEADER_ROWS, 0, density)
+    for path in carriers:
+        shape = image_shape(path)  # cached by capacity_of_files
+        if shape is not None and layout_error(*shape):
+            capacities[path] = None  # too small to hold the header, so it can't take a shard
+    plan = plan_shards(capacities, encrypted_size(size))
+    payload_id = os.urandom(PAYLOAD_ID_SIZE)
+    limit = PENDING_SHARDS * (workers or os.cpu_count() or 1)
+    futures = []
+    with ProcessPoolExecutor(max_workers=workers) as executor:
+        for index, data in enumerate(shard_data(key, payload, size, plan, payload_id)):
+            if index >= limit:
+                futures[index - limit].result()  # wait for an earlier shard before encrypting more
+            carrier = plan[index][0]
+            futures.append(executor.submit(encode_shard, carrier, shard_path(carrier, output_dir), data, density))
+        records = [dict(future.result(), index=index) for index, future in enumerate(futures)]
+    return payload_id, records
+
+
+def read_shard(path, work_dir):
+    """
+    Extracts the shard an image holds into a file of a working directory. Runs in a worker process, so it never
+    raises and always returns a record.
+
+    Parameters:
+        path (str): Path of the image.
+        work_dir (str): Directory the shard is written to, named after its payload id and index.
+
+    Returns:
+        dict: The record of the image: its path, and if it holds a shard, the payload id (hex), index and count of
+        the shard, the length of the whole encrypted payload and the file holding the shard.
+    """
+    record = {'image': path, 'shard': False}
+    img = load_image(path)
+    if img is None:
+        return dict(record, error="Error: Could not read the image.")
+    header = decode_header(img)
+    if header is None or not header.flags & FLAG_STREAM or header.flags & FLAG_SLOTS:
+        return record
+    reader = BitReader(payload_view(img, header.flags), header.start_row, header.start_col,
+                       flags_density(header.flags))
+    shard = unpack_shard_header(reader.read(min(SHARD_SIZE, header.length)))
+    if shard is None:
+        return record
+    data_path = os.path.join(work_dir, f"{shard.payload_id.hex()}.{shard.index}")
+    try:
+        with open(data_path, 'wb') as data_file:
+            data_file.write(reader.read(header.length - SHARD_SIZE))
+    except OSError as error:
+        return dict(record, error=f"Error: {error}")
+    return dict(record, shard=True, payload_id=shard.payload_id.hex(), index=shard.index, count=shard.count,
+                length=shard.length, data_path=data_path)
+
+
+class ShardStream:
+    """
+    Reads the shards of a payload, held in separate files, as one stream.
+    """
+
+    def __init__(self, paths):
+        """
+        Parameters:
+            paths (list): The files holding the shards, in shard order.
+        """
+        self.paths = list(paths)
+        self.file = io.BytesIO()
+
+    def read(self, count):
+        """
+        Reads the next bytes of the stream, moving on to the next shard whenever one runs out.
+        """
+        data = self.file.read(count)
+        while len(data) < count and self.paths:
+            self.file.close()
+            self.file = open(self.paths.pop(0), 'rb')
+            data += self.file.read(count - len(data))
+        return data
+
+    def close(self):
+        self.file.close()
+
+
+def pick_shards(records, payload_id=None):
+    """
+    Picks the shards of one payload among the records returned by read_shard, and checks that none is missing.
+
+    Parameters:
+        records (list): The records of the images read.
+        payload_id (str): Id of the payload to reassemble, in hex, or None if the images hold only one payload.
+
+    Returns:
+        list: The records of the shards of the payload, one per index, in shard order.
+
+    Raises:
+        ValueError: If no payload or several payloads were found, or shards are missing or inconsistent.
+    """
+    payloads = defaultdict(dict)
+    for record in records:
+        if record['shard'] and (payload_id is None or record['payload_id'] == payload_id):
+            payloads[record['payload_id']].setdefault(record['index'], record)  # copies of a shard are skipped
+    if not payloads:
+        raise ValueError("No shards found." if payload_id is None else f"No shards of payload {payload_id} found.")
+    if len(payloads) > 1:
+        raise ValueError(f"The images hold shards of {len(payloads)} payloads ({', '.join(sorted(payloads))}). "
+                         f"Choose one with --payload-id.")
+    shards = next(iter(payloads.values()))
+    first = next(iter(shards.values()))
+    missing = [index for index in range(first['count']) if index not in shards]
+    if missing:
+        raise ValueError(f"Found {len(shards)} of the {first['count']} shards; missing shard(s) "
+                         f"{', '.join(map(str, missing))}.")
+    ordered = [shards[index] for index in range(first['count'])]
+    if any((shard['count'], shard['length']) != (first['count'], first['length']) for shard in ordered) or \
+            sum(os.path.getsize(shard['data_path']) for shard in ordered) != first['length']:
+        raise ValueError("The shards don't fit together; some of them were modified.")
+    return ordered
+
+
+def decode_shards(key, paths, output, payload_id=None, workers=None):
+    """
+    Reassembles and decrypts a payload spread over several images. The shards are extracted on a process pool, in
+    any order, then decrypted one chunk at a time in shard order, so memory use does not grow with the payload.
+
+    Parameters:
+        key (str): The Fernet key.
+        paths (list): Paths of the images to look for shards in; images without one are skipped.
+        output (file object): Where to write the payload, opened in binary mode.
+        payload_id (str): Id of the payload to reassemble, in hex, or None if the images hold only one payload.
+        workers (int): Number of worker processes, or None for one per CPU.
+
+    Returns:
+        list: The records of the shards used, in shard order.
+
+    Raises:
+        ValueError: If the shards are missing or inconsistent, or the key does not match the payload.
+    """
+    work_dir = tempfile.mkdtemp(prefix='stego-shards-')
+    try:
+        with ProcessPoolExecutor(max_workers=workers) as executor:
+            chunksize = max(1, len(paths) // (4 * (workers or os.cpu_count() or 1)))
+            records = list(executor.map(read_shard, paths, [work_dir] * len(paths), chunksize=chunksize))
+        shards = pick_shards(records, payload_id)
+        stream = ShardStream(shard['data_path'] for shard in shards)
+        try:
+            for chunk in decrypt_chunks(key, stream.read, shards[0]['length']):
+                output.write(chunk)
+        except (cryptography.exceptions.InvalidTag, ValueError):
+            raise ValueError("Decryption failed: invalid key, or the shards were modified.")
+        finally:
+            stream.close()
+    finally:
+        shutil.rmtree(work_dir)
+    return [{name: value for name, value in shard.items() if name != 'data_path'} for shard in shards]
+
+
+def carrier_paths(sources):
+    """
+    Returns:
+        list: The images given on the command line, with directories expanded to the images they hold.
+    """
+    return [path for source in sources for path in list_images(source)]
+
+
+def shard_encode_command(args):
+    """
+    Entry point for the 'shard-encode' subcommand: writes one JSONL record per shard.
+
+    Parameters:
+        args (argparse.Namespace): The parsed command line arguments.
+
+    Returns:
+        int: The process exit code: 1 if the payload does not fit or any shard could not be written.
+    """
+    key = command_key(args.key)
+    try:
+        Fernet(key)  # Validate key format
+        payload, size = open_payload(args)
+        with payload:
+            payload_id, records = encode_shards(key, payload, size, carrier_paths(args.carriers), args.density,
+                                                args.output_dir, args.workers)
+    except (OSError, ValueError) as error:
+        print(f"Error: {error}", file=sys.stderr)
+        return 1
+    output = open(args.output, 'w', encoding='utf-8') if args.output else sys.stdout
+    try:
+        for record in records:
+            output.write(json.dumps(dict(record, payload_id=payload_id.hex())) + '\n')
+    finally:
+        if output is not sys.stdout:
+            output.close()
+    failures = sum(record['status'] != 'ok' for record in records)
+    print(f"Payload {payload_id.hex()} spread over {len(records)} image(s)"
+          f"{f', {failures} of which failed' if failures else ''}.", file=sys.stderr)
+    return 1 if failures else 0
+
+
+def shard_decode_command(args):
+    """
+    Entry point for the 'shard-decode' subcommand: writes the reassembled payload to a file or standard output.
+
+    Parameters:
+        args (argparse.Namespace): The parsed command line arguments.
+
+    Returns:
+        int: The process exit code.
+    """
+    try:
+        Fernet(args.key)  # Validate key format
+        output = open_output(args.output)
+    except (OSError, ValueError) as error:
+        print(f"Error: {error}", file=sys.stderr)
+        return 1
+    try:
+        shards = decode_shards(args.key, carrier_paths(args.sources), output, args.payload_id, args.workers)
+    except (OSError, ValueError) as error:
+        print(f"Error: {error}", file=sys.stderr)
+        close_output(output, args.output, failed=True)
+        return 1
+    close_output(output, args.output)
+    print(f"Payload {shards[0]['payload_id']} reassembled from {len(shards)} shard(s).", file=sys.stderr)
+    return 0
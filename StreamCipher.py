@@ -0,0 +1,104 @@
+import base64
+import os
+import struct
+
+from cryptography.hazmat.primitives import hashes
+from cryptography.hazmat.primitives.ciphers.aead import AESGCM
+from cryptography.hazmat.primitives.kdf.hkdf import HKDF
+
+CHUNK_SIZE = 64 * 1024  # plaintext bytes per authenticated chunk
+NONCE_PREFIX_SIZE = 8  # random bytes stored in front of the chunks; each chunk nonce appends a 4-byte counter
+TAG_SIZE = 16  # GCM authentication tag stored after every chunk
+
+
+def stream_cipher(key):
+    """
+    Derives the chunk cipher from a Fernet key, so the same key protects text and file payloads.
+
+    Parameters:
+        key (str or bytes): The Fernet key.
+
+    Returns:
+        AESGCM: The cipher used for every chunk of a payload.
+    """
+    key_bytes = base64.urlsafe_b64decode(key)
+    if len(key_bytes) != 32:
+        raise ValueError("Fernet key must be 32 url-safe base64-encoded bytes.")
+    hkdf = HKDF(algorithm=hashes.SHA256(), length=32, salt=None, info=b'steganography chunked payload')
+    return AESGCM(hkdf.derive(key_bytes))
+
+
+def chunk_count(size):
+    """
+    Number of chunks a payload of the given size is split into. An empty payload still has one (empty) chunk.
+    """
+    return max(1, -(-size // CHUNK_SIZE))
+
+
+def encrypted_size(size):
+    """
+    Size of the encrypted form of a payload of the given size, known before anything is encrypted.
+
+    Parameters:
+        size (int): The payload size in bytes.
+
+    Returns:
+        int: The encrypted size in bytes.
+    """
+    return NONCE_PREFIX_SIZE + size + chunk_count(size) * TAG_SIZE
+
+
+def chunk_context(prefix, index, last):
+    """
+    Builds the nonce and associated data of a chunk. Binding the index and the last-chunk marker to every chunk
+    means chunks can't be reordered, dropped or truncated without failing authentication.
+    """
+    return prefix + struct.pack('>I', index), struct.pack('>I?', index, last)
+
+
+def encrypt_chunks(key, payload, size):
+    """
+    Encrypts a payload one chunk at a time.
+
+    Parameters:
+        key (str or bytes): The Fernet key.
+        payload (file object): The payload, opened in binary mode.
+        size (int): The payload size in bytes.
+
+    Yields:
+        bytes: The nonce prefix, then each encrypted chunk with its tag.
+    """
+    cipher = stream_cipher(key)
+    prefix = os.urandom(NONCE_PREFIX_SIZE)
+    yield prefix
+    count = chunk_count(size)
+    for index in range(count):
+        chunk = payload.read(CHUNK_SIZE)
+        nonce, associated_data = chunk_context(prefix, index, index == count - 1)
+        yield cipher.encrypt(nonce, chunk, associated_data)
+
+
+def decrypt_chunks(key, read, length):
+    """
+    Decrypts a chunked payload one chunk at a time.
+
+    Parameters:
+        key (str or bytes): The Fernet key.
+        read (callable): Returns the next n bytes of the encrypted payload when called with n.
+        length (int): The encrypted payload size in bytes.
+
+    Yields:
+        bytes: Each decrypted chunk.
+
+    Raises:
+        cryptography.exceptions.InvalidTag: If the key is wrong or the payload was modified.
+    """
+    cipher = stream_cipher(key)
+    prefix = read(NONCE_PREFIX_SIZE)
+    count = max(1, -(-(length - NONCE_PREFIX_SIZE) // (CHUNK_SIZE + TAG_SIZE)))
+    remaining = length - NONCE_PREFIX_SIZE
+    for index in range(count):
+        size = min(CHUNK_SIZE + TAG_SIZE, remaining)
+        remaining -= size
+        nonce, associated_data = chunk_context(prefix, index, index == count - 1)
+        yield cipher.decrypt(nonce, read(size), associated_data)
@@ -0,0 +1,449 @@
+import os
+import shutil
+import sys
+
+import cryptography.exceptions
+import cv2
+import numpy as np
+from cryptography.fernet import Fernet
+
+from Capacity import capacity_for_shape
+from CommandIO import close_output, command_key, open_output, open_payload
+from Decoding import BitReader, extract_bits
+from Encoding import BitWriter, embed_bits, layout_error, to_bits
+from Header import (FLAG_STREAM, HEADER_ROWS, VIDEO_SIZE, channel_flags, density_flags, flags_density,
+                    pack_video_header, payload_view, unpack_video_header)
+from ImageCache import save_image
+from Scan import list_images
+from StreamCipher import decrypt_chunks, encrypt_chunks, encrypted_size
+
+VIDEO_FORMATS = ('.mkv', '.avi')  # containers video carriers are written in, with the lossless FFV1 codec
+VIDEO_CODEC = 'FFV1'
+DEFAULT_FPS = 25.0  # frame rate written when the source does not report one
+
+
+class VideoReader:
+    """
+    Reads the frames of a video file one at a time, so only one frame is held in memory.
+
+    Attributes:
+        count (int): Number of frames the container reports (see encode_video for when it is wrong).
+        fps (float): Frame rate of the video.
+        position (int): Index of the next frame read.
+    """
+
+    def __init__(self, path):
+        """
+        Parameters:
+            path (str): Path of the video file.
+
+        Raises:
+            ValueError: If the file could not be opened.
+        """
+        self.capture = cv2.VideoCapture(path)
+        if not self.capture.isOpened():
+            raise ValueError(f"Could not open {path} as a video.")
+        self.count = int(self.capture.get(cv2.CAP_PROP_FRAME_COUNT))
+        self.fps = self.capture.get(cv2.CAP_PROP_FPS) or DEFAULT_FPS
+        self.position = 0
+
+    def read(self):
+        """
+        Returns:
+            numpy.ndarray: The next frame (8-bit BGR, writable), or None after the last one.
+        """
+        ok, frame = self.capture.read()
+        if not ok:
+            return None
+        self.position += 1
+        return frame
+
+    def seek(self, index):
+        """
+        Moves to a later frame, directly if the container supports it (every FFV1 frame is a key frame, so the
+        frame reached is exact), frame by frame otherwise.
+        """
+        if index > self.position and self.capture.set(cv2.CAP_PROP_POS_FRAMES, index):
+            self.position = index
+        while self.position < index and self.capture.grab():
+            self.position += 1
+
+    def close(self):
+        self.capture.release()
+
+
+class SequenceReader:
+    """
+    Reads a directory of image files as the frames of a video, in name order, one at a time. Frames must be
+    numbered with the same number of digits for name order to be frame order.
+
+    Attributes:
+        names (list): File names of the frames.
+        count (int): Number of frames.
+        fps (float): Frame rate used if the frames are written as a video.
+        position (int): Index of the next frame read.
+    """
+
+    def __init__(self, path):
+        """
+        Parameters:
+            path (str): Path of the directory.
+        """
+        self.paths = list_images(path)
+        self.names = [os.path.basename(frame_path) for frame_path in self.paths]
+        self.count = len(self.paths)
+        self.fps = DEFAULT_FPS
+        self.position = 0
+        self.shape = None
+
+    def read(self):
+        """
+        Returns:
+            numpy.ndarray: The next frame, with every channel and bit depth of its file, or None after the last one.
+
+        Raises:
+            ValueError: If a frame could not be read, or differs in size or layout from the first one.
+        """
+        if self.position >= self.count:
+            return None
+        frame = cv2.imread(self.paths[self.position], cv2.IMREAD_UNCHANGED)
+        if frame is None:
+            raise ValueError(f"Could not read the frame {self.paths[self.position]}.")
+        if self.shape is None:
+            self.shape = (frame.shape, frame.dtype)
+        elif (frame.shape, frame.dtype) != self.shape:
+            raise ValueError(f"The frame {self.paths[self.position]} differs in size or layout from the first one.")
+        self.position += 1
+        return frame
+
+    def seek(self, index):
+        """
+        Moves to a later frame.
+        """
+        self.position = max(self.position, min(index, self.count))
+
+    def close(self):
+        pass
+
+
+class VideoWriter:
+    """
+    Writes frames to a video file with the lossless FFV1 codec.
+    """
+
+    def __init__(self, path, fps, frame):
+        """
+        Parameters:
+            path (str): Path of the video file, with one of VIDEO_FORMATS as extension.
+            fps (float): Frame rate of the video.
+            frame (numpy.ndarray): The first frame, which gives the size of every frame.
+
+        Raises:
+            ValueError: If the frames can't be stored in a video file, or the file could not be opened.
+        """
+        if frame.ndim != 3 or frame.shape[2] != 3 or frame.dtype.itemsize != 1:
+            raise ValueError("Video files hold 8-bit colour frames only. Write the frames as a directory instead.")
+        self.writer = cv2.VideoWriter(path, cv2.VideoWriter_fourcc(*VIDEO_CODEC), fps,
+                                      (frame.shape[1], frame.shape[0]))
+        if not self.writer.isOpened():
+            raise ValueError(f"Could not write {path} with the {VIDEO_CODEC} codec.")
+
+    def write(self, frame):
+        self.writer.write(frame)
+
+    def close(self):
+        self.writer.release()
+
+
+class SequenceWriter:
+    """
+    Writes frames as image files of a directory, named like the frames they were read from.
+    """
+
+    def __init__(self, path, names):
+        """
+        Parameters:
+            path (str): Path of the directory, created if missing.
+            names (list): File names of the frames, in frame order.
+        """
+        os.makedirs(path, exist_ok=True)
+        self.paths = [os.path.join(path, name) for name in names]
+        self.position = 0
+
+    def write(self, frame):
+        save_image(self.paths[self.position], frame)
+        self.position += 1
+
+    def close(self):
+        pass
+
+
+def open_frames(source):
+    """
+    Opens a video file, or a directory of frames, for reading.
+
+    Returns:
+        VideoReader or SequenceReader: The reader.
+
+    Raises:
+        ValueError: If the source is neither a directory nor a video in one of VIDEO_FORMATS.
+    """
+    if os.path.isdir(source):
+        return SequenceReader(source)
+    if os.path.splitext(source)[1].lower() not in VIDEO_FORMATS:
+        raise ValueError(f"Videos must be {' or '.join(VIDEO_FORMATS)} files encoded with {VIDEO_CODEC}, or "
+                         f"directories of frames.")
+    return VideoReader(source)
+
+
+def open_writer(output, reader, frame):
+    """
+    Opens the output of an encoded video: a video file if its path has one of VIDEO_FORMATS as extension, a
+    directory of frames named like those of the source otherwise.
+    """
+    if os.path.splitext(output)[1].lower() in VIDEO_FORMATS:
+        return VideoWriter(output, reader.fps, frame)
+    if not isinstance(reader, SequenceReader):
+        raise ValueError(f"Write an encoded video as a {' or '.join(VIDEO_FORMATS)} file.")
+    return SequenceWriter(output, reader.names)
+
+
+def default_output(source):
+    """
+    Returns:
+        str: Where an encoded video is written by default: next to the source, with '_encoded' at the end of its
+        name and the same extension.
+    """
+    base, extension = os.path.splitext(os.path.normpath(source))
+    return f"{base}{extension}_encoded" if os.path.isdir(source) else f"{base}_encoded{extension}"
+
+
+def frame_capacity(frame, flags, index):
+    """
+    Returns:
+        int: The number of payload bytes a frame holds: every row of it, but the header rows of the first frame.
+    """
+    view = payload_view(frame, flags)
+    start_row = HEADER_ROWS if index == 0 else 0
+    return capacity_for_shape(view.shape[0], view.shape[1], start_row, 0, flags_density(flags), view.shape[2])
+
+
+def read_video_header(frame):
+    """
+    Decodes the video header from the first rows of the first frame.
+
+    Returns:
+        VideoHeader: The header, or None if the frame holds no valid header.
+    """
+    bits = extract_bits(payload_view(frame[:HEADER_ROWS]), count=VIDEO_SIZE * 8)
+    return unpack_video_header(np.packbits(bits).tobytes())
+
+
+class ByteStream:
+    """
+    Reads an iterator of byte strings as a stream, buffering only what one read needs.
+    """
+
+    def __init__(self, pieces):
+        """
+        Parameters:
+            pieces (iterable): The byte strings, in stream order.
+        """
+        self.pieces = iter(pieces)
+        self.buffer = bytearray()
+
+    def read(self, count):
+        """
+        Reads the next bytes of the stream; fewer than count only at its end.
+        """
+        for piece in self.pieces:
+            self.buffer += piece
+            if len(self.buffer) >= count:
+                break
+        data = bytes(self.buffer[:count])
+        del self.buffer[:count]
+        return data
+
+
+def encode_video(source, output, key, payload, size, density=1, start_frame=0):
+    """
+    Hides a payload in a lossless video or a directory of frames, one frame at a time, so memory use does not grow
+    with the length of the video. The payload is encrypted in chunks (see StreamCipher) and written row by row over
+    consecutive frames from start_frame, with the same LSB writer as images; the first frame holds a header giving
+    the frames used, so decoding skips straight to them.
+
+    Parameters:
+        source (str): The video file or directory of frames.
+        output (str): The video file or directory to write (see open_writer).
+        key (str): The Fernet key.
+        payload (file object): The payload, opened in binary mode.
+        size (int): The payload size in bytes.
+        density (int): Number of least significant bits used per channel.
+        start_frame (int): First frame holding payload.
+
+    Returns:
+        VideoHeader: The header written to the first frame.
+
+    Raises:
+        ValueError: If start_frame is negative, the frames are too small for the header, the frames from start_frame
+            on can't hold the payload, or the video could not be read or written.
+    """
+    if start_frame < 0:
+        raise ValueError("The start frame can't be negative.")
+    reader = open_frames(source)
+    try:
+        frame = reader.read()
+        if frame is None:
+            raise ValueError("The video has no frames.")
+        flags = density_flags(density) | FLAG_STREAM | channel_flags(frame)
+        error = layout_error(frame.shape[0], frame.shape[1], payload_view(frame, flags).shape[2])  # same header size
+        if error:
+            raise ValueError(error)
+        length = encrypted_size(size)
+        first = frame_capacity(frame, flags, start_frame)
+        rest = frame_capacity(frame, flags, start_frame + 1)
+        frames = 1 + -(-max(length - first, 0) // rest)
+        if start_frame + frames > reader.count:
+            available = first + rest * (reader.count - start_frame - 1) if start_frame < reader.count else 0
+            raise ValueError(f"The frames from {start_frame} on hold {max(available, 0)} bytes, but the encrypted "
+                             f"payload takes {length}. Use a longer video, an earlier start frame or a higher "
+                             f"density.")
+        header = pack_video_header(start_frame, frames, length, flags)
+        stream = ByteStream(encrypt_chunks(key, payload, size))
+        writer = open_writer(output, reader, frame)
+        try:
+            while frame is not None:
+                index = reader.position - 1
+                if index == 0:
+                    embed_bits(payload_view(frame[:HEADER_ROWS]), to_bits(header))
+                if start_frame <= index < start_frame + frames:
+                    frame_writer = BitWriter(payload_view(frame, flags), HEADER_ROWS if index == 0 else 0, 0,
+                                             density)
+                    frame_writer.write(stream.read(frame_capacity(frame, flags, index)))
+                    frame_writer.close()
+                writer.write(frame)
+                frame = reader.read()
+        finally:
+            writer.close()
+        if reader.position < start_frame + frames:  # the container reported more frames than it holds
+            raise ValueError("The video ended before the whole payload was written.")
+    finally:
+        reader.close()
+    return unpack_video_header(header)
+
+
+def payload_frames(reader, frame, header):
+    """
+    Yields the payload bytes held by each frame of a video, reading only the frames the header points to.
+
+    Parameters:
+        reader (VideoReader or SequenceReader): The reader, past the first frame.
+        frame (numpy.ndarray): The first frame.
+        header (VideoHeader): The header read from it.
+
+    Raises:
+        ValueError: If the video ends before the payload does.
+    """
+    if header.start_frame > 0:
+        reader.seek(header.start_frame)
+        frame = reader.read()
+    remaining = header.length
+    while remaining:
+        if frame is None:
+            raise ValueError("The video ends before its payload does.")
+        index = reader.position - 1
+        count = min(frame_capacity(frame, header.flags, index), remaining)
+        frame_reader = BitReader(payload_view(frame, header.flags), HEADER_ROWS if index == 0 else 0, 0,
+                                 flags_density(header.flags))
+        yield frame_reader.read(count)
+        remaining -= count
+        frame = reader.read()
+
+
+def decode_video(source, key, output):
+    """
+    Reveals the payload hidden by encode_video, one frame at a time.
+
+    Parameters:
+        source (str): The video file or directory of frames.
+        key (str): The Fernet key.
+        output (file object): Where to write the payload, opened in binary mode.
+
+    Returns:
+        VideoHeader: The header read from the first frame.
+
+    Raises:
+        ValueError: If the video holds no payload, or the key does not match it.
+    """
+    reader = open_frames(source)
+    try:
+        frame = reader.read()
+        header = None if frame is None else read_video_header(frame)
+        if header is None:
+            raise ValueError("The first frame holds no payload header.")
+        stream = ByteStream(payload_frames(reader, frame, header))
+        try:
+            for chunk in decrypt_chunks(key, stream.read, header.length):
+                output.write(chunk)
+        except cryptography.exceptions.InvalidTag:
+            raise ValueError("Decryption failed: invalid key, or the video was modified.")
+    finally:
+        reader.close()
+    return header
+
+
+def video_encode_command(args):
+    """
+    Entry point for the 'video-encode' subcommand. Messages go to standard error.
+
+    Parameters:
+        args (argparse.Namespace): The parsed command line arguments.
+
+    Returns:
+        int: The process exit code.
+    """
+    key = command_key(args.key)
+    output = args.output or default_output(args.source)
+    created = not os.path.exists(output)
+    try:
+        Fernet(key)  # Validate key format
+        payload, size = open_payload(args)
+        with payload:
+            header = encode_video(args.source, output, key, payload, size, args.density, args.start_frame)
+    except (OSError, ValueError) as error:
+        print(f"Error: {error}", file=sys.stderr)
+        if created and os.path.isdir(output):
+            shutil.rmtree(output)  # don't leave a partly written video behind
+        elif created and os.path.isfile(output):
+            os.remove(output)
+        return 1
+    print(f"Payload encoded into frames {header.start_frame} to {header.start_frame + header.frames - 1} of "
+          f"{output}.", file=sys.stderr)
+    return 0
+
+
+def video_decode_command(args):
+    """
+    Entry point for the 'video-decode' subcommand: writes the payload to a file or standard output.
+
+    Parameters:
+        args (argparse.Namespace): The parsed command line arguments.
+
+    Returns:
+        int: The process exit code.
+    """
+    try:
+        Fernet(args.key)  # Validate key format
+        output = open_output(args.output)
+    except (OSError, ValueError) as error:
+        print(f"Error: {error}", file=sys.stderr)
+        return 1
+    try:
+        header = decode_video(args.source, args.key, output)
+    except (OSError, ValueError) as error:
+        print(f"Error: {error}", file=sys.stderr)
+        close_output(output, args.output, failed=True)
+        return 1
+    close_output(output, args.output)
+    print(f"Payload decoded from {header.frames} frame(s), starting at frame {header.start_frame}.", file=sys.stderr)
+    return 0
@@ -0,0 +1,232 @@
+import argparse
+import builtins
+import contextlib
+import io
+import json
+import os
+import platform
+import random
+import shutil
+import statistics
+import string
+import sys
+import tempfile
+import time
+
+import cv2
+import numpy as np
+from cryptography.fernet import Fernet
+
+import CLI
+from Capacity import calculate_capacity
+from Decoding import Decoding, decode_header, decode_start
+from Encoding import Encoding, encode_header, encode_start
+from ImageCache import clear_cache, load_image
+
+SIZES = {  # synthetic carrier sizes, from a thumbnail to a 50 MP scan
+    '0.25MP': (512, 512),
+    '1MP': (1024, 1024),
+    '4MP': (2048, 2048),
+    '12MP': (3000, 4000),
+    '50MP': (7072, 7072),
+}
+PAYLOADS = [100, 10_000, 1_000_000]  # message lengths in characters
+START_ROW, START_COL = 5, 0
+
+
+def make_carrier(directory, name, height, width, seed=0):
+    """
+    Writes a synthetic PNG carrier: a smooth gradient with some noise, so it compresses like a photograph rather
+    than like flat colour or pure noise.
+
+    Parameters:
+        directory (str): Directory to write the carrier to.
+        name (str): Name of the carrier, without extension.
+        height (int): Height of the carrier in pixels.
+        width (int): Width of the carrier in pixels.
+        seed (int): Seed for the noise, so runs are reproducible.
+
+    Returns:
+        str: Path of the carrier.
+    """
+    rng = np.random.default_rng(seed)
+    rows = np.linspace(0, 255, height, dtype=np.float32)[:, np.newaxis]
+    cols = np.linspace(0, 255, width, dtype=np.float32)[np.newaxis, :]
+    img = np.empty((height, width, 3), dtype=np.uint8)
+    for channel, (a, b) in enumerate(((0.7, 0.3), (0.2, 0.8), (0.5, 0.5))):
+        noise = rng.integers(0, 16, (height, width), dtype=np.uint8)
+        img[:, :, channel] = (rows * a + cols * b).astype(np.uint8) // 2 + noise
+    path = os.path.join(directory, f"{name}.png")
+    cv2.imwrite(path, img)
+    return path
+
+
+def time_stage(function, repeat, setup=None):
+    """
+    Times a stage several times, clearing the image cache first so every run decodes the carrier from disk.
+
+    Parameters:
+        function (callable): The stage to time.
+        repeat (int): Number of timed runs.
+        setup (callable): Called before each run, outside the timing.
+
+    Returns:
+        list: The wall time of each run, in seconds.
+    """
+    runs = []
+    for _ in range(repeat):
+        clear_cache()
+        if setup:
+            setup()
+        start = time.perf_counter()
+        function()
+        runs.append(time.perf_counter() - start)
+    return runs
+
+
+def scripted_cli(function, answers):
+    """
+    Runs an interactive CLI entry point with scripted answers to its prompts and its output discarded.
+    """
+    replies = iter(answers)
+    original_input, original_randint = builtins.input, random.randint
+    builtins.input = lambda prompt='': next(replies)
+    random.randint = lambda low, high: low  # the CLI picks a random start; use the lowest so every run is alike
+    try:
+        with contextlib.redirect_stdout(io.StringIO()):
+            function()
+    finally:
+        builtins.input, random.randint = original_input, original_randint
+
+
+def benchmark_carrier(path, size_name, payloads, repeat):
+    """
+    Times every stage on one carrier.
+
+    Parameters:
+        path (str): Path of the carrier.
+        size_name (str): Name of the carrier size, used in the results.
+        payloads (list): Message lengths to time, in characters.
+        repeat (int): Number of timed runs per stage.
+
+    Returns:
+        list: One result record per stage and payload size.
+    """
+    results = []
+
+    def record(stage, payload, runs):
+        results.append({'stage': stage, 'size': size_name, 'payload': payload, 'seconds': statistics.median(runs),
+                        'runs': runs})
+
+    img = load_image(path).copy()
+    record('calculate_capacity', 0, time_stage(lambda: calculate_capacity(path, START_ROW, START_COL), repeat))
+    record('encode_start', 0, time_stage(lambda: encode_start(START_ROW, START_COL, img), repeat))
+    record('decode_start', 0, time_stage(lambda: decode_start(img), repeat))
+    record('encode_header', 0, time_stage(lambda: encode_header(START_ROW, START_COL, 0, img), repeat))
+    record('decode_header', 0, time_stage(lambda: decode_header(img), repeat))
+    capacity = calculate_capacity(path, START_ROW, START_COL)
+    key = Fernet.generate_key().decode()
+    for payload in payloads:
+        text = ''.join(random.choices(string.ascii_letters, k=payload))
+        if len(Fernet(key).encrypt(text.encode())) > capacity:
+            continue
+        encoded_path = f"{os.path.splitext(path)[0]}_encoded.png"
+        record('encoder', payload, time_stage(lambda: Encoding(path, text, key, START_ROW, START_COL).encoder(),
+                                              repeat))
+        record('stream_encoder', payload,
+               time_stage(lambda: Encoding(path, text, key, START_ROW, START_COL).stream_encoder(), repeat))
+        record('decoder', payload, time_stage(lambda: Decoding(encoded_path, key).decoder(), repeat))
+        record('scatter_encoder', payload,
+               time_stage(lambda: Encoding(path, text, key, START_ROW, START_COL, scatter=True).encoder(), repeat))
+        record('scatter_decoder', payload, time_stage(lambda: Decoding(encoded_path, key).decoder(), repeat))
+        record('encode_cli', payload, time_stage(lambda: scripted_cli(CLI.encode_cli, [path, '', text, key]), repeat))
+        record('decode_cli', payload, time_stage(lambda: scripted_cli(CLI.decode_cli, [encoded_path, key]), repeat))
+    return results
+
+
+def compare(results, baseline, threshold, min_delta):
+    """
+    Compares results with a stored baseline.
+
+    Parameters:
+        results (list): The result records of this run.
+        baseline (list): The result records of the baseline run.
+        threshold (float): Allowed slowdown, as a fraction of the baseline time.
+        min_delta (float): Slowdowns smaller than this many seconds are ignored as noise.
+
+    Returns:
+        list: A description (str) of every stage that regressed.
+    """
+    previous = {(r['stage'], r['size'], r['payload']): r['seconds'] for r in baseline}
+    regressions = []
+    for result in results:
+        before = previous.get((result['stage'], result['size'], result['payload']))
+        if before is None:
+            continue
+        after = result['seconds']
+        if after > before * (1 + threshold) and after - before > min_delta:
+            regressions.append(f"{result['stage']} [{result['size']}, {result['payload']} chars]: "
+                               f"{before:.4f}s -> {after:.4f}s ({after / before - 1:+.0%})")
+    return regressions
+
+
+def main():
+    """
+    Generates the synthetic carriers, times every stage, writes the results as JSON and optionally checks them
+    against a baseline.
+    """
+    parser = argparse.ArgumentParser(description='Benchmark encoding, decoding and capacity across image sizes.')
+    parser.add_argument('--sizes', nargs='+', default=list(SIZES), choices=list(SIZES), help='Carrier sizes to time.')
+    parser.add_argument('--payloads', nargs='+', type=int, default=PAYLOADS, help='Message lengths to time.')
+    parser.add_argument('--repeat', type=int, default=3, help='Timed runs per stage; the median is reported.')
+    parser.add_argument('-o', '--output', default='benchmark_results.json', help='JSON file for the results.')
+    parser.add_argument('--baseline', help='JSON results of an earlier run to compare against.')
+    parser.add_argument('--threshold', type=float, default=0.25, help='Allowed slowdown against the baseline '
+                                                                      '(default: 0.25, i.e. 25%%).')
+    parser.add_argument('--min-delta', type=float, default=0.005, help='Slowdowns below this many seconds are '
+                                                                       'ignored (default: 0.005).')
+    args = parser.parse_args()
+
+    random.seed(0)
+    directory = tempfile.mkdtemp(prefix='stego-benchmark-')
+    results = []
+    try:
+        for size_name in args.sizes:
+            height, width = SIZES[size_name]
+            path = make_carrier(directory, size_name, height, width)
+            print(f"Benchmarking {size_name} ({width}x{height})...", file=sys.stderr)
+            results += benchmark_carrier(path, size_name, args.payloads, args.repeat)
+    finally:
+        shutil.rmtree(directory)
+
+    report = {
+        'meta': {
+            'timestamp': time.strftime('%Y-%m-%dT%H:%M:%S'),
+            'python': platform.python_version(),
+            'numpy': np.__version__,
+            'opencv': cv2.__version__,
+            'platform': platform.platform(),
+            'repeat': args.repeat,
+        },
+        'results': results,
+    }
+    with open(args.output, 'w', encoding='utf-8') as output:
+        json.dump(report, output, indent=2)
+    for result in results:
+        print(f"{result['stage']:>18} {result['size']:>7} {result['payload']:>9} chars  {result['seconds']:.4f}s")
+    print(f"Results saved as {args.output}")
+
+    if args.baseline:
+        with open(args.baseline, encoding='utf-8') as baseline_file:
+            baseline = json.load(baseline_file)['results']
+        regressions = compare(results, baseline, args.threshold, args.min_delta)
+        if regressions:
+            print("Regressions against the baseline:")
+            for regression in regressions:
+                print(f"  {regression}")
+            sys.exit(1)
+        print("No regressions against the baseline.")
+
+
+if __name__ == "__main__":
+    main()
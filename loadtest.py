@@ -0,0 +1,153 @@
+import argparse
+import json
+import statistics
+import sys
+import threading
+import time
+import urllib.error
+import urllib.parse
+import urllib.request
+
+from cryptography.fernet import Fernet
+
+
+def send(url, body):
+    """
+    Sends one POST request.
+
+    Parameters:
+        url (str): The full URL, with its query string.
+        body (bytes): The request body.
+
+    Returns:
+        tuple: The HTTP status (int) and the response body (bytes). Connection errors are reported as status 0.
+    """
+    request = urllib.request.Request(url, data=body, method='POST', headers={'Content-Type': 'image/png'})
+    try:
+        with urllib.request.urlopen(request) as response:
+            return response.status, response.read()
+    except urllib.error.HTTPError as error:
+        return error.code, error.read()
+    except OSError as error:
+        return 0, str(error).encode()
+
+
+def run_load(base_url, png_bytes, requests, concurrency, message, density):
+    """
+    Sends encode requests, each followed by a decode of its result, from several client threads at once.
+
+    Parameters:
+        base_url (str): The address of the service, such as 'http://127.0.0.1:8000'.
+        png_bytes (bytes): The carrier image.
+        requests (int): Number of encode requests to send in all.
+        concurrency (int): Number of client threads.
+        message (str): The message to encode.
+        density (int): Bits per colour channel to encode with.
+
+    Returns:
+        list: One (endpoint, status, seconds) tuple per request sent.
+    """
+    key = Fernet.generate_key().decode()
+    query = urllib.parse.urlencode({'key': key, 'message': message, 'density': density, 'start_row': 5,
+                                    'start_col': 0})
+    results = []
+    lock = threading.Lock()
+    remaining = iter(range(requests))
+
+    def client():
+        while True:
+            with lock:
+                if next(remaining, None) is None:
+                    return
+            start = time.perf_counter()
+            status, body = send(f"{base_url}/encode?{query}", png_bytes)
+            record = [('encode', status, time.perf_counter() - start)]
+            if status == 200:
+                start = time.perf_counter()
+                status, decoded = send(f"{base_url}/decode?{urllib.parse.urlencode({'key': key})}", body)
+                if status == 200 and decoded.decode('utf-8') != message:
+                    status = -1  # the service answered with the wrong message
+                record.append(('decode', status, time.perf_counter() - start))
+            with lock:
+                results.extend(record)
+
+    threads = [threading.Thread(target=client) for _ in range(concurrency)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    return results
+
+
+def summarize(results, seconds):
+    """
+    Summarizes the requests of a load test.
+
+    Parameters:
+        results (list): The (endpoint, status, seconds) tuples returned by run_load.
+        seconds (float): Wall time of the whole test.
+
+    Returns:
+        dict: Per endpoint, the count of each status and latency percentiles of the successful requests, plus the
+        overall throughput.
+    """
+    summary = {'seconds': seconds, 'requests_per_second': len(results) / seconds if seconds else 0, 'endpoints': {}}
+    for endpoint in sorted({result[0] for result in results}):
+        statuses = {}
+        latencies = []
+        for name, status, latency in results:
+            if name != endpoint:
+                continue
+            statuses[str(status)] = statuses.get(str(status), 0) + 1
+            if status == 200:
+                latencies.append(latency)
+        entry = {'statuses': statuses}
+        if latencies:
+            percentiles = (statistics.quantiles(latencies, n=100, method='inclusive') if len(latencies) > 1
+                           else latencies * 99)
+            entry.update(p50=percentiles[49], p90=percentiles[89], p99=percentiles[98], max=max(latencies))
+        summary['endpoints'][endpoint] = entry
+    return summary
+
+
+def main():
+    """
+    Runs a load test against a running service (see 'main.py --serve') and prints a summary, along with the
+    service's own metrics.
+    """
+    parser = argparse.ArgumentParser(description='Load-test the local steganography HTTP service.')
+    parser.add_argument('--url', default='http://127.0.0.1:8000', help='Address of the service.')
+    parser.add_argument('--image', default='Images/test_image.png', help='PNG carrier to send.')
+    parser.add_argument('-n', '--requests', type=int, default=50, help='Number of encode requests (each is followed '
+                                                                       'by a decode).')
+    parser.add_argument('-c', '--concurrency', type=int, default=8, help='Number of concurrent clients.')
+    parser.add_argument('--message-size', type=int, default=1000, help='Length of the encoded message in characters.')
+    parser.add_argument('--density', type=int, default=1, choices=range(1, 5), help='Bits per color channel.')
+    parser.add_argument('-o', '--output', help='JSON file for the summary.')
+    args = parser.parse_args()
+
+    with open(args.image, 'rb') as image:
+        png_bytes = image.read()
+    start = time.perf_counter()
+    results = run_load(args.url, png_bytes, args.requests, args.concurrency, 'x' * args.message_size, args.density)
+    summary = summarize(results, time.perf_counter() - start)
+    with urllib.request.urlopen(f"{args.url}/metrics") as response:
+        summary['server_metrics'] = json.load(response)
+
+    for endpoint, entry in summary['endpoints'].items():
+        timing = ''
+        if 'p50' in entry:
+            timing = (f"  p50 {entry['p50']:.3f}s  p90 {entry['p90']:.3f}s  p99 {entry['p99']:.3f}s  "
+                      f"max {entry['max']:.3f}s")
+        print(f"{endpoint:>7}: {entry['statuses']}{timing}")
+    print(f"{len(results)} requests in {summary['seconds']:.2f}s ({summary['requests_per_second']:.1f} requests/s)")
+    if args.output:
+        with open(args.output, 'w', encoding='utf-8') as output:
+            json.dump(summary, output, indent=2)
+    failed = sum(count for entry in summary['endpoints'].values() for status, count in entry['statuses'].items()
+                 if status not in ('200', '503'))
+    sys.exit(1 if failed else 0)
+
+
+if __name__ == "__main__":
+    main()
@@ -1,20 +1,12 @@
 import argparse
+import json
 import sys
-import platform
 
-# Attempt to import tkinter to check availability
-try:
-    import tkinter as tk
-    tkinter_available = True
-except ImportError:
-    tkinter_available = False
+import Metrics
+from Codec import AUTO, CODECS
 
-import CLI
-from CLI import SteganographyAppCLI
-
-if tkinter_available:
-    # Import GUI module only if tkinter is available
-    from GUI import SteganographyAppGUI
+# The modules of each mode (and through them OpenCV, NumPy and cryptography) are imported only once the mode is
+# known, so '--help', 'capacity' and scripted one-file runs start quickly. See startup.py for the budget.
 
 
 def main():
@@ -26,19 +18,235 @@ def main():
     parser.add_argument('-e', '--encode', action='store_true', help='Run the application in encode mode (CLI).')
     parser.add_argument('-d', '--decode', action='store_true', help='Run the application in decode mode (CLI).')
     parser.add_argument('-g', '--gui', action='store_true', help='Run the application in GUI mode.')
+    parser.add_argument('--serve', action='store_true', help='Run the encode/decode/capacity HTTP service.')
+    parser.add_argument('--host', default='127.0.0.1', help='Address the service listens on (default: 127.0.0.1, '
+                                                            'local connections only).')
+    parser.add_argument('--port', type=int, default=8000, help='Port the service listens on (default: 8000).')
+    parser.add_argument('--pool-size', type=int, help='Worker processes of the service (default: one per CPU).')
+    parser.add_argument('--queue-size', type=int, default=16, help='Jobs the service queues before answering 503 '
+                                                                   '(default: 16).')
+    parser.add_argument('--profile', action='store_true', help='Print the time, bytes and peak memory of each '
+                                                               'encode/decode stage when done.')
+    parser.add_argument('--metrics-file', help='Write the per-stage metrics of every encode/decode to this JSON file.')
+    parser.add_argument('--cprofile', help='Write a cProfile dump of the whole run to this file (see pstats).')
+    subparsers = parser.add_subparsers(dest='command')
+    batch_encode_parser = subparsers.add_parser('batch-encode', help='Encode many images without prompting.')
+    batch_encode_parser.add_argument('source', help='CSV/JSONL manifest (image, message or message_file, key) or a '
+                                                    'directory of PNG, BMP, TIFF or WebP images.')
+    batch_encode_parser.add_argument('--message', help='Message to encode into every image of a directory.')
+    batch_encode_parser.add_argument('--message-file', help='File holding the message for every image of a directory.')
+    batch_encode_parser.add_argument('--payload-file', help='Binary file to encode into every image of a directory, '
+                                                            'encrypted in chunks.')
+    batch_encode_parser.add_argument('--key', help='Fernet key for every image of a directory (generated if omitted).')
+    batch_encode_parser.add_argument('--density', type=int, default=1, choices=range(1, 5),
+                                     help='Bits per color channel for every image of a directory (default: 1).')
+    batch_encode_parser.add_argument('--scatter', action='store_true', help='Spread each payload over the pixels in '
+                                                                            'an order seeded by its key.')
+    batch_encode_parser.add_argument('--stream', action='store_true', help='Read and write images a band of rows at '
+                                                                           'a time to bound memory use.')
+    batch_decode_parser = subparsers.add_parser('batch-decode', help='Decode many images without prompting.')
+    batch_decode_parser.add_argument('source', help='CSV/JSONL manifest (image, key) or a directory of images.')
+    batch_decode_parser.add_argument('--key', help='Fernet key for every image of a directory.')
+    batch_decode_parser.add_argument('--output-dir', help='Decode file payloads of a directory into this directory.')
+    pipe_encode_parser = subparsers.add_parser('pipe-encode', help='Encode an image read from a file or standard '
+                                                                   'input, writing the result to standard output.')
+    pipe_encode_parser.add_argument('image', nargs='?', default='-', help="PNG image to encode, or '-' for standard "
+                                                                         "input (default).")
+    pipe_encode_parser.add_argument('--message', help='Message to encode.')
+    pipe_encode_parser.add_argument('--message-file', help='File holding the message to encode.')
+    pipe_encode_parser.add_argument('--payload-file', help='Binary file to encode, encrypted in chunks.')
+    pipe_encode_parser.add_argument('--key', help='Fernet key (generated and printed to standard error if omitted).')
+    pipe_encode_parser.add_argument('--density', type=int, default=1, choices=range(1, 5),
+                                    help='Bits per color channel (default: 1).')
+    pipe_encode_parser.add_argument('--scatter', action='store_true', help='Spread the payload over the pixels in an '
+                                                                           'order seeded by the key.')
+    pipe_decode_parser = subparsers.add_parser('pipe-decode', help='Decode an image read from a file or standard '
+                                                                   'input, writing the payload to standard output.')
+    pipe_decode_parser.add_argument('image', nargs='?', default='-', help="Encoded PNG image, or '-' for standard "
+                                                                         "input (default).")
+    pipe_decode_parser.add_argument('--key', required=True, help='Fernet key the payload was encrypted with.')
+    update_parser = subparsers.add_parser('update', help='Replace the message of an encoded image, keeping its offset '
+                                                         'and settings.')
+    update_parser.add_argument('image', help='Encoded PNG image.')
+    update_parser.add_argument('--key', required=True, help='Fernet key the image was encoded with.')
+    update_parser.add_argument('--message', help='New message.')
+    update_parser.add_argument('--message-file', help='File holding the new message.')
+    update_parser.add_argument('-o', '--output', help='Image to write (default: update the image in place).')
+    scan_parser = subparsers.add_parser('scan', help='Find the images that hold a payload, without a key, by reading '
+                                                     'only their first rows.')
+    scan_parser.add_argument('source', help='Image or directory of images (PNG, BMP, TIFF or WebP).')
+    scan_parser.add_argument('-r', '--recursive', action='store_true', help='Include images in subdirectories.')
+    scan_parser.add_argument('--index', help='JSON index of earlier scans; images unchanged since are not read again.')
+    slots_parser = subparsers.add_parser('slots', help='Keep several independent messages in one image and add, read '
+                                                       'or delete them one at a time.')
+    slots_parser.add_argument('action', choices=['init', 'list', 'add', 'read', 'delete'],
+                              help="'init' writes an empty container to a new image; 'add' and 'delete' update the "
+                                   "image in place unless --output is given.")
+    slots_parser.add_argument('image', help='Image holding the container (PNG, BMP, TIFF or WebP).')
+    slots_parser.add_argument('index', nargs='?', type=int, help="Slot to read or delete ('read' without an index "
+                                                                 "reads every slot of the key).")
+    slots_parser.add_argument('--key', help='Fernet key of the message.')
+    slots_parser.add_argument('--message', help='Message to add.')
+    slots_parser.add_argument('--message-file', help='File holding the message to add.')
+    slots_parser.add_argument('--payload-file', help='Binary file to add.')
+    slots_parser.add_argument('--slots', type=int, default=16, help="Number of slots created by 'init' (default: 16).")
+    slots_parser.add_argument('--density', type=int, default=1, choices=range(1, 5),
+                              help="Bits per color channel used by 'init' (default: 1).")
+    slots_parser.add_argument('--start-row', type=int, default=4, help="Row where 'init' starts the container.")
+    slots_parser.add_argument('--start-col', type=int, default=0, help="Column where 'init' starts the container.")
+    slots_parser.add_argument('-o', '--output', help="Image to write, or for 'read' the file to write the message to.")
+    capacity_parser = subparsers.add_parser('capacity', help='Print the dimensions and capacity of images, reading '
+                                                             'only their headers.')
+    capacity_parser.add_argument('images', nargs='+', help='Images (PNG, BMP, TIFF or WebP), or directories of them.')
+    capacity_parser.add_argument('--start-row', type=int, default=5, help='Row where the payload starts (default: 5).')
+    capacity_parser.add_argument('--start-col', type=int, default=0, help='Column where the payload starts on every '
+                                                                          'row (default: 0).')
+    capacity_parser.add_argument('--density', type=int, choices=range(1, 5), help='Bits per color channel (default: '
+                                                                                  'every density).')
+    capacity_parser.add_argument('-o', '--output', help='JSONL file for the results (default: standard output).')
+    shard_encode_parser = subparsers.add_parser('shard-encode', help='Spread one payload over several images, '
+                                                                     'filling the largest first.')
+    shard_encode_parser.add_argument('carriers', nargs='+', help='Carrier images (PNG, BMP, TIFF or WebP), or '
+                                                                 'directories of them.')
+    shard_encode_parser.add_argument('--message', help='Message to encode.')
+    shard_encode_parser.add_argument('--message-file', help="File holding the message to encode, or '-' for standard "
+                                                            "input.")
+    shard_encode_parser.add_argument('--payload-file', help='Binary file to encode.')
+    shard_encode_parser.add_argument('--key', help='Fernet key (generated and printed to standard error if omitted).')
+    shard_encode_parser.add_argument('--density', type=int, default=1, choices=range(1, 5),
+                                     help='Bits per color channel (default: 1).')
+    shard_encode_parser.add_argument('--output-dir', help='Directory of the encoded images (default: next to each '
+                                                          'carrier).')
+    shard_encode_parser.add_argument('-o', '--output', help='JSONL file for the results (default: standard output).')
+    shard_decode_parser = subparsers.add_parser('shard-decode', help='Reassemble a payload spread over several images '
+                                                                     'by shard-encode.')
+    shard_decode_parser.add_argument('sources', nargs='+', help='Encoded images, or directories of them, in any '
+                                                                'order; images without a shard are skipped.')
+    shard_decode_parser.add_argument('--key', required=True, help='Fernet key the payload was encrypted with.')
+    shard_decode_parser.add_argument('--payload-id', help='Payload to reassemble when the images hold several.')
+    shard_decode_parser.add_argument('-o', '--output', default='-', help="File to write the payload to, or '-' for "
+                                                                         "standard output (default).")
+    video_encode_parser = subparsers.add_parser('video-encode', help='Hide a payload in a lossless video or a '
+                                                                     'directory of frames, one frame at a time.')
+    video_encode_parser.add_argument('source', help='FFV1 video (.mkv or .avi), or directory of frames (PNG, BMP, '
+                                                    'TIFF or WebP) in name order.')
+    video_encode_parser.add_argument('--message', help='Message to encode.')
+    video_encode_parser.add_argument('--message-file', help="File holding the message to encode, or '-' for standard "
+                                                            "input.")
+    video_encode_parser.add_argument('--payload-file', help='Binary file to encode.')
+    video_encode_parser.add_argument('--key', help='Fernet key (generated and printed to standard error if omitted).')
+    video_encode_parser.add_argument('--density', type=int, default=1, choices=range(1, 5),
+                                     help='Bits per color channel (default: 1).')
+    video_encode_parser.add_argument('--start-frame', type=int, default=0, help='First frame holding payload '
+                                                                                '(default: 0).')
+    video_encode_parser.add_argument('-o', '--output', help="FFV1 video or directory of frames to write (default: "
+                                                            "the source name with '_encoded' added).")
+    video_decode_parser = subparsers.add_parser('video-decode', help='Reveal the payload of a video written by '
+                                                                     'video-encode.')
+    video_decode_parser.add_argument('source', help='Encoded video, or directory of frames.')
+    video_decode_parser.add_argument('--key', required=True, help='Fernet key the payload was encrypted with.')
+    video_decode_parser.add_argument('-o', '--output', default='-', help="File to write the payload to, or '-' for "
+                                                                         "standard output (default).")
+    plan_parser = subparsers.add_parser('plan', help='Assign the payloads of a manifest to the carriers of a pool, '
+                                                     'writing a manifest for batch-encode.')
+    plan_parser.add_argument('manifest', help='CSV/JSONL manifest of payloads (message, message_file or '
+                                              'payload_file, and optionally key, density, scatter, compression).')
+    plan_parser.add_argument('pool', help='Directory of carrier images (PNG, BMP, TIFF or WebP).')
+    plan_parser.add_argument('-r', '--recursive', action='store_true', help='Include images in subdirectories.')
+    plan_parser.add_argument('--index', help='JSON index of the pool; only images changed since are read again '
+                                             '(default: .carriers.json in the pool).')
+    plan_parser.add_argument('--density', type=int, default=1, choices=range(1, 5),
+                             help='Bits per color channel of the payloads that do not set one (default: 1).')
+    plan_parser.add_argument('--dry-run', action='store_true', help='Do not mark the carriers planned as used.')
+    for encode_parser in (batch_encode_parser, pipe_encode_parser, slots_parser, update_parser):
+        encode_parser.add_argument('--compress', choices=list(CODECS) + [AUTO],
+                                   help="Compress text before encryption; 'auto' keeps the smallest result, and only "
+                                        "if it is smaller than the text.")
+    for pipe_parser in (pipe_encode_parser, pipe_decode_parser):
+        pipe_parser.add_argument('-o', '--output', default='-', help="File to write the result to, or '-' for "
+                                                                    "standard output (default).")
+    for batch_parser in (batch_encode_parser, batch_decode_parser, scan_parser, shard_encode_parser,
+                         shard_decode_parser, plan_parser):
+        batch_parser.add_argument('-w', '--workers', type=int,
+                                  help='Number of worker processes (default: one per CPU).')
+    for batch_parser in (batch_encode_parser, batch_decode_parser, scan_parser, plan_parser):
+        batch_parser.add_argument('-o', '--output', help='JSONL file for the results (default: standard output).')
+    for batch_parser in (batch_encode_parser, batch_decode_parser):
+        batch_parser.add_argument('-t', '--threads', type=int, default=1,
+                                  help='Threads each image is processed on, in bands of rows; helps with a few huge '
+                                       'images rather than many small ones (default: 1).')
 
     args = parser.parse_args()
 
-    if args.encode:
+    if args.profile or args.metrics_file:
+        Metrics.enable()
+    profiler = None
+    if args.cprofile:
+        import cProfile
+        profiler = cProfile.Profile()
+        profiler.enable()
+    try:
+        status = run(args)
+    finally:
+        if profiler:
+            profiler.disable()
+            profiler.dump_stats(args.cprofile)
+        report_metrics(args)
+    if status:
+        sys.exit(status)
+
+
+def run(args):
+    """
+    Runs the mode selected on the command line.
+
+    Parameters:
+        args (argparse.Namespace): The parsed command line arguments.
+
+    Returns:
+        int: The exit code of the subcommands, or None.
+    """
+    if args.command in ('batch-encode', 'batch-decode'):
+        import Batch
+        return Batch.batch_encode(args) if args.command == 'batch-encode' else Batch.batch_decode(args)
+    elif args.command in ('pipe-encode', 'pipe-decode', 'update'):
+        import CLI
+        return {'pipe-encode': CLI.pipe_encode, 'pipe-decode': CLI.pipe_decode,
+                'update': CLI.update_command}[args.command](args)
+    elif args.command == 'scan':
+        import Scan
+        return Scan.scan(args)
+    elif args.command == 'slots':
+        import Container
+        return Container.slots_command(args)
+    elif args.command in ('shard-encode', 'shard-decode'):
+        import Shard
+        return Shard.shard_encode_command(args) if args.command == 'shard-encode' else Shard.shard_decode_command(args)
+    elif args.command in ('video-encode', 'video-decode'):
+        import Video
+        return Video.video_encode_command(args) if args.command == 'video-encode' else Video.video_decode_command(args)
+    elif args.command == 'plan':
+        import Planner
+        return Planner.plan_command(args)
+    elif args.command == 'capacity':
+        import Capacity
+        return Capacity.capacity_command(args)
+    elif args.serve:
+        import Server
+        Server.serve(args.host, args.port, args.pool_size, args.queue_size)
+    elif args.encode:
+        import CLI
         print("Entering Encode Mode...")
         CLI.encode_cli()
     elif args.decode:
+        import CLI
         print("Entering Decode Mode...")
         CLI.decode_cli()
     elif args.gui:
-        if tkinter_available:
+        gui = load_gui()
+        if gui:
             print("Starting GUI...")
-            start_gui()
+            start_gui(gui)
         else:
             os_specific_instructions()
     else:
@@ -46,10 +254,41 @@ def main():
         mode_prompt()
 
 
+def report_metrics(args):
+    """
+    Prints and/or saves the per-stage metrics recorded during the run, if requested.
+
+    Parameters:
+        args (argparse.Namespace): The parsed command line arguments.
+    """
+    operations = Metrics.report()
+    if args.profile and operations:
+        print(Metrics.format_report(operations), file=sys.stderr)
+    if args.metrics_file:
+        with open(args.metrics_file, 'w', encoding='utf-8') as metrics_file:
+            json.dump(operations, metrics_file, indent=2)
+
+
+def load_gui():
+    """
+    Imports tkinter and the GUI module, which only GUI mode needs.
+
+    Returns:
+        tuple: The tkinter module and the SteganographyAppGUI class, or None if tkinter is not available.
+    """
+    try:
+        import tkinter as tk
+    except ImportError:
+        return None
+    from GUI import SteganographyAppGUI
+    return tk, SteganographyAppGUI
+
+
 def os_specific_instructions():
     """
     Provides OS-specific instructions for installing tkinter if it's not available.
     """
+    import platform
     name = platform.system()
     if name == "Linux":
         print("GUI mode is not available because tkinter is not installed. For Linux, try running: 'sudo apt-get "
@@ -76,11 +315,13 @@ def mode_prompt():
 ''')
     user_choice = input("Enter 1 for CLI and 2 for GUI: ")
     if user_choice == '1':
+        from CLI import SteganographyAppCLI
         app = SteganographyAppCLI()
         app.run()
     elif user_choice == '2':
-        if tkinter_available:
-            start_gui()
+        gui = load_gui()
+        if gui:
+            start_gui(gui)
         else:
             os_specific_instructions()
     else:
@@ -88,11 +329,15 @@ def mode_prompt():
         sys.exit()
 
 
-def start_gui():
+def start_gui(gui):
     """
     Initializes and runs the GUI for the steganography application.
+
+    Parameters:
+        gui (tuple): The tkinter module and the SteganographyAppGUI class, as returned by load_gui, or None.
     """
-    if tkinter_available:
+    if gui:
+        tk, SteganographyAppGUI = gui
         root = tk.Tk()
         root.attributes('-topmost', True, '-fullscreen', True)
         root.focus_force()
@@ -0,0 +1,158 @@
+import argparse
+import json
+import os
+import platform
+import shutil
+import statistics
+import sys
+import tempfile
+import time
+
+import cv2
+import numpy as np
+from cryptography.fernet import Fernet
+
+from Capacity import calculate_capacity, fernet_plaintext_capacity
+from Decoding import Decoding
+from Encoding import Encoding
+from ImageCache import clear_cache
+from benchmark import SIZES, make_carrier
+
+THREADS = [1, 2, 4, 8]
+STAGES = {'encode': ['read', 'embed', 'write'], 'decode': ['read', 'extract']}  # the stages that run on threads
+START_ROW, START_COL = 5, 0
+
+
+def run_threads(path, text, key, density, threads, repeat):
+    """
+    Encodes and decodes a carrier with a number of threads, several times.
+
+    Parameters:
+        path (str): Path of the carrier.
+        text (str): The message to encode.
+        key (str): The Fernet key.
+        density (int): Bits per colour channel.
+        threads (int): Number of threads.
+        repeat (int): Number of timed runs.
+
+    Returns:
+        dict: The median wall time of each threaded stage and of the whole operation, in seconds, keyed by
+        operation and stage name.
+    """
+    runs = {operation: {stage: [] for stage in stages + ['total']} for operation, stages in STAGES.items()}
+    for _ in range(repeat):
+        clear_cache()
+        encoder = Encoding(path, text, key, START_ROW, START_COL, density=density, threads=threads)
+        result, encoded_path = encoder.encoder()
+        if "Error" in result:
+            raise RuntimeError(result)
+        clear_cache()
+        decoder = Decoding(encoded_path, key, threads=threads)
+        result, decoded_text = decoder.decoder()
+        if decoded_text != text:
+            raise RuntimeError(f"Decoding with {threads} thread(s) failed: {result}")
+        for operation, metrics in (('encode', encoder.metrics), ('decode', decoder.metrics)):
+            seconds = {stage['stage']: stage['seconds'] for stage in metrics.stages}
+            for stage in STAGES[operation]:
+                runs[operation][stage].append(seconds[stage])
+            runs[operation]['total'].append(sum(seconds.values()))
+    return {operation: {stage: statistics.median(times) for stage, times in stages.items()}
+            for operation, stages in runs.items()}
+
+
+def speedups(results):
+    """
+    Computes the speedup of every stage over the single-threaded run.
+
+    Parameters:
+        results (dict): The timings returned by run_threads, keyed by number of threads; must include 1.
+
+    Returns:
+        dict: Per number of threads, operation and stage, the single-threaded time divided by the threaded one.
+    """
+    base = results[1]
+    return {threads: {operation: {stage: base[operation][stage] / seconds if seconds else 0.0
+                                  for stage, seconds in stages.items()}
+                      for operation, stages in timings.items()}
+            for threads, timings in results.items()}
+
+
+def main():
+    """
+    Times encoding and decoding of one large carrier at increasing thread counts and prints the speedup of each
+    threaded stage over one thread, optionally failing if the scaling falls short.
+    """
+    parser = argparse.ArgumentParser(description='Measure how encoding and decoding scale with --threads.')
+    parser.add_argument('--size', default='50MP', choices=list(SIZES), help='Carrier size (default: 50MP).')
+    parser.add_argument('--threads', nargs='+', type=int, default=THREADS, help='Thread counts to time.')
+    parser.add_argument('--density', type=int, default=1, choices=range(1, 5), help='Bits per color channel.')
+    parser.add_argument('--fill', type=float, default=0.9, help='Fraction of the capacity the message fills '
+                                                                '(default: 0.9).')
+    parser.add_argument('--repeat', type=int, default=3, help='Timed runs per thread count; the median is reported.')
+    parser.add_argument('--min-efficiency', type=float, help='Fail unless the embed and extract stages run at least '
+                                                             'this fraction of N times faster on N threads, for '
+                                                             'every N up to the number of CPUs (e.g. 0.7).')
+    parser.add_argument('-o', '--output', help='JSON file for the results.')
+    args = parser.parse_args()
+
+    thread_counts = sorted(set(args.threads) | {1})
+    directory = tempfile.mkdtemp(prefix='stego-scaling-')
+    try:
+        height, width = SIZES[args.size]
+        path = make_carrier(directory, args.size, height, width)
+        capacity = calculate_capacity(path, START_ROW, START_COL, args.density)
+        text = 'x' * int(fernet_plaintext_capacity(capacity) * args.fill)
+        key = Fernet.generate_key().decode()
+        results = {}
+        for threads in thread_counts:
+            print(f"Timing {args.size} ({width}x{height}) with {threads} thread(s)...", file=sys.stderr)
+            results[threads] = run_threads(path, text, key, args.density, threads, args.repeat)
+    finally:
+        shutil.rmtree(directory)
+    scaling = speedups(results)
+
+    cpus = os.cpu_count() or 1
+    for operation, stages in STAGES.items():
+        print(f"{operation} ({len(text)} chars):")
+        for stage in stages + ['total']:
+            cells = '  '.join(f"{threads}: {results[threads][operation][stage]:7.3f}s "
+                              f"x{scaling[threads][operation][stage]:4.1f}" for threads in thread_counts)
+            print(f"  {stage:>7}  {cells}")
+    if max(thread_counts) > cpus:
+        print(f"Note: only {cpus} CPU(s) here, so thread counts above {cpus} can't run faster.")
+    report = {
+        'meta': {
+            'timestamp': time.strftime('%Y-%m-%dT%H:%M:%S'),
+            'python': platform.python_version(),
+            'numpy': np.__version__,
+            'opencv': cv2.__version__,
+            'platform': platform.platform(),
+            'cpus': cpus,
+            'size': args.size,
+            'density': args.density,
+            'message_length': len(text),
+            'repeat': args.repeat,
+        },
+        'seconds': results,
+        'speedup': scaling,
+    }
+    if args.output:
+        with open(args.output, 'w', encoding='utf-8') as output:
+            json.dump(report, output, indent=2)
+
+    if args.min_efficiency is not None:
+        shortfalls = [f"{operation} {stage} on {threads} threads: x{scaling[threads][operation][stage]:.2f}, "
+                      f"expected at least x{args.min_efficiency * threads:.2f}"
+                      for threads in thread_counts if 1 < threads <= cpus
+                      for operation, stage in (('encode', 'embed'), ('decode', 'extract'))
+                      if scaling[threads][operation][stage] < args.min_efficiency * threads]
+        if shortfalls:
+            print("Scaling below the expected efficiency:")
+            for shortfall in shortfalls:
+                print(f"  {shortfall}")
+            sys.exit(1)
+        print("Scaling meets the expected efficiency.")
+
+
+if __name__ == "__main__":
+    main()
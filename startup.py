@@ -0,0 +1,110 @@
+import argparse
+import json
+import os
+import platform
+import statistics
+import subprocess
+import sys
+import time
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+SAMPLE_IMAGE = os.path.join('Images', 'test_image.png')
+COMMANDS = {  # command line arguments, import time budget in milliseconds, and modules the command must not load
+    'help': (['--help'], 40, ['cv2', 'numpy', 'cryptography', 'tkinter']),
+    'capacity': (['capacity', SAMPLE_IMAGE], 40, ['cv2', 'numpy', 'cryptography', 'tkinter']),
+    'scan': (['scan', SAMPLE_IMAGE, '-w', '1', '-o', os.devnull], 250, ['cv2', 'tkinter']),
+    'pipe-decode': (['pipe-decode', '--help'], 40, ['cv2', 'numpy', 'cryptography', 'tkinter']),
+}
+
+
+def import_times(arguments):
+    """
+    Runs the application once with '-X importtime' and reads the import times it reports.
+
+    Parameters:
+        arguments (list): Command line arguments for main.py, or None to run an empty interpreter.
+
+    Returns:
+        tuple: The total import time in milliseconds (float), the names of the imported modules (set) and the wall
+        time of the run in milliseconds (float).
+    """
+    command = [sys.executable, '-X', 'importtime'] + (['main.py'] + arguments if arguments is not None else ['-c', ''])
+    start = time.perf_counter()
+    result = subprocess.run(command, cwd=HERE, stdout=subprocess.DEVNULL, stderr=subprocess.PIPE, text=True)
+    wall = (time.perf_counter() - start) * 1000
+    total = 0
+    modules = set()
+    for line in result.stderr.splitlines():
+        if not line.startswith('import time:') or 'cumulative' in line:
+            continue
+        _, cumulative, name = line[len('import time:'):].split('|')
+        modules.add(name.strip())
+        if not name[1:].startswith(' '):  # a top-level import; nested ones are already in its cumulative time
+            total += int(cumulative)
+    return total / 1000, modules, wall
+
+
+def measure(name, repeat):
+    """
+    Measures the startup of one command of COMMANDS, several times.
+
+    Parameters:
+        name (str): The name of the command.
+        repeat (int): Number of runs; the medians are reported.
+
+    Returns:
+        dict: The median import time and wall time in milliseconds, both over an empty interpreter, the budget and
+        the forbidden modules that were loaded.
+    """
+    arguments, budget, forbidden = COMMANDS[name]
+    runs = [import_times(arguments) for _ in range(repeat)]
+    empty = [import_times(None) for _ in range(repeat)]
+    loaded = set.union(*(modules for _, modules, _ in runs))
+    return {
+        'command': name,
+        'import_ms': statistics.median(run[0] for run in runs) - statistics.median(run[0] for run in empty),
+        'wall_ms': statistics.median(run[2] for run in runs) - statistics.median(run[2] for run in empty),
+        'budget_ms': budget,
+        'forbidden_loaded': sorted(module for module in forbidden if module in loaded),
+    }
+
+
+def main():
+    """
+    Measures how long the commands of the application take to import their modules, checks each against its budget
+    and the modules it must not load, and optionally writes the results as JSON so they can be tracked over time.
+    """
+    parser = argparse.ArgumentParser(description='Check the startup time of main.py against its budget.')
+    parser.add_argument('--commands', nargs='+', default=list(COMMANDS), choices=list(COMMANDS),
+                        help='Commands to measure.')
+    parser.add_argument('--repeat', type=int, default=5, help='Runs per command; the median is reported.')
+    parser.add_argument('-o', '--output', help='JSON file for the results.')
+    args = parser.parse_args()
+
+    results = [measure(name, args.repeat) for name in args.commands]
+    failures = []
+    for result in results:
+        over = result['import_ms'] > result['budget_ms']
+        print(f"{result['command']:>12}  imports {result['import_ms']:7.1f} ms (budget {result['budget_ms']} ms)  "
+              f"wall {result['wall_ms']:7.1f} ms{'  OVER BUDGET' if over else ''}")
+        if over:
+            failures.append(f"{result['command']}: imports take {result['import_ms']:.1f} ms, over the budget of "
+                            f"{result['budget_ms']} ms")
+        if result['forbidden_loaded']:
+            failures.append(f"{result['command']}: loads {', '.join(result['forbidden_loaded'])}")
+    if args.output:
+        with open(args.output, 'w', encoding='utf-8') as output:
+            json.dump({'meta': {'timestamp': time.strftime('%Y-%m-%dT%H:%M:%S'),
+                                'python': platform.python_version(), 'platform': platform.platform(),
+                                'repeat': args.repeat},
+                       'results': results}, output, indent=2)
+    if failures:
+        print("Startup budget exceeded:")
+        for failure in failures:
+            print(f"  {failure}")
+        sys.exit(1)
+    print("Every command starts within its budget.")
+
+
+if __name__ == "__main__":
+    main()
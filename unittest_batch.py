@@ -0,0 +1,49 @@
+import json
+import unittest
+
+from Batch import decode_item, encode_item, load_manifest, run_batch
+from Planner import plan_batch
+from unittest_support import TemporaryDirectoryTest
+
+
+class TestBatch(TemporaryDirectoryTest):
+
+    def write_manifest(self, name, lines):
+        path = self.path(name)
+        with open(path, 'w', encoding='utf-8') as manifest:
+            manifest.write('\n'.join(lines) + '\n')
+        return path
+
+    def test_manifest_checks_numbers(self):
+        path = self.write_manifest('manifest.csv', ['image,message,start_row,start_col,density',
+                                                    'a.png,hi,5,0,1', 'b.png,hi,5,-3,', 'c.png,hi,,,', 'd.png,hi,x,0,'])
+        items = load_manifest(path)
+        self.assertEqual(['error' in item for item in items], [False, True, False, True])
+        self.assertIn("'start_col'", items[1]['error'])
+        items = load_manifest(self.write_manifest('manifest.jsonl', ['{"image": "a.png", "start_col": 2}',
+                                                                     '{"image": "b.png", "density": 1.5}']))
+        self.assertEqual(['error' in item for item in items], [False, True])
+
+    def test_bad_entries_fail_alone(self):
+        carrier = self.random_image('carrier.png', (60, 60, 3))
+        items = [dict(image=carrier, message='hello', key=self.key, start_row=5, start_col=0),
+                 dict(image=carrier, message='hello', key=self.key, start_row=5, start_col=60),  # past the width
+                 dict(image=carrier, message='hello', key=12345, start_row=5, start_col=0)]  # TypeError in Fernet
+        self.assertEqual([encode_item(item)['status'] for item in items], ['ok', 'error', 'error'])
+        items = load_manifest(self.write_manifest('manifest.jsonl', [json.dumps(item) for item in items]))
+        self.assertEqual(run_batch(items, encode_item, 1, self.path('out.jsonl')), 2)
+        with open(self.path('out.jsonl'), encoding='utf-8') as output:
+            records = [json.loads(line) for line in output]
+        self.assertEqual([record['status'] for record in records], ['ok', 'error', 'error'])
+        decoded = decode_item(dict(image=records[0]['output'], key=self.key))
+        self.assertEqual((decoded['status'], decoded['text']), ('ok', 'hello'))
+
+    def test_planner_skips_bad_entries(self):
+        planned, unplaced = plan_batch([dict(message='hi', error="Error: 'start_col' must be a non-negative "
+                                                                  "integer, not '-1'.")], [])
+        self.assertEqual(planned, [])
+        self.assertIn("'start_col'", unplaced[0][1])
+
+
+if __name__ == '__main__':
+    unittest.main()
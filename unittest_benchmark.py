@@ -0,0 +1,32 @@
+import unittest
+
+from benchmark import benchmark_carrier, compare, make_carrier
+from unittest_support import TemporaryDirectoryTest
+
+
+class TestBenchmark(TemporaryDirectoryTest):
+    """
+    The benchmark suite, run on a carrier small enough for the test suite.
+    """
+
+    def test_every_stage_runs(self):
+        path = make_carrier(self.directory, 'tiny', 64, 80)
+        results = benchmark_carrier(path, 'tiny', [100, 1_000_000], 1)  # the second payload doesn't fit and is skipped
+        stages = {result['stage'] for result in results}
+        self.assertTrue({'calculate_capacity', 'encoder', 'decoder', 'scatter_decoder', 'decode_cli'} <= stages)
+        self.assertEqual({result['payload'] for result in results}, {0, 100})
+        self.assertTrue(all(len(result['runs']) == 1 and result['seconds'] >= 0 for result in results))
+
+    def test_compare(self):
+        baseline = [{'stage': 'encoder', 'size': '1MP', 'payload': 100, 'seconds': 0.100},
+                    {'stage': 'decoder', 'size': '1MP', 'payload': 100, 'seconds': 0.001}]
+        results = [{'stage': 'encoder', 'size': '1MP', 'payload': 100, 'seconds': 0.200},
+                   {'stage': 'decoder', 'size': '1MP', 'payload': 100, 'seconds': 0.003},  # slower, but within noise
+                   {'stage': 'decoder', 'size': '4MP', 'payload': 100, 'seconds': 1.0}]  # not in the baseline
+        regressions = compare(results, baseline, 0.25, 0.005)
+        self.assertEqual(len(regressions), 1)
+        self.assertIn("encoder [1MP, 100 chars]", regressions[0])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,55 @@
+import argparse
+import json
+import unittest
+from unittest import mock
+
+import numpy as np
+from cryptography.fernet import Fernet
+
+from Capacity import (calculate_capacity, capacity_command, fernet_plaintext_capacity, fernet_token_size,
+                      image_shape)
+from ImageCache import image_info, load_image
+from unittest_support import TemporaryDirectoryTest
+
+
+class TestCapacity(TemporaryDirectoryTest):
+    """
+    Capacities calculated from the image header, without decoding the pixels.
+    """
+
+    def test_header_matches_pixels(self):
+        for name, shape, dtype in (('grey.png', (30, 40), np.uint8), ('colour.png', (30, 40, 3), np.uint8),
+                                   ('alpha.png', (30, 40, 4), np.uint16)):
+            path = self.random_image(name, shape, dtype)
+            with mock.patch('cv2.imread') as imread:
+                info = image_info(path)
+            imread.assert_not_called()
+            self.assertEqual((info.height, info.width, info.channels), image_shape(load_image(path)))
+            self.assertEqual(info.depth, np.dtype(dtype).itemsize * 8)
+            self.assertEqual(calculate_capacity(path, 5, 2), calculate_capacity(load_image(path), 5, 2))
+        bmp = self.random_image('alpha.bmp', (30, 40, 4))
+        self.assertEqual(image_shape(bmp)[2], 3)  # BMP files are written without alpha
+        self.assertEqual(calculate_capacity(self.path('missing.png'), 5, 0), 0)
+
+    def test_fernet_sizes(self):
+        for length in (0, 1, 15, 16, 100, 1000):
+            token_size = len(Fernet(self.key).encrypt(b'x' * length))
+            self.assertEqual(fernet_token_size(length), token_size)
+        for capacity in (100, 101, 500, 4096):
+            longest = fernet_plaintext_capacity(capacity)
+            self.assertLessEqual(fernet_token_size(longest), capacity)
+            self.assertGreater(fernet_token_size(longest + 1), capacity)  # one byte more no longer fits
+
+    def test_command(self):
+        path = self.random_image('carrier.png', (50, 40, 3))
+        args = argparse.Namespace(images=[path, self.path('missing.png')], density=None, start_row=5, start_col=0,
+                                  output=self.path('capacity.jsonl'))
+        self.assertEqual(capacity_command(args), 1)
+        with open(self.path('capacity.jsonl'), encoding='utf-8') as output:
+            records = [json.loads(line) for line in output]
+        self.assertEqual(records[0]['capacity'], {str(density): 45 * 40 * 3 * density // 8 for density in range(1, 5)})
+        self.assertIn('error', records[1])
+
+
+if __name__ == '__main__':
+    unittest.main()
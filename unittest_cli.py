@@ -0,0 +1,61 @@
+import os
+import subprocess
+import sys
+import unittest
+
+from Decoding import decode_bytes
+from Encoding import encode_bytes
+from unittest_support import TemporaryDirectoryTest
+
+MAIN = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'main.py')
+
+
+class TestBytesApi(TemporaryDirectoryTest):
+    """
+    Encoding and decoding images held in memory.
+    """
+
+    def carrier(self):
+        with open(self.random_image('carrier.png', (60, 60, 4)), 'rb') as image:
+            return image.read()
+
+    def test_round_trips(self):
+        png_bytes = self.carrier()
+        files = os.listdir(self.directory)
+        for payload in ('hello', b'\x00binary\xff' * 20):
+            result, encoded = encode_bytes(png_bytes, payload, self.key, 5, 3)
+            self.assertNotIn("Error", result)
+            self.assertEqual(decode_bytes(encoded, self.key)[1], payload)
+        self.assertEqual(os.listdir(self.directory), files)  # no temporary files
+
+    def test_errors(self):
+        self.assertIsNone(encode_bytes(b'GIF89a', 'hello', self.key)[1])
+        self.assertIsNone(encode_bytes(self.carrier(), 'hello', self.key, 5, 3, density=5)[1])
+        self.assertIsNone(decode_bytes(b'GIF89a', self.key)[1])
+        result, encoded = encode_bytes(self.carrier(), 'hello', self.key, 5, -3)
+        self.assertIsNone(encoded)
+        self.assertTrue(result.startswith("Error: "))
+
+
+class TestPipeCommands(TemporaryDirectoryTest):
+    """
+    The pipe-encode and pipe-decode subcommands, chained through standard input and output.
+    """
+
+    def run_main(self, arguments, data):
+        return subprocess.run([sys.executable, MAIN] + arguments, input=data, capture_output=True)
+
+    def test_pipeline(self):
+        with open(self.random_image('carrier.png', (60, 60, 3)), 'rb') as image:
+            png_bytes = image.read()
+        encoded = self.run_main(['pipe-encode', '--message', 'piped', '--key', self.key, '--scatter'], png_bytes)
+        self.assertEqual(encoded.returncode, 0, encoded.stderr)
+        decoded = self.run_main(['pipe-decode', '-', '--key', self.key], encoded.stdout)
+        self.assertEqual((decoded.returncode, decoded.stdout), (0, b'piped'))
+        failed = self.run_main(['pipe-decode', '--key', 'not a key'], encoded.stdout)
+        self.assertEqual((failed.returncode, failed.stdout), (1, b''))
+        self.assertTrue(failed.stderr.startswith(b'Error: '))
+
+
+if __name__ == '__main__':
+    unittest.main()
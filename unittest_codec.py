@@ -0,0 +1,51 @@
+import os
+import unittest
+
+from Codec import AUTO, CODEC_NONE, CODECS, available_codecs, compress, compression_ratio, decompress
+from Decoding import Decoding
+from Encoding import Encoding
+from unittest_support import TemporaryDirectoryTest
+
+
+class TestCodec(unittest.TestCase):
+    """
+    Compressing payloads before they are encrypted.
+    """
+
+    def test_round_trips(self):
+        data = b'the same words again and again ' * 50
+        for name in available_codecs():
+            codec_id, compressed = compress(data, name)
+            self.assertEqual(codec_id, CODECS[name])
+            self.assertLess(len(compressed), len(data))
+            self.assertEqual(decompress(compressed, codec_id), data)
+
+    def test_auto(self):
+        sizes = [len(compress(b'abc' * 1000, name)[1]) for name in available_codecs()]
+        self.assertEqual(len(compress(b'abc' * 1000, AUTO)[1]), min(sizes))  # the smallest output is kept
+        noise = os.urandom(1000)
+        self.assertEqual(compress(noise, AUTO), (CODEC_NONE, noise))  # nothing gets smaller
+        self.assertEqual(compression_ratio('short', AUTO), 1.0)
+        self.assertLess(compression_ratio('abc' * 1000, AUTO), 0.1)
+
+    def test_errors(self):
+        with self.assertRaisesRegex(ValueError, "Unknown or unavailable compression"):
+            compress(b'data', 'gzip')
+        with self.assertRaisesRegex(ValueError, "Corrupt compressed payload"):
+            decompress(b'not zlib data', CODECS['zlib'])
+
+
+class TestCompressedEncoding(TemporaryDirectoryTest):
+
+    def test_compression_raises_capacity(self):
+        carrier = self.random_image('carrier.png', (40, 40, 3))
+        message = 'a message that repeats itself, ' * 40
+        result, _ = Encoding(carrier, message, self.key, 5, 0).encoder()
+        self.assertIn("exceeds image capacity", result)
+        result, encoded = Encoding(carrier, message, self.key, 5, 0, compression=AUTO).encoder()
+        self.assertNotIn("Error", result)
+        self.assertEqual(Decoding(encoded, self.key).decoder()[1], message)  # the codec is read from the header
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,87 @@
+import argparse
+import contextlib
+import io
+import unittest
+
+import cv2
+import numpy as np
+from cryptography.fernet import Fernet
+
+from Container import SlotContainer, slots_command
+from PngStream import is_segmented
+from unittest_support import TemporaryDirectoryTest
+
+
+class TestSlotTable(TemporaryDirectoryTest):
+    """
+    The slot table and the messages of a container, in memory.
+    """
+
+    def test_round_trip(self):
+        img = self.rng.integers(0, 256, (80, 80, 4), dtype=np.uint8)
+        container = SlotContainer.create(img, 4, 0, 2, 4)
+        first = container.add('first message', self.key)
+        second = container.add(b'\x00binary\xff', self.key)
+        reopened = SlotContainer.open(img)
+        self.assertEqual(reopened.slots, container.slots)
+        self.assertEqual(reopened.read(first, self.key), 'first message')
+        self.assertEqual(reopened.read(second, self.key), b'\x00binary\xff')
+
+    def test_bad_crc(self):
+        img = self.rng.integers(0, 256, (80, 80, 3), dtype=np.uint8)
+        SlotContainer.create(img, 4, 0, 1, 4)
+        img[4, 10, 0] ^= 1  # a bit of the slot count, at the start of the table
+        with self.assertRaises(ValueError):
+            SlotContainer.open(img)
+
+    def test_delete_needs_the_key(self):
+        img = self.rng.integers(0, 256, (80, 80, 3), dtype=np.uint8)
+        container = SlotContainer.create(img, 4, 0, 1, 4)
+        index = container.add('mine', self.key)
+        with self.assertRaisesRegex(ValueError, 'different key'):
+            container.delete(index, Fernet.generate_key().decode())
+        container.delete(index, self.key)
+        self.assertEqual(SlotContainer.open(img).slots[index].length, 0)
+
+
+class TestSlotsCommand(TemporaryDirectoryTest):
+    """
+    The 'slots' subcommand, which patches only the rows of a PNG carrier it changes.
+    """
+
+    def slots(self, action, image, index=None, key=None, message=None, output=None):
+        args = argparse.Namespace(action=action, image=image, index=index, key=key, message=message,
+                                  message_file=None, payload_file=None, output=output, compress=None, start_row=4,
+                                  start_col=3, density=2, slots=4)
+        with contextlib.redirect_stderr(io.StringIO()):
+            return slots_command(args)
+
+    def test_add_and_delete(self):
+        carrier = self.random_image('carrier.png', (300, 257, 3))
+        self.assertEqual(self.slots('init', carrier), 0)
+        path = self.path('carrier_slots.png')
+        before = cv2.imread(path)
+        other = Fernet.generate_key().decode()
+        self.assertEqual(self.slots('add', path, key=self.key, message='first ' * 50), 0)
+        self.assertEqual(self.slots('add', path, key=other, message='second'), 0)
+        self.assertTrue(is_segmented(path))
+        self.assertEqual(self.slots('delete', path, 1), 1)  # no key
+        self.assertEqual(self.slots('delete', path, 1, key=self.key), 1)  # not the key of slot 1
+        self.assertEqual(self.slots('delete', path, 0, key=self.key), 0)
+        after = cv2.imread(path)
+        changed = np.flatnonzero((after != before).any(axis=(1, 2)))
+        self.assertLess(changed.max(), 20)  # only the rows of the table and the messages
+        container = SlotContainer.open(after)
+        self.assertEqual(container.slots[0].length, 0)
+        self.assertEqual(container.read(1, other), 'second')
+
+    def test_other_formats(self):
+        carrier = self.random_image('carrier.bmp', (80, 90, 3))
+        self.assertEqual(self.slots('init', carrier), 0)
+        self.assertEqual(self.slots('add', self.path('carrier_slots.bmp'), key=self.key, message='hello',
+                                    output=self.path('copy.bmp')), 0)
+        self.assertEqual(SlotContainer.open(cv2.imread(self.path('copy.bmp'))).read(0, self.key), 'hello')
+
+
+if __name__ == '__main__':
+    unittest.main()
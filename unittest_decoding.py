@@ -0,0 +1,39 @@
+import unittest
+
+import numpy as np
+
+from Decoding import decode_start, extract_bits
+from Encoding import embed_bits, encode_start, to_bits
+
+
+class TestExtraction(unittest.TestCase):
+    """
+    Reading bits back in the order the encoder writes them.
+    """
+
+    def setUp(self):
+        self.rng = np.random.default_rng(0)
+
+    def test_extract_inverts_embed(self):
+        img = self.rng.integers(0, 256, (30, 20, 3), dtype=np.uint8)
+        for density in (1, 2, 3, 4):
+            bits = to_bits(self.rng.bytes(90))
+            embedded = embed_bits(img.copy(), bits, 6, 4, density)
+            self.assertTrue(np.array_equal(extract_bits(embedded, 6, 4, bits.size, density), bits))
+            self.assertTrue(np.array_equal(extract_bits(embedded, 6, 4, 50, density, offset=333), bits[333:383]))
+
+    def test_extract_stops_at_the_end(self):
+        img = self.rng.integers(0, 256, (6, 5, 3), dtype=np.uint8)
+        self.assertEqual(extract_bits(img, 4, 1).size, 2 * 4 * 3)
+        self.assertEqual(extract_bits(img, 4, 1, 1000, 2).size, 2 * 4 * 3 * 2)
+        self.assertEqual(extract_bits(img, 4, 1, 10, offset=100).size, 0)
+
+    def test_decode_start(self):
+        img = self.rng.integers(0, 256, (30, 40, 3), dtype=np.uint8)
+        self.assertEqual(decode_start(encode_start(123, 37, img.copy())), (123, 37))
+        img[:4] &= 0xFE  # no '##' delimiter anywhere
+        self.assertIsNone(decode_start(img))
+
+
+if __name__ == '__main__':
+    unittest.main()
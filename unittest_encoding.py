@@ -0,0 +1,103 @@
+import unittest
+
+import cv2
+import numpy as np
+
+from Decoding import Decoding
+from Encoding import Encoding, embed_bits, lsb_mask, to_bits
+from ImageCache import clear_cache
+from PngStream import is_segmented, patch_png, write_png_segments
+from unittest_support import TemporaryDirectoryTest
+
+
+def embed_bits_by_pixel(img, bits, start_row, start_col, density):
+    """
+    The pixel loops embed_bits replaced, kept as the reference for its order and padding.
+    """
+    img = img.copy()
+    position = 0
+    for row in range(start_row, img.shape[0]):
+        for col in range(start_col, img.shape[1]):
+            for channel in range(img.shape[2]):
+                if position >= bits.size:
+                    return img
+                value = 0
+                for bit in range(density):
+                    value = value << 1 | (int(bits[position + bit]) if position + bit < bits.size else 0)
+                img[row, col, channel] = img[row, col, channel] & lsb_mask(img.dtype, density) | value
+                position += density
+    return img
+
+
+class TestEmbedBits(TemporaryDirectoryTest):
+    """
+    The vectorized embedding writes the same values as the pixel loops it replaced.
+    """
+
+    def test_matches_the_pixel_loops(self):
+        for dtype in (np.uint8, np.uint16):
+            img = self.rng.integers(0, np.iinfo(dtype).max + 1, (12, 9, 3), dtype=dtype)
+            for density, length in ((1, 40), (3, 41), (4, 1000)):  # short, padded and past the end of the image
+                bits = to_bits(self.rng.bytes(length))
+                expected = embed_bits_by_pixel(img, bits, 5, 2, density)
+                self.assertTrue(np.array_equal(embed_bits(img.copy(), bits, 5, 2, density), expected))
+
+    def test_round_trip(self):
+        carrier = self.random_image('carrier.png', (80, 70, 3))
+        result, encoded = Encoding(carrier, 'vectorized ' * 100, self.key, 9, 11).encoder()
+        self.assertNotIn("Error", result)
+        self.assertEqual(Decoding(encoded, self.key).decoder()[1], 'vectorized ' * 100)
+        original, changed = cv2.imread(carrier), cv2.imread(encoded)
+        self.assertTrue(np.array_equal(original >> 1, changed >> 1))  # only the least significant bits change
+
+
+class TestDensity(TemporaryDirectoryTest):
+    """
+    Storing 1 to 4 bits per channel.
+    """
+
+    def test_round_trips(self):
+        carrier = self.random_image('carrier.png', (40, 40, 3))
+        message = self.rng.bytes(400).hex()  # too long for 1 or 2 bits per channel
+        for density, fits in ((1, False), (2, False), (3, True), (4, True)):
+            result, encoded = Encoding(carrier, message, self.key, 5, 0, density=density).encoder()
+            self.assertEqual("Error" not in result, fits, result)
+            if fits:
+                self.assertEqual(Decoding(encoded, self.key).decoder()[1], message)  # the density is in the header
+                changed = cv2.imread(encoded).astype(np.int16) - cv2.imread(carrier)
+                self.assertLess(np.abs(changed).max(), 1 << density)
+
+    def test_bad_density(self):
+        carrier = self.random_image('carrier.png', (40, 40, 3))
+        for density in (0, 5):
+            result, encoded = Encoding(carrier, 'hello', self.key, 5, 0, density=density).encoder()
+            self.assertIn("Density must be between 1 and 4", result)
+            self.assertEqual(encoded, '')
+
+
+class TestStreamEncoder(TemporaryDirectoryTest):
+    """
+    Encoding a band of rows at a time (see Encoding.stream_encoder).
+    """
+
+    def test_round_trip(self):
+        carrier = self.random_image('carrier.png', (400, 150, 4))
+        result, encoded = Encoding(carrier, 'streamed ' * 500, self.key, 7, 5, density=3).stream_encoder()
+        self.assertNotIn("Error", result)
+        self.assertEqual(Decoding(encoded, self.key).decoder()[1], 'streamed ' * 500)
+        self.assertTrue(np.array_equal(cv2.imread(encoded, cv2.IMREAD_UNCHANGED)[200:],
+                                       cv2.imread(carrier, cv2.IMREAD_UNCHANGED)[200:]))  # below the payload
+
+    def test_drops_the_segment_tag(self):
+        carrier = self.path('carrier.png')
+        write_png_segments(carrier, self.rng.integers(0, 256, (300, 120, 3), dtype=np.uint8), 2)
+        result, encoded = Encoding(carrier, 'hello', self.key, 5, 0).stream_encoder()
+        self.assertNotIn("Error", result)
+        self.assertFalse(is_segmented(encoded))  # the pixel data is written as one stream
+        self.assertFalse(patch_png(encoded, self.path('patched.png'), [(0, 0)], lambda top, band: None))
+        clear_cache()
+        self.assertEqual(Decoding(self.path('patched.png'), self.key).decoder()[1], 'hello')
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,53 @@
+import unittest
+
+import cv2
+import numpy as np
+
+from Capacity import calculate_capacity
+from Decoding import Decoding
+from Encoding import Encoding
+from unittest_support import TemporaryDirectoryTest
+
+
+class TestFormats(TemporaryDirectoryTest):
+    """
+    Carriers with alpha channels, 16-bit samples and the lossless formats besides PNG.
+    """
+
+    def test_round_trips(self):
+        for name, shape, dtype in (('alpha.png', (60, 60, 4), np.uint8), ('deep.png', (60, 60, 3), np.uint16),
+                                   ('grey.png', (60, 60), np.uint8), ('carrier.bmp', (60, 60, 3), np.uint8),
+                                   ('carrier.tiff', (60, 60, 4), np.uint16), ('carrier.webp', (60, 60, 3), np.uint8)):
+            carrier = self.random_image(name, shape, dtype)
+            result, encoded = Encoding(carrier, f'hidden in {name}', self.key, 5, 0, density=2).encoder()
+            self.assertNotIn("Error", result, name)
+            self.assertEqual(Decoding(encoded, self.key).decoder()[1], f'hidden in {name}', name)
+            img = cv2.imread(encoded, cv2.IMREAD_UNCHANGED)
+            self.assertEqual((img.shape, img.dtype), (shape, dtype), name)  # nothing dropped or converted
+
+    def test_alpha_holds_payload(self):
+        colour = self.random_image('colour.png', (60, 64, 3))
+        alpha = self.random_image('alpha.png', (60, 64, 4))
+        self.assertEqual(calculate_capacity(alpha, 5, 0) * 3, calculate_capacity(colour, 5, 0) * 4)
+        result, encoded = Encoding(alpha, 'x' * 200, self.key, 5, 0).encoder()
+        self.assertNotIn("Error", result)
+        before, after = cv2.imread(alpha, cv2.IMREAD_UNCHANGED), cv2.imread(encoded, cv2.IMREAD_UNCHANGED)
+        self.assertFalse(np.array_equal(before[:, :, 3], after[:, :, 3]))
+
+    def test_webp_refuses_transparent_pixels(self):
+        img = self.rng.integers(0, 256, (60, 60, 4), dtype=np.uint8)
+        img[10, 10, 3] = 0
+        cv2.imwrite(self.path('carrier.webp'), img, [cv2.IMWRITE_WEBP_QUALITY, 101])
+        result, encoded = Encoding(self.path('carrier.webp'), 'hello', self.key, 5, 0).encoder()
+        self.assertIn("WebP does not keep the colour of fully transparent pixels", result)
+        self.assertEqual(encoded, '')
+
+    def test_lossy_formats_are_refused(self):
+        carrier = self.path('carrier.jpg')
+        cv2.imwrite(carrier, self.rng.integers(0, 256, (60, 60, 3), dtype=np.uint8))
+        self.assertEqual(Encoding(carrier, 'hello', self.key, 5, 0).encoder(),
+                         ("Error: This program only supports PNG, BMP, TIFF and WebP files.", ''))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,56 @@
+import threading
+import time
+import types
+import unittest
+from unittest import mock
+
+import GUI
+from unittest_support import TemporaryDirectoryTest
+
+
+class Entry:
+
+    def __init__(self, text):
+        self.text = text
+
+    def get(self):
+        return self.text
+
+
+class Widget:
+
+    def config(self, **options):
+        pass
+
+
+class TestEncodeText(TemporaryDirectoryTest):
+    """
+    The encode page must hand all slow work to a worker thread. No display is needed: the widgets are stand-ins.
+    """
+
+    def test_loads_the_image_off_the_tk_thread(self):
+        master = types.SimpleNamespace(title=lambda text: None, after=lambda delay, callback: None)
+        app = GUI.SteganographyAppGUI(master)
+        app.image_entry = Entry(self.random_image('carrier.png', (60, 60, 3)))
+        app.text_entry, app.key_entry = Entry('hello'), Entry(self.key)
+        app.progress_bar, app.action_button, app.cancel_button = Widget(), Widget(), Widget()
+        release, threads = threading.Event(), []
+
+        def slow_load(path):
+            threads.append(threading.current_thread())
+            release.wait(5)  # a cold decode of a large image
+            return None
+        with mock.patch.object(GUI, 'load_image', slow_load):
+            app.encode_text()  # would block here if the image were loaded on the Tk thread
+            release.set()
+            for _ in range(100):
+                if not app.ui_queue.empty():
+                    break
+                time.sleep(0.05)
+        self.assertEqual(len(threads), 1)
+        self.assertIsNot(threads[0], threading.main_thread())
+        self.assertFalse(app.ui_queue.empty())  # the error is posted back to the Tk thread
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,80 @@
+import unittest
+
+import cv2
+import numpy as np
+from cryptography.fernet import Fernet
+
+from Container import SlotContainer
+from Decoding import END_DELIMITER, Decoding, decode_start
+from Encoding import Encoding, embed_bits, encode_bytes, encode_start, layout_error, to_bits
+from Header import HEADER_SIZE, pack_header, payload_view, unpack_header
+from unittest_support import TemporaryDirectoryTest, corrupt
+
+
+class TestHeader(unittest.TestCase):
+    """
+    Round trips of the payload header packed by Header.
+    """
+
+    def test_payload_header(self):
+        data = pack_header(7, 3, 123456, 0x85)
+        self.assertEqual(len(data), HEADER_SIZE)
+        self.assertEqual(tuple(unpack_header(data)), (1, 0x85, 7, 3, 123456))
+        self.assertIsNone(unpack_header(corrupt(data, 10)))
+        self.assertIsNone(unpack_header(corrupt(data, HEADER_SIZE - 1)))  # the CRC itself
+        self.assertIsNone(unpack_header(b'XYZ' + data[3:]))
+        self.assertIsNone(unpack_header(data[:-1]))
+
+
+class TestLayout(TemporaryDirectoryTest):
+    """
+    The header and the start of the payload must fit the image before anything is written.
+    """
+
+    def test_layout_error(self):
+        self.assertIsNone(layout_error(60, 60, 3, 4, 0))
+        self.assertIsNone(layout_error(60, 17, 3))
+        self.assertIn("17 pixels wide", layout_error(60, 16, 3))
+        self.assertIn("50 pixels wide", layout_error(60, 49, 1))
+        self.assertIn("4 rows high", layout_error(3, 60, 3))
+        self.assertIn("start row", layout_error(60, 60, 3, 3, 0))
+        self.assertIn("start column", layout_error(60, 60, 3, 4, -1))
+        self.assertIn("start column", layout_error(60, 60, 4, 4, 60))
+
+    def test_encoder_refuses_bad_start(self):
+        png = cv2.imencode('.png', self.rng.integers(0, 256, (60, 60, 3), dtype=np.uint8))[1].tobytes()
+        for start_row, start_col in ((2, 0), (5, -1), (5, 60)):
+            result, encoded = encode_bytes(png, 'hello', self.key, start_row, start_col)
+            self.assertIsNone(encoded)
+            self.assertTrue(result.startswith("Error: "), result)
+        carrier = self.random_image('carrier.png', (60, 60, 3))
+        result, _ = Encoding(carrier, 'hello', self.key, 5, -1).encoder()
+        self.assertIn("start column", result)
+
+    def test_container_refuses_bad_start(self):
+        for shape, start_col in (((60, 60, 3), -1), ((60, 60, 3), 60), ((60, 12, 3), 0)):
+            with self.assertRaises(ValueError):
+                SlotContainer.create(np.zeros(shape, dtype=np.uint8), 4, start_col)
+
+
+class TestLegacyFallback(TemporaryDirectoryTest):
+
+    def test_legacy_image(self):
+        img = self.rng.integers(0, 256, (60, 60, 3), dtype=np.uint8)
+        encode_start(10, 3, img)
+        token = Fernet(self.key).encrypt(b'legacy text')
+        embed_bits(payload_view(img), to_bits(token + END_DELIMITER), 10, 3)
+        cv2.imwrite(self.path('legacy.png'), img)
+        self.assertEqual(decode_start(img), (10, 3))
+        self.assertEqual(Decoding(self.path('legacy.png'), self.key).decoder()[1], 'legacy text')
+
+    def test_plain_image(self):
+        path = self.random_image('plain.png', (60, 60, 3))
+        self.assertIsNone(decode_start(cv2.imread(path)))
+        result, text = Decoding(path, self.key).decoder()
+        self.assertIsNone(text)
+        self.assertIn("No encoded message found", result)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,39 @@
+import os
+import unittest
+from unittest import mock
+
+import cv2
+import numpy as np
+
+from Decoding import Decoding
+from Encoding import Encoding
+from ImageCache import load_image
+from unittest_support import TemporaryDirectoryTest
+
+
+class TestImageCache(TemporaryDirectoryTest):
+    """
+    Each carrier is decoded from disk once, however many steps use it.
+    """
+
+    def test_cached_until_the_file_changes(self):
+        path = self.random_image('carrier.png', (20, 30, 3))
+        img = load_image(path)
+        self.assertIs(load_image(path), img)
+        self.assertFalse(img.flags.writeable)  # shared between callers
+        cv2.imwrite(path, np.zeros((21, 30, 3), dtype=np.uint8))
+        self.assertEqual(load_image(path).shape, (21, 30, 3))
+        self.assertIsNone(load_image(self.path('missing.png')))
+
+    def test_encode_and_decode_read_once(self):
+        carrier = self.random_image('carrier.png', (60, 60, 3))
+        with mock.patch('cv2.imread', side_effect=cv2.imread) as imread:
+            result, encoded = Encoding(carrier, 'hello', self.key, 5, 0).encoder()
+            self.assertEqual(imread.call_count, 1)
+            self.assertEqual(Decoding(encoded, self.key).decoder()[1], 'hello')
+            self.assertEqual(imread.call_count, 2)
+        self.assertTrue(os.path.exists(encoded))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,51 @@
+import json
+import os
+import subprocess
+import sys
+import unittest
+
+import Metrics
+from Metrics import StageMetrics, format_report
+from unittest_support import TemporaryDirectoryTest
+
+MAIN = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'main.py')
+
+
+class TestMetrics(TemporaryDirectoryTest):
+    """
+    Per-stage timings, from the stage records up to --profile and --metrics-file.
+    """
+
+    def test_stages(self):
+        metrics = StageMetrics('encode', 'carrier.png')
+        with metrics.stage('read', 10) as stage:
+            stage['bytes'] = 20
+        with metrics.stage('write'):
+            pass
+        operation = metrics.as_dict()
+        self.assertEqual([(stage['stage'], stage['bytes']) for stage in operation['stages']],
+                         [('read', 20), ('write', 0)])
+        self.assertAlmostEqual(operation['seconds'], sum(stage['seconds'] for stage in operation['stages']))
+        self.assertNotIn(metrics, Metrics.recorded)  # only kept once enabled
+        table = format_report([operation])
+        self.assertTrue(table.startswith('encode carrier.png: '))
+        self.assertIn('write', table)
+
+    def test_metrics_file(self):
+        carrier = self.random_image('carrier.png', (80, 80, 3))
+        with open(self.path('encoded.png'), 'wb') as output:
+            process = subprocess.run([sys.executable, MAIN, '--profile', '--metrics-file', self.path('metrics.json'),
+                                      'pipe-encode', carrier, '--message', 'hello', '--key', self.key, '--scatter'],
+                                     stdout=output, stderr=subprocess.PIPE, text=True)
+        self.assertEqual(process.returncode, 0, process.stderr)
+        with open(self.path('metrics.json'), encoding='utf-8') as metrics_file:
+            operations = json.load(metrics_file)
+        self.assertEqual([operation['operation'] for operation in operations], ['encode'])
+        stages = [stage['stage'] for stage in operations[0]['stages']]
+        self.assertEqual(stages[0], 'read')
+        self.assertTrue(all('peak_memory' in stage for stage in operations[0]['stages']))
+        self.assertIn('encode <bytes>: ', process.stderr)  # the --profile table
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,78 @@
+import argparse
+import contextlib
+import io
+import json
+import os
+import unittest
+
+from cryptography.fernet import Fernet
+
+from Batch import decode_item, encode_item
+from Codec import compress
+from Planner import INDEX_NAME, payload_size, plan_batch, plan_command
+from Scan import load_index
+from StreamCipher import encrypted_size
+from unittest_support import TemporaryDirectoryTest
+
+
+def carrier(path, room):
+    """
+    The index record of a free carrier holding room bytes at density 1.
+    """
+    return {'path': path, 'has_payload': False, 'height': 100, 'width': 100, 'channels': 3,
+            'capacity': {'1': room, '2': 2 * room}}
+
+
+class TestPlanner(TemporaryDirectoryTest):
+    """
+    Assigning the payloads of a batch to the carriers of a pool.
+    """
+
+    def test_payload_size(self):
+        message = 'planned and compressed ' * 20
+        compressed = compress(message.encode(), 'zlib')[1]
+        self.assertEqual(payload_size({'message': message, 'compression': 'zlib'}),
+                         len(Fernet(self.key).encrypt(compressed)))
+        self.assertEqual(payload_size({'message': message}), len(Fernet(self.key).encrypt(message.encode())))
+        with open(self.path('payload.bin'), 'wb') as payload:
+            payload.write(os.urandom(1000))
+        self.assertEqual(payload_size({'payload_file': self.path('payload.bin')}), encrypted_size(1000))
+
+    def test_best_fit(self):
+        records = [carrier('/pool/large', 2000), carrier('/pool/small', 250), carrier('/pool/medium', 400),
+                   dict(carrier('/pool/used', 5000), has_payload=True)]
+        items = [{'message': 'x' * 100}, {'message': 'x' * 200}, {'message': 'x' * 5000}, {'image': '/pool/own'}]
+        planned, unplaced = plan_batch(items, records)
+        self.assertEqual([(len(item.get('message', '')), item['image']) for item in planned],
+                         [(200, '/pool/medium'), (100, '/pool/small'), (0, '/pool/own')])  # largest first
+        self.assertEqual(len(unplaced), 1)
+        self.assertIn("No free carrier holds", unplaced[0][1])
+        planned, unplaced = plan_batch([{'message': 'x' * 300, 'density': '2'}], records)
+        self.assertEqual(planned[0]['image'], '/pool/small')  # twice the room at 2 bits per channel
+
+    def test_command(self):
+        os.mkdir(self.path('pool'))
+        for name, shape in (('a.png', (60, 60, 3)), ('b.png', (200, 200, 3))):
+            self.random_image(os.path.join('pool', name), shape)
+        with open(self.path('manifest.jsonl'), 'w', encoding='utf-8') as manifest:
+            manifest.write(json.dumps({'message': 'planned', 'key': self.key}) + '\n')
+        args = argparse.Namespace(manifest=self.path('manifest.jsonl'), pool=self.path('pool'), recursive=False,
+                                  index=None, workers=1, density=1, dry_run=False, output=self.path('plan.jsonl'))
+        with contextlib.redirect_stderr(io.StringIO()):
+            self.assertEqual(plan_command(args), 0)
+        with open(self.path('plan.jsonl'), encoding='utf-8') as plan:
+            item = json.loads(plan.readline())
+        self.assertEqual(os.path.basename(item['image']), 'a.png')  # the smallest carrier that holds the payload
+        index = load_index(self.path(os.path.join('pool', INDEX_NAME)))
+        self.assertTrue(index[item['image']]['planned'])
+        record = encode_item(item)
+        self.assertEqual(record['status'], 'ok')
+        self.assertEqual(decode_item({'image': record['output'], 'key': self.key})['text'], 'planned')
+        with contextlib.redirect_stderr(io.StringIO()):
+            self.assertEqual(plan_command(args), 0)
+        with open(self.path('plan.jsonl'), encoding='utf-8') as plan:
+            self.assertEqual(os.path.basename(json.loads(plan.readline())['image']), 'b.png')  # a.png is taken
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,49 @@
+import os
+import unittest
+import zlib
+
+import cv2
+import numpy as np
+
+from Decoding import Decoding
+from Encoding import Encoding
+from ImageCache import clear_cache, load_image
+from PngStream import adler32_combine, is_segmented, read_png_segments, write_png_segments
+from unittest_support import TemporaryDirectoryTest
+
+
+class TestSegmentedPng(TemporaryDirectoryTest):
+    """
+    PNG files written in independently compressed segments of rows, on several threads.
+    """
+
+    def test_adler32_combine(self):
+        for first, second in ((b'', b'abc'), (b'abc', b''), (os.urandom(5000), os.urandom(70000)),
+                              (b'\xff' * 65521, b'\xff' * 65522)):
+            self.assertEqual(adler32_combine(zlib.adler32(first), zlib.adler32(second), len(second)),
+                             zlib.adler32(first + second))
+
+    def test_round_trip(self):
+        for shape in ((1, 1, 3), (130, 257, 3), (301, 513, 4), (255, 1023, 3), (7, 2, 4)):
+            img = self.rng.integers(0, 256, shape, dtype=np.uint8)
+            path = self.path('segments.png')
+            write_png_segments(path, img, 2)
+            self.assertTrue(is_segmented(path))
+            self.assertTrue(np.array_equal(cv2.imread(path, cv2.IMREAD_UNCHANGED), img), shape)
+            self.assertTrue(np.array_equal(read_png_segments(path, 2), img), shape)
+
+    def test_threaded_round_trip(self):
+        carrier = self.random_image('carrier.png', (500, 300, 3))
+        text = 'threaded ' * 2000
+        result, encoded = Encoding(carrier, text, self.key, 9, 3, density=2, threads=3).encoder()
+        self.assertNotIn("Error", result)
+        self.assertTrue(is_segmented(encoded))
+        clear_cache()
+        self.assertTrue(np.array_equal(load_image(encoded, 3), cv2.imread(encoded)))
+        self.assertEqual(Decoding(encoded, self.key, threads=3).decoder()[1], text)
+        self.assertFalse(is_segmented(carrier))  # written by OpenCV, so it is decoded by OpenCV
+        self.assertTrue(np.array_equal(load_image(carrier, 3), cv2.imread(carrier)))
+
+
+if __name__ == '__main__':
+    unittest.main()
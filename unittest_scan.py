@@ -0,0 +1,64 @@
+import argparse
+import contextlib
+import io
+import json
+import os
+import unittest
+
+import cv2
+
+from Encoding import Encoding, encode_start
+from ImageCache import load_image
+from Scan import list_images, load_index, save_index, scan, scan_image, scan_paths
+from unittest_support import TemporaryDirectoryTest
+
+
+class TestScan(TemporaryDirectoryTest):
+    """
+    Finding payloads without a key, from the first rows of each image.
+    """
+
+    def test_scan_image(self):
+        plain = self.random_image('plain.png', (60, 60, 3))
+        self.assertFalse(scan_image(plain)['has_payload'])
+        encoded = Encoding(plain, 'hello', self.key, 7, 3).encoder()[1]
+        record = scan_image(encoded)
+        self.assertEqual((record['has_payload'], record['format'], record['start_row'], record['start_col']),
+                         (True, 'header', 7, 3))
+        cv2.imwrite(self.path('legacy.png'), encode_start(9, 2, load_image(plain).copy()))
+        self.assertEqual(scan_image(self.path('legacy.png'))['format'], 'legacy')
+        with open(self.path('broken.png'), 'wb') as broken:
+            broken.write(b'not an image')
+        self.assertIn('error', scan_image(self.path('broken.png')))
+
+    def test_index(self):
+        for name in ('a.png', 'b.png', 'c.bmp'):
+            self.random_image(name, (30, 30, 3))
+        paths = list_images(self.directory)
+        self.assertEqual([os.path.basename(path) for path in paths], ['a.png', 'b.png', 'c.bmp'])
+        records, scanned = scan_paths(paths, workers=1)
+        self.assertEqual(scanned, 3)
+        index = {record['path']: record for record in records}
+        save_index(self.path('index.json'), index)
+        self.assertEqual(load_index(self.path('index.json')), index)
+        self.random_image('b.png', (31, 30, 3))  # changed since the index was saved
+        records, scanned = scan_paths(paths, load_index(self.path('index.json')), workers=1)
+        self.assertEqual(scanned, 1)
+        with open(self.path('index.json'), 'w', encoding='utf-8') as index_file:
+            json.dump({'version': 0, 'images': index}, index_file)
+        self.assertEqual(load_index(self.path('index.json')), {})  # an older layout is rescanned
+
+    def test_command(self):
+        Encoding(self.random_image('carrier.png', (60, 60, 3)), 'hello', self.key, 5, 0).encoder()
+        args = argparse.Namespace(source=self.directory, recursive=False, index=self.path('index.json'), workers=1,
+                                  output=self.path('scan.jsonl'))
+        with contextlib.redirect_stderr(io.StringIO()):
+            self.assertEqual(scan(args), 0)
+        with open(self.path('scan.jsonl'), encoding='utf-8') as output:
+            records = [json.loads(line) for line in output]
+        self.assertEqual([record['has_payload'] for record in records], [False, True])  # carrier, carrier_encoded
+        self.assertEqual(len(load_index(self.path('index.json'))), 2)
+
+
+if __name__ == '__main__':
+    unittest.main()
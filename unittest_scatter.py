@@ -0,0 +1,39 @@
+import unittest
+
+import cv2
+import numpy as np
+from cryptography.fernet import Fernet
+
+from Decoding import Decoding
+from Encoding import Encoding
+from Header import HEADER_ROWS
+from Scatter import run_count, run_order
+from unittest_support import TemporaryDirectoryTest
+
+
+class TestScatter(TemporaryDirectoryTest):
+    """
+    Payloads spread over the runs of pixels in an order seeded by the key.
+    """
+
+    def test_run_order(self):
+        order = run_order(50, 40, self.key)
+        self.assertTrue(np.array_equal(np.sort(order), np.arange(run_count(50, 40))))
+        self.assertIs(run_order(50, 40, self.key.encode()), order)  # cached, whatever type the key has
+        self.assertFalse(order.flags.writeable)
+        self.assertFalse(np.array_equal(run_order(50, 40, Fernet.generate_key().decode()), order))
+
+    def test_round_trip(self):
+        carrier = self.random_image('carrier.png', (120, 80, 3))
+        for density in (1, 3):
+            result, encoded = Encoding(carrier, 'scattered', self.key, None, None, density=density,
+                                       scatter=True).encoder()
+            self.assertNotIn("Error", result)
+            self.assertEqual(Decoding(encoded, self.key).decoder()[1], 'scattered')
+            self.assertIn("Error", Decoding(encoded, Fernet.generate_key().decode()).decoder()[0])
+        changed = np.flatnonzero((cv2.imread(encoded) != cv2.imread(carrier))[HEADER_ROWS:].any(axis=(1, 2)))
+        self.assertGreater(changed.max() - changed.min(), 120 // 2)  # a short message, spread over the image
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,68 @@
+import http.client
+import json
+import threading
+import unittest
+from urllib.parse import urlencode
+
+from Server import SteganographyServer
+from unittest_support import TemporaryDirectoryTest
+
+
+class TestServer(TemporaryDirectoryTest):
+    """
+    The HTTP service, run on a free local port with one worker and no queue.
+    """
+
+    @classmethod
+    def setUpClass(cls):
+        cls.server = SteganographyServer(('127.0.0.1', 0), pool_size=1, queue_size=0)
+        threading.Thread(target=cls.server.serve_forever, daemon=True).start()
+
+    @classmethod
+    def tearDownClass(cls):
+        cls.server.shutdown()
+        cls.server.server_close()
+
+    def post(self, path, params, body):
+        connection = http.client.HTTPConnection('127.0.0.1', self.server.server_port, timeout=10)
+        connection.request('POST', f'{path}?{urlencode(params)}', body)
+        response = connection.getresponse()
+        result = response.status, response.read()
+        connection.close()
+        return result
+
+    def carrier(self):
+        with open(self.random_image('carrier.png', (60, 60, 3)), 'rb') as image:
+            return image.read()
+
+    def test_round_trip(self):
+        status, encoded = self.post('/encode', {'key': self.key, 'message': 'hello', 'start_row': 5, 'start_col': 3},
+                                    self.carrier())
+        self.assertEqual(status, 200)
+        self.assertEqual(self.post('/decode', {'key': self.key}, encoded), (200, b'hello'))
+        status, body = self.post('/capacity', {}, encoded)
+        self.assertEqual((status, json.loads(body)['width']), (200, 60))
+
+    def test_bad_start_is_a_client_error(self):
+        status, body = self.post('/encode', {'key': self.key, 'message': 'hello', 'start_row': 5, 'start_col': -3},
+                                 self.carrier())
+        self.assertEqual(status, 400)
+        self.assertTrue(body.startswith(b'Error: '))
+
+    def test_busy_server_reads_no_body(self):
+        self.assertTrue(self.server.slots.acquire(blocking=False))  # the only slot is taken
+        try:
+            connection = http.client.HTTPConnection('127.0.0.1', self.server.server_port, timeout=10)
+            connection.putrequest('POST', '/decode?' + urlencode({'key': self.key}))
+            connection.putheader('Content-Length', str(100 * 1024 * 1024))
+            connection.endheaders()  # the body is never sent, so reading it would hang until the timeout
+            response = connection.getresponse()
+            self.assertEqual((response.status, response.getheader('Retry-After')), (503, '1'))
+            connection.close()
+        finally:
+            self.server.slots.release()
+        self.assertEqual(self.server.metrics.as_dict()['in_flight'], 0)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,63 @@
+import os
+import unittest
+
+from Header import SHARD_SIZE, pack_shard_header, unpack_shard_header
+from Shard import decode_shards, encode_shard, encode_shards
+from unittest_support import TemporaryDirectoryTest, corrupt
+
+
+class TestShardHeader(unittest.TestCase):
+
+    def test_shard_header(self):
+        payload_id = bytes(range(16))
+        data = pack_shard_header(payload_id, 2, 5, 1 << 40)
+        self.assertEqual(len(data), SHARD_SIZE)
+        self.assertEqual(tuple(unpack_shard_header(data)), (payload_id, 2, 5, 1 << 40))
+        self.assertIsNone(unpack_shard_header(corrupt(data, 20)))
+        self.assertIsNone(unpack_shard_header(pack_shard_header(payload_id, 5, 5, 10)))  # index past the count
+        self.assertIsNone(unpack_shard_header(data[:-1]))
+
+
+class TestShards(TemporaryDirectoryTest):
+
+    def encode(self, size):
+        carriers = [self.random_image(f'carrier{index}.png', (60 + 10 * index, 70, 3)) for index in range(4)]
+        os.mkdir(self.path('out'))
+        payload = os.urandom(size)
+        with open(self.path('payload'), 'wb') as payload_file:
+            payload_file.write(payload)
+        with open(self.path('payload'), 'rb') as payload_file:
+            _, records = encode_shards(self.key, payload_file, size, carriers, 1, self.path('out'), workers=1)
+        return payload, [record['output'] for record in records]
+
+    def test_reassembly(self):
+        payload, outputs = self.encode(6000)
+        self.assertGreater(len(outputs), 1)
+        with open(self.path('result'), 'wb') as output:
+            shards = decode_shards(self.key, outputs[::-1], output, workers=1)  # in any order
+        self.assertEqual([shard['index'] for shard in shards], list(range(len(outputs))))
+        with open(self.path('result'), 'rb') as result:
+            self.assertEqual(result.read(), payload)
+
+    def test_missing_shard(self):
+        _, outputs = self.encode(6000)
+        with open(self.path('result'), 'wb') as output:
+            with self.assertRaisesRegex(ValueError, 'missing shard'):
+                decode_shards(self.key, outputs[1:], output, workers=1)
+
+    def test_narrow_carrier(self):
+        narrow = self.random_image('narrow.png', (400, 12, 3))  # holds bytes, but not the header
+        record = encode_shard(narrow, self.path('narrow_encoded.png'), b'shard')
+        self.assertEqual(record['status'], 'error')
+        self.assertIn("to hold the header", record['message'])
+        self.assertFalse(os.path.exists(self.path('narrow_encoded.png')))
+        wide = self.random_image('wide.png', (60, 70, 3))
+        with open(self.path('payload'), 'wb') as payload_file:
+            payload_file.write(b'payload')
+        with open(self.path('payload'), 'rb') as payload_file:
+            _, records = encode_shards(self.key, payload_file, 7, [narrow, wide], workers=1)
+        self.assertEqual([record['image'] for record in records], [wide])  # the narrow carrier is left out
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,20 @@
+import unittest
+
+from startup import COMMANDS, import_times
+
+
+class TestStartup(unittest.TestCase):
+    """
+    The light commands must not load the heavy modules. Only the modules are checked here: the time budgets depend
+    on the machine, so they are left to startup.py.
+    """
+
+    def test_no_heavy_imports(self):
+        for name, (arguments, _, forbidden) in COMMANDS.items():
+            _, modules, _ = import_times(arguments)
+            self.assertIn('Metrics', modules, name)  # the run did import main.py
+            self.assertEqual([module for module in forbidden if module in modules], [], name)
+
+
+if __name__ == '__main__':
+    unittest.main()
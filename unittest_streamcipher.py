@@ -0,0 +1,59 @@
+import io
+import os
+import unittest
+
+from cryptography.exceptions import InvalidTag
+from cryptography.fernet import Fernet
+
+from Decoding import Decoding
+from Encoding import Encoding
+from StreamCipher import CHUNK_SIZE, TAG_SIZE, decrypt_chunks, encrypt_chunks, encrypted_size
+from unittest_support import TemporaryDirectoryTest
+
+
+def encrypt(key, payload):
+    return b''.join(encrypt_chunks(key, io.BytesIO(payload), len(payload)))
+
+
+def decrypt(key, data):
+    return b''.join(decrypt_chunks(key, io.BytesIO(data).read, len(data)))
+
+
+class TestStreamCipher(TemporaryDirectoryTest):
+    """
+    Payloads encrypted and authenticated a chunk at a time.
+    """
+
+    def test_round_trip(self):
+        for size in (0, 1, CHUNK_SIZE, 2 * CHUNK_SIZE + 5):
+            payload = os.urandom(size)
+            data = encrypt(self.key, payload)
+            self.assertEqual(len(data), encrypted_size(size))
+            self.assertEqual(decrypt(self.key, data), payload)
+
+    def test_tampering_is_detected(self):
+        data = encrypt(self.key, os.urandom(2 * CHUNK_SIZE + 5))
+        with self.assertRaises(InvalidTag):
+            decrypt(Fernet.generate_key().decode(), data)
+        with self.assertRaises(InvalidTag):
+            decrypt(self.key, data[:-(5 + TAG_SIZE)])  # the last chunk dropped
+        with self.assertRaises(InvalidTag):
+            decrypt(self.key, data[:100] + bytes([data[100] ^ 1]) + data[101:])
+
+    def test_file_round_trip(self):
+        carrier = self.random_image('carrier.png', (300, 250, 3))
+        with open(self.path('payload.bin'), 'wb') as payload:
+            payload.write(os.urandom(CHUNK_SIZE + 100))
+        result, encoded = Encoding(carrier, '', self.key, 5, 0, density=4).file_encoder(self.path('payload.bin'))
+        self.assertNotIn("Error", result)
+        wrong = Decoding(encoded, Fernet.generate_key().decode()).file_decoder(self.path('wrong.bin'))
+        self.assertIsNone(wrong[1])
+        self.assertFalse(os.path.exists(self.path('wrong.bin')))  # no unauthenticated output left behind
+        self.assertEqual(Decoding(encoded, self.key).file_decoder(self.path('decoded.bin'))[1],
+                         self.path('decoded.bin'))
+        with open(self.path('payload.bin'), 'rb') as payload, open(self.path('decoded.bin'), 'rb') as decoded:
+            self.assertEqual(decoded.read(), payload.read())
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,45 @@
+import os
+import shutil
+import tempfile
+import unittest
+
+import cv2
+import numpy as np
+from cryptography.fernet import Fernet
+
+from ImageCache import clear_cache
+
+
+def corrupt(data, position):
+    """
+    Returns:
+        bytes: The data with one bit flipped at the given byte position.
+    """
+    return data[:position] + bytes([data[position] ^ 0x01]) + data[position + 1:]
+
+
+class TemporaryDirectoryTest(unittest.TestCase):
+    """
+    Runs each test in a fresh temporary directory, with an empty image cache.
+    """
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.key = Fernet.generate_key().decode()
+        self.rng = np.random.default_rng(0)
+        clear_cache()
+
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+        clear_cache()
+
+    def path(self, name):
+        return os.path.join(self.directory, name)
+
+    def random_image(self, name, shape, dtype=np.uint8):
+        """
+        Writes an image of random pixels and returns its path.
+        """
+        path = self.path(name)
+        cv2.imwrite(path, self.rng.integers(0, np.iinfo(dtype).max + 1, shape, dtype=dtype))
+        return path
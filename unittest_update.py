@@ -0,0 +1,53 @@
+import unittest
+
+import cv2
+import numpy as np
+
+from Decoding import Decoding
+from Encoding import Encoding
+from ImageCache import clear_cache
+from PngStream import SEGMENT_CHUNK, is_segmented, patch_png, segment_rows_for, write_png_segments
+from unittest_support import TemporaryDirectoryTest
+
+
+class TestUpdater(TemporaryDirectoryTest):
+    """
+    In-place updates of encoded images, written with patch_png.
+    """
+
+    def test_grow_and_shrink(self):
+        carrier = self.random_image('carrier.png', (200, 160, 3))
+        result, encoded = Encoding(carrier, 'first', self.key, 6, 2, density=2).encoder()
+        self.assertNotIn("Error", result)
+        self.assertFalse(is_segmented(encoded))
+        for text in ('a much longer message than the first one ' * 20, 'short'):
+            result, _ = Encoding(encoded, text, self.key, None, None).updater()
+            self.assertNotIn("Error", result)
+            self.assertTrue(is_segmented(encoded))  # patch_png rewrites the pixel data in segments
+            clear_cache()
+            self.assertEqual(Decoding(encoded, self.key).decoder()[1], text)
+
+    def test_patch_png_needs_the_tag(self):
+        img = self.rng.integers(0, 256, (300, 120, 3), dtype=np.uint8)
+        tagged = self.path('tagged.png')
+        write_png_segments(tagged, img, 2)
+        with open(tagged, 'rb') as source:
+            data = source.read()
+        position = data.index(SEGMENT_CHUNK) - 4  # the chunk length in front of its type
+        untagged = self.path('untagged.png')
+        with open(untagged, 'wb') as target:
+            target.write(data[:position] + data[position + 12:])  # the same stream, without the empty chunk
+
+        def edit(top, band):
+            band[:] = 7
+
+        expected = img.copy()
+        expected[:segment_rows_for(120, 3)] = 7  # edit is given the whole first segment
+        for source, spliced in ((tagged, True), (untagged, False)):
+            self.assertEqual(patch_png(source, self.path('patched.png'), [(0, 0)], edit), spliced)
+            self.assertTrue(np.array_equal(cv2.imread(self.path('patched.png')), expected))
+            self.assertTrue(is_segmented(self.path('patched.png')))
+
+
+if __name__ == '__main__':
+    unittest.main()
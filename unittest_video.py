@@ -0,0 +1,75 @@
+import argparse
+import contextlib
+import io
+import os
+import unittest
+
+from cryptography.fernet import Fernet
+
+from Header import VIDEO_SIZE, pack_header, pack_video_header, unpack_header, unpack_video_header
+from Video import decode_video, encode_video, video_decode_command, video_encode_command
+from unittest_support import TemporaryDirectoryTest, corrupt
+
+
+class TestVideoHeader(unittest.TestCase):
+
+    def test_video_header(self):
+        data = pack_video_header(12, 300, 987654, 0x05)
+        self.assertEqual(len(data), VIDEO_SIZE)
+        self.assertEqual(tuple(unpack_video_header(data)), (0x05, 12, 300, 987654))
+        self.assertIsNone(unpack_video_header(corrupt(data, 8)))
+        self.assertIsNone(unpack_header(data))  # never mistaken for an image header
+        self.assertIsNone(unpack_video_header(pack_header(12, 300, 987654, 0x05)))
+
+
+class TestVideo(TemporaryDirectoryTest):
+    """
+    Payloads hidden in directories of frames.
+    """
+
+    def frames(self, name, shape, count=4):
+        os.mkdir(self.path(name))
+        for index in range(count):
+            self.random_image(os.path.join(name, f'frame{index:03d}.png'), shape)
+        return self.path(name)
+
+    def test_round_trip(self):
+        source = self.frames('frames', (40, 50, 3))
+        payload = os.urandom(3500)
+        header = encode_video(source, self.path('encoded'), self.key, io.BytesIO(payload), len(payload), 2, 1)
+        self.assertEqual((header.start_frame, header.frames), (1, 3))
+        output = io.BytesIO()
+        decode_video(self.path('encoded'), self.key, output)
+        self.assertEqual(output.getvalue(), payload)
+
+    def test_bad_layouts(self):
+        source = self.frames('narrow', (40, 12, 3))
+        with self.assertRaisesRegex(ValueError, "to hold the header"):
+            encode_video(source, self.path('encoded'), self.key, io.BytesIO(b'payload'), 7)
+        self.assertFalse(os.path.exists(self.path('encoded')))
+        with self.assertRaisesRegex(ValueError, "negative"):
+            encode_video(self.frames('frames', (40, 50, 3)), self.path('encoded'), self.key, io.BytesIO(b'x'), 1,
+                         start_frame=-1)
+
+    def test_commands_clean_up(self):
+        source = self.frames('frames', (40, 50, 3), 2)
+        args = argparse.Namespace(source=source, output=self.path('encoded'), key=self.key, message=None,
+                                  message_file=None, payload_file=None, density=1, start_frame=0)
+        with contextlib.redirect_stderr(io.StringIO()):
+            args.message = 'x' * 100000  # more than the frames hold
+            self.assertEqual(video_encode_command(args), 1)
+            self.assertFalse(os.path.exists(self.path('encoded')))
+            args.message = 'hello'
+            self.assertEqual(video_encode_command(args), 0)
+            wrong = argparse.Namespace(source=self.path('encoded'), key=Fernet.generate_key().decode(),
+                                       output=self.path('payload'))
+            self.assertEqual(video_decode_command(wrong), 1)
+            self.assertFalse(os.path.exists(self.path('payload')))  # no unauthenticated payload left behind
+            self.assertEqual(video_decode_command(argparse.Namespace(source=self.path('encoded'), key=self.key,
+                                                                     output=self.path('payload'))), 0)
+        with open(self.path('payload'), 'rb') as payload:
+            self.assertEqual(payload.read(), b'hello')
+
+
+if __name__ == '__main__':
+    unittest.main()